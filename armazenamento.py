@@ -0,0 +1,684 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Sem fcntl (Windows) a trava de escrita vale só dentro do processo
+    fcntl = None
+
+# Backend de armazenamento: 'json' (arquivos .json, opcionalmente com diário) ou 'sqlite'
+BACKEND = os.environ.get('PRECIFICACAO_ARMAZENAMENTO', 'json')
+CAMINHO_BANCO = os.environ.get('PRECIFICACAO_BANCO', 'precificacao.db')
+# Formato das colunas de BOM no JSON: 'aninhado' grava objetos JSON; 'legado' grava strings JSON (formato antigo)
+FORMATO_BOM = os.environ.get('PRECIFICACAO_FORMATO_BOM', 'aninhado')
+# Modo de persistência do backend JSON: 'diario' anexa cada alteração a um diário; 'completo' reescreve o JSON inteiro
+MODO_PERSISTENCIA = os.environ.get('PRECIFICACAO_PERSISTENCIA', 'diario')
+
+# Descrição de cada entidade, compartilhada pelos backends
+class Esquema:
+    def __init__(self, tabela, arquivo, colunas, coluna_nome, colunas_float=(), colunas_bom=None, coluna_historico=None):
+        self.tabela = tabela
+        self.arquivo = arquivo
+        self.colunas = list(colunas)
+        self.coluna_nome = coluna_nome
+        self.colunas_float = list(colunas_float)
+        # Coluna de dicionários componente -> quantidade e a tabela normalizada que a guarda no SQLite
+        self.colunas_bom = colunas_bom or {}
+        # Coluna de valor cujas alterações ficam no histórico com data de vigência
+        self.coluna_historico = coluna_historico
+
+    def vazio(self):
+        return pd.DataFrame(columns=self.colunas + ['ID'])
+
+ESQUEMAS = {
+    'maos_de_obra': Esquema('maos_de_obra', 'maos_de_obra.json', ['Nome', 'Custo_Hora'], 'Nome', ['Custo_Hora'],
+                            coluna_historico='Custo_Hora'),
+    'materias_primas': Esquema('materias_primas', 'materias_primas.json', ['Nome', 'Custo_Unidade'], 'Nome', ['Custo_Unidade'],
+                               coluna_historico='Custo_Unidade'),
+    'impostos': Esquema('impostos', 'impostos.json', ['Estado', 'Percentual'], 'Estado', ['Percentual'],
+                        coluna_historico='Percentual'),
+    # Produtos podem usar outros produtos como subconjuntos (coluna Produtos)
+    'produtos': Esquema('produtos', 'produtos.json', ['Nome', 'Maos_de_Obra', 'Materias_Primas', 'Produtos'], 'Nome',
+                        colunas_bom={'Maos_de_Obra': 'produto_mao_de_obra', 'Materias_Primas': 'produto_materia_prima',
+                                     'Produtos': 'produto_subproduto'}),
+}
+
+def substituir_arquivo(caminho, conteudo):
+    # Escreve num arquivo temporário e troca com os.replace, que é atômico
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(conteudo)
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+def _stat(caminho):
+    try:
+        return os.stat(caminho)
+    except FileNotFoundError:
+        return None
+
+def travar_arquivo(caminho):
+    arquivo = open(caminho, 'a')
+    if fcntl is not None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+    return arquivo
+
+def destravar_arquivo(arquivo):
+    if fcntl is not None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+    arquivo.close()
+
+def novo_id(data):
+    # Microssegundos desde a época, sempre acima do maior id existente: os ids crescem na ordem de
+    # inserção e o de uma linha removida nunca é reaproveitado, como aconteceria com max(id) + 1
+    maior = int(data['ID'].max()) if len(data) else 0
+    return max(time.time_ns() // 1000, maior + 1)
+
+def historico_vazio():
+    return pd.DataFrame({'id': pd.Series(dtype='int64'), 'vigencia': pd.Series(dtype=float), 'valor': pd.Series(dtype=float),
+                         'nome': pd.Series(dtype=object)})
+
+def _posicao(data, argumentos):
+    # Diários anteriores aos ids estáveis identificam a linha pela posição
+    if 'id' not in argumentos:
+        return argumentos['index']
+    return data.index[data['ID'] == argumentos['id']][0]
+
+def _argumento(esquema, argumentos, coluna):
+    # Alterações gravadas antes de existir uma coluna de BOM não a trazem: BOM vazia
+    if coluna in esquema.colunas_bom:
+        return argumentos.get(coluna.lower()) or {}
+    return argumentos[coluna.lower()]
+
+def renomear_componente(bom, nome_antigo, nome_novo):
+    # Mesmo resultado de Composicoes.renomear: o item fica na posição do primeiro dos dois nomes
+    renomeada = {}
+    for nome, quantidade in bom.items():
+        nome = nome_novo if nome == nome_antigo else nome
+        renomeada[nome] = renomeada.get(nome, 0) + quantidade
+    return renomeada
+
+def aplicar_alteracao(data, esquema, operacao, argumentos):
+    # Os argumentos das alterações usam o nome da coluna em minúsculas (nome, custo_hora, ...)
+    if operacao == 'adicionar':
+        novo_registro = pd.DataFrame({coluna: [_argumento(esquema, argumentos, coluna)] for coluna in esquema.colunas})
+        # Sem id no diário antigo, max + 1 mantém a reprodução determinística entre processos
+        novo_registro['ID'] = argumentos['id'] if 'id' in argumentos else (int(data['ID'].max()) + 1 if len(data) else 1)
+        return pd.concat([data, novo_registro], ignore_index=True)
+    if operacao == 'atualizar':
+        posicao = _posicao(data, argumentos)
+        for coluna in esquema.colunas:
+            data.at[posicao, coluna] = _argumento(esquema, argumentos, coluna)
+        return data
+    if operacao == 'remover':
+        return data.drop(_posicao(data, argumentos)).reset_index(drop=True)
+    if operacao == 'renomear_componente':
+        coluna, nome_antigo, nome_novo = argumentos['coluna'], argumentos['nome_antigo'], argumentos['nome_novo']
+        data[coluna] = [renomear_componente(bom, nome_antigo, nome_novo) if nome_antigo in bom else bom for bom in data[coluna]]
+        return data
+    raise ValueError(f'Operação desconhecida: {operacao}')
+
+# Diário de alterações anexadas a um snapshot JSON
+class DiarioDeAlteracoes:
+    def __init__(self, caminho_snapshot, limite_registros=500, limite_bytes=1024 * 1024, intervalo=600):
+        self.caminho_snapshot = caminho_snapshot
+        self.caminho = f'{caminho_snapshot}.diario'
+        self.limite_registros = limite_registros
+        self.limite_bytes = limite_bytes
+        self.intervalo = intervalo
+        self.registros = 0
+        self.criado_em = time.time()
+        self.hash_snapshot = None
+
+    def _calcular_hash_snapshot(self):
+        if not os.path.exists(self.caminho_snapshot):
+            return None
+        with open(self.caminho_snapshot, 'rb') as arquivo:
+            return hashlib.sha1(arquivo.read()).hexdigest()
+
+    def ler(self):
+        # Leitura sem trava, que nunca altera o arquivo: uma última linha incompleta é de uma
+        # gravação em andamento (ou interrompida) e fica de fora. Devolve o hash do snapshot
+        # sobre o qual o diário foi escrito e as alterações.
+        try:
+            with open(self.caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+        except FileNotFoundError:
+            return None, []
+        # Só b'\n' separa linhas: splitlines também quebraria em U+2028, U+2029 e NEL, que o
+        # json.dumps com ensure_ascii=False grava sem escapar
+        linhas = conteudo[:conteudo.rfind(b'\n') + 1].split(b'\n')[:-1]
+        try:
+            cabecalho = json.loads(linhas[0])
+        except (IndexError, json.JSONDecodeError):
+            return None, []
+        return cabecalho.get('snapshot'), [json.loads(linha) for linha in linhas[1:]]
+
+    def preparar(self):
+        # Chamado pelo escritor, com a trava: descarta a linha incompleta de uma gravação
+        # interrompida, reinicia um diário que não confere com o snapshot (compactação
+        # interrompida; as alterações já estão no snapshot) e retoma a contagem de registros,
+        # que muda com as gravações de outros processos
+        hash_snapshot = self._calcular_hash_snapshot()
+        if not os.path.exists(self.caminho):
+            # Criado só na primeira alteração: criá-lo aqui mudaria a assinatura e faria quem acabou
+            # de carregar os dados recarregá-los sem necessidade
+            self.hash_snapshot = hash_snapshot
+            self.criado_em = time.time()
+            self.registros = 0
+            return
+        with open(self.caminho, 'rb+') as arquivo:
+            conteudo = arquivo.read()
+            if not conteudo.endswith(b'\n'):
+                conteudo = conteudo[:conteudo.rfind(b'\n') + 1]
+                arquivo.truncate(len(conteudo))
+        linhas = conteudo.split(b'\n')[:-1]
+        try:
+            cabecalho = json.loads(linhas[0])
+        except (IndexError, json.JSONDecodeError):
+            cabecalho = {}
+        if cabecalho.get('snapshot') != hash_snapshot:
+            self._reiniciar(hash_snapshot)
+            return
+        self.hash_snapshot = hash_snapshot
+        self.criado_em = cabecalho.get('criado_em', time.time())
+        self.registros = len(linhas) - 1
+
+    def _reiniciar(self, hash_snapshot=None):
+        self.hash_snapshot = hash_snapshot or self._calcular_hash_snapshot()
+        self.criado_em = time.time()
+        self.registros = 0
+        cabecalho = json.dumps({'snapshot': self.hash_snapshot, 'criado_em': self.criado_em})
+        substituir_arquivo(self.caminho, cabecalho + '\n')
+
+    def precisa_compactar(self):
+        return (self.registros >= self.limite_registros
+                or os.path.getsize(self.caminho) >= self.limite_bytes
+                or time.time() - self.criado_em >= self.intervalo)
+
+    def anexar(self, operacao, argumentos):
+        if not os.path.exists(self.caminho):
+            self._reiniciar()
+        linha = json.dumps({'op': operacao, 'args': argumentos}, ensure_ascii=False, separators=(',', ':'))
+        with open(self.caminho, 'a', encoding='utf-8') as arquivo:
+            arquivo.write(linha + '\n')
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        self.registros += 1
+
+    def compactar(self, salvar):
+        salvar()
+        self._reiniciar()
+
+class ArmazenamentoJSON:
+    def __init__(self, esquema, caminho=None, modo=None, formato_bom=None):
+        self.esquema = esquema
+        self.caminho = caminho or esquema.arquivo
+        self.formato_bom = formato_bom or FORMATO_BOM
+        modo = modo or MODO_PERSISTENCIA
+        self.diario = DiarioDeAlteracoes(self.caminho) if modo == 'diario' else None
+        self.trava = threading.RLock()
+        self.bloqueios = 0
+        self.arquivo_trava = None
+        # Assinatura deixada pela nossa última gravação; se mudou, outro processo gravou depois
+        self.assinatura_escrita = None
+
+    def assinatura(self):
+        # Muda sempre que o snapshot ou o diário são alterados, inclusive por outro processo
+        arquivos = [self.caminho] + ([self.diario.caminho] if self.diario is not None else [])
+        return tuple(
+            (estado.st_mtime_ns, estado.st_size) if (estado := _stat(arquivo)) is not None else None
+            for arquivo in arquivos
+        )
+
+    @contextlib.contextmanager
+    def bloquear(self):
+        # Trava consultiva de escrita entre processos; os leitores não a usam e nunca esperam
+        with self.trava:
+            if self.bloqueios == 0:
+                self.arquivo_trava = travar_arquivo(f'{self.caminho}.trava')
+                if self.diario is not None and self.assinatura() != self.assinatura_escrita:
+                    self.diario.preparar()
+            self.bloqueios += 1
+            try:
+                yield
+            finally:
+                self.bloqueios -= 1
+                if self.bloqueios == 0:
+                    self.assinatura_escrita = self.assinatura()
+                    destravar_arquivo(self.arquivo_trava)
+
+    def carregar(self):
+        # O diário é lido antes do snapshot. A compactação troca o snapshot antes de reiniciar o
+        # diário, então um diário antigo lido junto com o snapshot novo não confere com o hash e
+        # é ignorado, pois suas alterações já estão no snapshot.
+        assinatura = self.assinatura()
+        hash_diario, alteracoes = self.diario.ler() if self.diario is not None else (None, [])
+        try:
+            with open(self.caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+        except FileNotFoundError:
+            conteudo = None
+        if conteudo is not None:
+            data = pd.read_json(io.StringIO(conteudo.decode('utf-8')), precise_float=True)
+            if data.empty:
+                data = self.esquema.vazio()
+            for coluna in self.esquema.colunas_float:
+                data[coluna] = data[coluna].astype(float)
+            # No formato aninhado o read_json já devolve dicionários; só o formato legado, com
+            # strings JSON dentro do JSON, precisa de um json.loads por linha
+            for coluna in self.esquema.colunas_bom:
+                if coluna not in data.columns:
+                    # Arquivo anterior à coluna: BOM vazia em todas as linhas
+                    data[coluna] = [{} for _ in range(len(data))]
+                elif not data.empty and isinstance(data[coluna].iat[0], str):
+                    data[coluna] = data[coluna].apply(json.loads)
+            if 'ID' not in data.columns:
+                # Arquivos anteriores aos ids estáveis: ids pela ordem, iguais em todos os processos
+                data['ID'] = range(1, len(data) + 1)
+        else:
+            data = self.esquema.vazio()
+        data['ID'] = data['ID'].astype('int64')
+        if alteracoes and hash_diario == (hashlib.sha1(conteudo).hexdigest() if conteudo is not None else None):
+            for alteracao in alteracoes:
+                data = aplicar_alteracao(data, self.esquema, alteracao['op'], alteracao['args'])
+        # Uma loja sem gravações desde a implantação ainda não tem o cache de contar(). Ele leva a
+        # assinatura de antes da leitura: se outro processo gravou no meio, o cache já nasce
+        # vencido e contar() devolve None
+        if self.contar() is None and self.assinatura() == assinatura:
+            self._gravar_contagem(len(data), assinatura)
+        return data
+
+    def _gravar_contagem(self, total, assinatura=None):
+        # Cache do total de linhas para contar() sem ler o snapshot, gravado junto com as
+        # gravações (com a trava de escrita) e nas cargas. Sem fsync: se perder ou corromper o
+        # arquivo, só obriga a carregar de novo
+        temporario = f'{self.caminho}.contagem.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temporario, 'w', encoding='utf-8') as arquivo:
+                json.dump({'assinatura': assinatura or self.assinatura(), 'total': total}, arquivo)
+            os.replace(temporario, f'{self.caminho}.contagem')
+        except OSError:
+            pass
+
+    def contar(self):
+        # Total gravado na última carga, se nada mudou desde então; None quando é preciso carregar
+        try:
+            with open(f'{self.caminho}.contagem', encoding='utf-8') as arquivo:
+                contagem = json.load(arquivo)
+            assinatura = tuple(tuple(item) if item is not None else None for item in contagem['assinatura'])
+            total = int(contagem['total'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return total if assinatura == self.assinatura() else None
+
+    def salvar(self, data):
+        with self.bloquear():
+            self._salvar(data)
+            self._gravar_contagem(len(data))
+
+    def _salvar(self, data):
+        if self.esquema.colunas_bom:
+            if self.formato_bom == 'legado':
+                data = data.copy()
+                for coluna in self.esquema.colunas_bom:
+                    data[coluna] = data[coluna].apply(json.dumps)
+            else:
+                # O json da biblioteca padrão preserva as quantidades exatamente; o to_json do
+                # pandas arredonda floats aninhados em 10 casas
+                substituir_arquivo(self.caminho, json.dumps(data.to_dict('records'), indent=4))
+                return
+        substituir_arquivo(self.caminho, data.to_json(orient='records', indent=4))
+
+    def registrar(self, operacao, argumentos, exportar, total=None):
+        # exportar() devolve o DataFrame completo; só é chamado quando o snapshot é regravado.
+        # total (linhas depois da alteração) atualiza o cache de contar()
+        with self.bloquear():
+            if self.diario is None:
+                self.salvar(exportar())
+                return
+            self.diario.anexar(operacao, argumentos)
+            if self.diario.precisa_compactar():
+                self.diario.compactar(lambda: self.salvar(exportar()))
+            if total is not None:
+                self._gravar_contagem(total)
+
+    def importar(self, novos, exportar):
+        # Importação em lote: um único snapshot com todas as linhas, que também zera o diário
+        with self.bloquear():
+            if self.diario is None:
+                self.salvar(exportar())
+            else:
+                self.diario.compactar(lambda: self.salvar(exportar()))
+
+    def carregar_historico(self):
+        # CSV só de anexação (id,vigencia,valor,nome); a linha incompleta de uma gravação interrompida é
+        # ignorada. Linhas sem nome são de antes do nome entrar no histórico.
+        try:
+            with open(f'{self.caminho}.historico', 'rb') as arquivo:
+                conteudo = arquivo.read()
+        except FileNotFoundError:
+            return historico_vazio()
+        conteudo = conteudo[:conteudo.rfind(b'\n') + 1]
+        if not conteudo:
+            return historico_vazio()
+        return pd.read_csv(io.BytesIO(conteudo), header=None, names=['id', 'vigencia', 'valor', 'nome'],
+                           dtype={'id': 'int64', 'vigencia': float, 'valor': float, 'nome': object},
+                           keep_default_na=False, na_values={'valor': ['nan']})
+
+    def registrar_historico(self, registros, substituir=False):
+        if not registros and not substituir:
+            return
+        saida = io.StringIO()
+        csv.writer(saida, lineterminator='\n').writerows(
+            (id_, repr(float(vigencia)), repr(float(valor)), nome or '') for id_, vigencia, valor, nome in registros
+        )
+        linhas = saida.getvalue().encode('utf-8')
+        with self.bloquear(), open(f'{self.caminho}.historico', 'a+b') as arquivo:
+            arquivo.seek(0)
+            conteudo = b'' if substituir else arquivo.read()
+            arquivo.truncate(conteudo.rfind(b'\n') + 1)
+            arquivo.write(linhas)
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+
+class ArmazenamentoSQLite:
+    def __init__(self, esquema, caminho=None):
+        self.esquema = esquema
+        self.caminho = caminho or CAMINHO_BANCO
+        self.conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        self.conexao.execute('PRAGMA foreign_keys = ON')
+        self.conexao.execute('PRAGMA journal_mode = WAL')
+        self.trava = threading.RLock()
+        self.bloqueios = 0
+        criar_tabelas(self.conexao)
+
+    def assinatura(self):
+        # data_version só muda quando outra conexão grava no banco
+        return self.conexao.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextlib.contextmanager
+    def bloquear(self):
+        # BEGIN IMMEDIATE reserva a escrita no banco; no modo WAL os leitores continuam lendo. Só o
+        # bloqueio mais externo faz commit ou rollback: tudo o que a entidade grava dentro dele
+        # (linha e histórico) é uma única transação, sem brecha para outro escritor
+        with self.trava:
+            if self.bloqueios == 0:
+                self.conexao.execute('BEGIN IMMEDIATE')
+            self.bloqueios += 1
+            try:
+                yield
+            except BaseException:
+                if self.bloqueios == 1 and self.conexao.in_transaction:
+                    self.conexao.rollback()
+                raise
+            finally:
+                self.bloqueios -= 1
+                if self.bloqueios == 0 and self.conexao.in_transaction:
+                    self.conexao.commit()
+
+    def contar(self):
+        with self.trava:
+            return self.conexao.execute(f'SELECT COUNT(*) FROM {self.esquema.tabela}').fetchone()[0]
+
+    def _colunas_escalares(self):
+        return [coluna for coluna in self.esquema.colunas if coluna not in self.esquema.colunas_bom]
+
+    def carregar(self):
+        # Uma transação de leitura vê um instantâneo consistente e, no modo WAL, não espera escritores
+        transacao = not self.conexao.in_transaction
+        if transacao:
+            self.conexao.execute('BEGIN')
+        try:
+            return self._carregar()
+        finally:
+            if transacao:
+                self.conexao.commit()
+
+    def _carregar(self):
+        colunas = self._colunas_escalares()
+        data = pd.read_sql_query(
+            f'SELECT id AS ID, {", ".join(colunas)} FROM {self.esquema.tabela} ORDER BY id', self.conexao
+        )
+        for coluna in self.esquema.colunas_float:
+            data[coluna] = data[coluna].astype(float)
+        for coluna, tabela in self.esquema.colunas_bom.items():
+            boms = {id_: {} for id_ in data['ID']}
+            linhas = self.conexao.execute(
+                f'SELECT produto_id, componente, quantidade FROM {tabela} ORDER BY produto_id, posicao'
+            )
+            for produto_id, componente, quantidade in linhas:
+                boms[produto_id][componente] = quantidade
+            data[coluna] = [boms[id_] for id_ in data['ID']]
+        if data.empty:
+            data = self.esquema.vazio()
+        data = data[self.esquema.colunas + ['ID']]
+        data['ID'] = data['ID'].astype('int64')
+        return data
+
+    def _inserir_bom(self, produto_id, registro):
+        for coluna, tabela in self.esquema.colunas_bom.items():
+            self.conexao.executemany(
+                f'INSERT INTO {tabela} (produto_id, posicao, componente, quantidade) VALUES (?, ?, ?, ?)',
+                [(produto_id, posicao, componente, float(quantidade))
+                 for posicao, (componente, quantidade) in enumerate((registro[coluna] or {}).items())]
+            )
+
+    def _inserir(self, registro):
+        colunas = self._colunas_escalares()
+        self.conexao.execute(
+            f'INSERT INTO {self.esquema.tabela} (id, {", ".join(colunas)}) VALUES ({", ".join("?" * (len(colunas) + 1))})',
+            [int(registro['ID'])] + [registro[coluna] for coluna in colunas]
+        )
+        self._inserir_bom(int(registro['ID']), registro)
+
+    def salvar(self, data):
+        with self.bloquear():
+            self.conexao.execute(f'DELETE FROM {self.esquema.tabela}')
+            for registro in data.to_dict('records'):
+                self._inserir(registro)
+
+    def _renomear_componente(self, coluna, nome_antigo, nome_novo):
+        tabela = self.esquema.colunas_bom[coluna]
+        linhas = self.conexao.execute(
+            f'SELECT produto_id, componente, quantidade FROM {tabela} '
+            f'WHERE produto_id IN (SELECT produto_id FROM {tabela} WHERE componente = ?) ORDER BY produto_id, posicao',
+            (nome_antigo,)
+        ).fetchall()
+        boms = {}
+        for produto_id, componente, quantidade in linhas:
+            boms.setdefault(produto_id, {})[componente] = quantidade
+        self.conexao.executemany(f'DELETE FROM {tabela} WHERE produto_id = ?', [(produto_id,) for produto_id in boms])
+        self.conexao.executemany(
+            f'INSERT INTO {tabela} (produto_id, posicao, componente, quantidade) VALUES (?, ?, ?, ?)',
+            [(produto_id, posicao, componente, float(quantidade))
+             for produto_id, bom in boms.items()
+             for posicao, (componente, quantidade) in enumerate(renomear_componente(bom, nome_antigo, nome_novo).items())]
+        )
+
+    def registrar(self, operacao, argumentos, exportar, total=None):
+        if operacao == 'renomear_componente':
+            with self.bloquear():
+                self._renomear_componente(argumentos['coluna'], argumentos['nome_antigo'], argumentos['nome_novo'])
+            return
+        registro = {coluna: argumentos.get(coluna.lower()) for coluna in self.esquema.colunas}
+        registro['ID'] = id_ = argumentos['id']
+        with self.bloquear():
+            if operacao == 'adicionar':
+                self._inserir(registro)
+            elif operacao == 'atualizar':
+                colunas = self._colunas_escalares()
+                self.conexao.execute(
+                    f'UPDATE {self.esquema.tabela} SET {", ".join(f"{coluna} = ?" for coluna in colunas)} WHERE id = ?',
+                    [registro[coluna] for coluna in colunas] + [id_]
+                )
+                for tabela in self.esquema.colunas_bom.values():
+                    self.conexao.execute(f'DELETE FROM {tabela} WHERE produto_id = ?', (id_,))
+                self._inserir_bom(id_, registro)
+            elif operacao == 'remover':
+                self.conexao.execute(f'DELETE FROM {self.esquema.tabela} WHERE id = ?', (id_,))
+            else:
+                raise ValueError(f'Operação desconhecida: {operacao}')
+
+    def importar(self, novos, exportar):
+        with self.bloquear():
+            for registro in novos.to_dict('records'):
+                self._inserir(registro)
+
+    def carregar_historico(self):
+        historico = pd.read_sql_query(f'SELECT id, vigencia, valor, nome FROM historico_{self.esquema.tabela} ORDER BY rowid', self.conexao)
+        return historico.astype({'id': 'int64', 'vigencia': float, 'valor': float, 'nome': object})
+
+    def registrar_historico(self, registros, substituir=False):
+        with self.bloquear():
+            if substituir:
+                self.conexao.execute(f'DELETE FROM historico_{self.esquema.tabela}')
+            self.conexao.executemany(
+                f'INSERT INTO historico_{self.esquema.tabela} (id, vigencia, valor, nome) VALUES (?, ?, ?, ?)',
+                [(id_, vigencia, None if math.isnan(valor) else valor, nome) for id_, vigencia, valor, nome in registros]
+            )
+
+def criar_tabelas(conexao):
+    conexao.executescript('''
+        CREATE TABLE IF NOT EXISTS maos_de_obra (id INTEGER PRIMARY KEY, Nome TEXT NOT NULL, Custo_Hora REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_maos_de_obra_nome ON maos_de_obra (Nome);
+        CREATE TABLE IF NOT EXISTS materias_primas (id INTEGER PRIMARY KEY, Nome TEXT NOT NULL, Custo_Unidade REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_materias_primas_nome ON materias_primas (Nome);
+        CREATE TABLE IF NOT EXISTS impostos (id INTEGER PRIMARY KEY, Estado TEXT NOT NULL, Percentual REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_impostos_estado ON impostos (Estado);
+        CREATE TABLE IF NOT EXISTS produtos (id INTEGER PRIMARY KEY, Nome TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_produtos_nome ON produtos (Nome);
+        CREATE TABLE IF NOT EXISTS produto_mao_de_obra (
+            produto_id INTEGER NOT NULL REFERENCES produtos (id) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL,
+            componente TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            PRIMARY KEY (produto_id, posicao)
+        );
+        CREATE INDEX IF NOT EXISTS idx_produto_mao_de_obra_componente ON produto_mao_de_obra (componente);
+        CREATE TABLE IF NOT EXISTS produto_materia_prima (
+            produto_id INTEGER NOT NULL REFERENCES produtos (id) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL,
+            componente TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            PRIMARY KEY (produto_id, posicao)
+        );
+        CREATE INDEX IF NOT EXISTS idx_produto_materia_prima_componente ON produto_materia_prima (componente);
+        CREATE TABLE IF NOT EXISTS produto_subproduto (
+            produto_id INTEGER NOT NULL REFERENCES produtos (id) ON DELETE CASCADE,
+            posicao INTEGER NOT NULL,
+            componente TEXT NOT NULL,
+            quantidade REAL NOT NULL,
+            PRIMARY KEY (produto_id, posicao)
+        );
+        CREATE INDEX IF NOT EXISTS idx_produto_subproduto_componente ON produto_subproduto (componente);
+    ''')
+    # Sem chave estrangeira: o histórico de uma linha removida continua valendo para datas passadas.
+    # A remoção grava valor nulo, com o nome da linha.
+    for esquema in ESQUEMAS.values():
+        if esquema.coluna_historico:
+            tabela = f'historico_{esquema.tabela}'
+            colunas = [linha[1] for linha in conexao.execute(f'PRAGMA table_info({tabela})')]
+            if colunas and 'nome' not in colunas:
+                # Tabelas anteriores ao nome no histórico tinham valor NOT NULL
+                with conexao:
+                    conexao.execute(f'DROP INDEX IF EXISTS idx_{tabela}')
+                    conexao.execute(f'ALTER TABLE {tabela} RENAME TO {tabela}_antigo')
+                    conexao.execute(f'CREATE TABLE {tabela} (id INTEGER NOT NULL, vigencia REAL NOT NULL, valor REAL, nome TEXT)')
+                    conexao.execute(f'INSERT INTO {tabela} (id, vigencia, valor) SELECT id, vigencia, valor FROM {tabela}_antigo ORDER BY rowid')
+                    conexao.execute(f'DROP TABLE {tabela}_antigo')
+            conexao.executescript(f'''
+                CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER NOT NULL, vigencia REAL NOT NULL, valor REAL, nome TEXT);
+                CREATE INDEX IF NOT EXISTS idx_{tabela} ON {tabela} (id, vigencia);
+            ''')
+
+def consultar_custos(conexao):
+    # Custos atuais de todos os produtos calculados no próprio SQLite, com os mesmos resultados do
+    # motor de precificação: em nomes duplicados vale o menor id, um componente ou subconjunto sem
+    # cadastro deixa o custo nulo e produtos em ciclo (ou que dependem de um) ficam sem custo.
+    # A CTE recursiva expande cada produto pelos subconjuntos, multiplicando as quantidades ao longo
+    # do caminho; o caminho percorrido detecta os ciclos e encerra a recursão.
+    def primeiros(tabela, coluna_custo):
+        return f'SELECT Nome, {coluna_custo} AS custo FROM {tabela} WHERE id IN (SELECT MIN(id) FROM {tabela} GROUP BY Nome)'
+
+    def diretos(tabela_bom, tabela_custo, coluna_custo):
+        return f'''
+            SELECT b.produto_id,
+                   CASE WHEN COUNT(c.custo) < COUNT(*) THEN NULL ELSE SUM(c.custo * b.quantidade) END AS custo
+            FROM {tabela_bom} b LEFT JOIN ({primeiros(tabela_custo, coluna_custo)}) c ON c.Nome = b.componente
+            GROUP BY b.produto_id
+        '''
+
+    def acumulado(alias):
+        # Nulo se algum produto da árvore tem custo direto nulo; produtos sem BOM dessa coluna somam 0
+        return (f'CASE WHEN MAX(a.invalido) = 1 OR COUNT({alias}.produto_id) > COUNT({alias}.custo) THEN NULL '
+                f'ELSE TOTAL(a.fator * COALESCE({alias}.custo, 0.0)) END')
+
+    return pd.read_sql_query(f'''
+        WITH RECURSIVE
+            arvore(raiz, produto_id, fator, caminho, invalido) AS (
+                SELECT id, id, 1.0, ',' || id || ',', 0 FROM produtos
+                UNION ALL
+                SELECT a.raiz, p.id, a.fator * s.quantidade, a.caminho || p.id || ',',
+                       -- Subconjunto sem cadastro ou já visitado neste caminho (ciclo)
+                       CASE WHEN p.id IS NULL OR instr(a.caminho, ',' || p.id || ',') > 0 THEN 1 ELSE 0 END
+                FROM arvore a
+                JOIN produto_subproduto s ON s.produto_id = a.produto_id
+                LEFT JOIN (SELECT Nome, MIN(id) AS id FROM produtos GROUP BY Nome) p ON p.Nome = s.componente
+                WHERE a.invalido = 0
+            ),
+            mo AS ({diretos('produto_mao_de_obra', 'maos_de_obra', 'Custo_Hora')}),
+            mp AS ({diretos('produto_materia_prima', 'materias_primas', 'Custo_Unidade')}),
+            custos AS (
+                SELECT a.raiz, {acumulado('mo')} AS mao_de_obra, {acumulado('mp')} AS materias_primas
+                FROM arvore a
+                LEFT JOIN mo ON mo.produto_id = a.produto_id
+                LEFT JOIN mp ON mp.produto_id = a.produto_id
+                GROUP BY a.raiz
+            )
+        SELECT p.Nome AS Produto, c.mao_de_obra AS Custo_Mao_de_Obra, c.materias_primas AS Custo_Materias_Primas,
+               c.mao_de_obra + c.materias_primas AS Custo_Total
+        FROM produtos p JOIN custos c ON c.raiz = p.id
+        ORDER BY p.id
+    ''', conexao).astype({'Custo_Mao_de_Obra': float, 'Custo_Materias_Primas': float, 'Custo_Total': float})
+
+def criar_armazenamento(esquema, caminho=None):
+    if BACKEND == 'sqlite':
+        return ArmazenamentoSQLite(esquema)
+    return ArmazenamentoJSON(esquema, caminho)
+
+def migrar(diretorio='.', banco=CAMINHO_BANCO):
+    # Copia os arquivos JSON (snapshot + diário + histórico) para o banco SQLite
+    totais = {}
+    for esquema in ESQUEMAS.values():
+        origem = ArmazenamentoJSON(esquema, os.path.join(diretorio, esquema.arquivo))
+        destino = ArmazenamentoSQLite(esquema, banco)
+        data = origem.carregar()
+        destino.salvar(data)
+        if esquema.coluna_historico:
+            destino.registrar_historico(list(origem.carregar_historico().itertuples(index=False, name=None)), substituir=True)
+        totais[esquema.tabela] = len(data)
+    return totais
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ferramentas de armazenamento da precificação')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    parser_migrar = subcomandos.add_parser('migrar', help='Migra os arquivos JSON para o banco SQLite')
+    parser_migrar.add_argument('--diretorio', default='.', help='Diretório com os arquivos JSON')
+    parser_migrar.add_argument('--banco', default=CAMINHO_BANCO, help='Caminho do banco SQLite')
+    argumentos = parser.parse_args()
+    if argumentos.comando == 'migrar':
+        for tabela, total in migrar(argumentos.diretorio, argumentos.banco).items():
+            print(f'{tabela}: {total} registros migrados')
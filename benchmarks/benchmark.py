@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from gerador import UFS, escrever_catalogo, gerar_catalogo
+from streamlit_app import ENTIDADES, Imposto, MaoDeObra, MateriaPrima, Produto, RepositorioCompartilhado
+from precificacao import MotorDePrecificacao
+
+ESCALAS = [1_000, 10_000, 100_000]
+# Entidades lidas por página no primeiro acesso; custos inclui produtos, mãos de obra e matérias-primas
+PAGINAS = {
+    'Impostos': ('imposto',),
+    'Mao_de_Obra': ('mao_de_obra',),
+    'Produtos': ('mao_de_obra', 'materia_prima', 'produto'),
+    'Calcular_Preco': ('imposto', 'custos')
+}
+
+def medir(funcao, repeticoes, preparar=None):
+    # Tempo medido sem tracemalloc; o pico de memória vem de uma execução separada
+    tempos = []
+    for _ in range(repeticoes):
+        argumento = preparar() if preparar else None
+        inicio = time.perf_counter()
+        funcao(argumento)
+        tempos.append(time.perf_counter() - inicio)
+    argumento = preparar() if preparar else None
+    tracemalloc.start()
+    funcao(argumento)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'min_s': min(tempos),
+        'mediana_s': statistics.median(tempos),
+        'max_s': max(tempos),
+        'pico_memoria_bytes': pico
+    }
+
+def benchmark_escala(produtos, repeticoes, semente, subprodutos=0.0):
+    diretorio = tempfile.mkdtemp(prefix='precificacao_bench_')
+    cwd = os.getcwd()
+    try:
+        escrever_catalogo(gerar_catalogo(produtos, semente, subprodutos=subprodutos), diretorio)
+        os.chdir(diretorio)
+        resultados = {}
+        classes = {'MaoDeObra': MaoDeObra, 'MateriaPrima': MateriaPrima, 'Imposto': Imposto, 'Produto': Produto}
+        entidades = {nome: classe() for nome, classe in classes.items()}
+        rng = np.random.default_rng(semente)
+
+        for nome, entidade in entidades.items():
+            resultados[f'{nome}.load_data'] = medir(lambda _: entidade.load_data(), repeticoes)
+            resultados[f'{nome}.save_data'] = medir(lambda _: entidade.save_data(), repeticoes)
+
+        argumentos = {
+            'MaoDeObra': lambda i: (f'Bench {i}', 20.0),
+            'MateriaPrima': lambda i: (f'Bench {i}', 1.5),
+            'Imposto': lambda i: (f'B{i}', 18.0),
+            'Produto': lambda i: (f'Bench {i}', {}, {}, {})
+        }
+        for nome, entidade in entidades.items():
+            contador = iter(range(10 ** 9))
+            resultados[f'{nome}.adicionar'] = medir(lambda _: entidade.adicionar(*argumentos[nome](next(contador))), repeticoes)
+            resultados[f'{nome}.atualizar'] = medir(
+                lambda index: entidade.atualizar(index, *argumentos[nome](next(contador))),
+                repeticoes,
+                preparar=lambda: int(rng.integers(len(entidade.data)))
+            )
+            resultados[f'{nome}.remover'] = medir(
+                lambda index: entidade.remover(index),
+                repeticoes,
+                preparar=lambda: int(rng.integers(len(entidade.data)))
+            )
+
+        # O repositório carrega as entidades no primeiro acesso: mede-se a carga de cada página,
+        # a contagem do Dashboard e a sincronização de uma reexecução com tudo carregado
+        for pagina, nomes in PAGINAS.items():
+            resultados[f'pagina.{pagina}.primeiro_acesso'] = medir(
+                lambda repositorio: [getattr(repositorio, nome) for nome in nomes], repeticoes, RepositorioCompartilhado)
+        resultados['RepositorioCompartilhado.contagem'] = medir(
+            lambda repositorio: [repositorio.contagem(nome) for nome in ('mao_de_obra', 'materia_prima', 'produto')],
+            repeticoes, RepositorioCompartilhado)
+        repositorio = RepositorioCompartilhado()
+        resultados['RepositorioCompartilhado.sincronizar'] = medir(lambda _: repositorio.sincronizar(ENTIDADES), repeticoes)
+        motor = MotorDePrecificacao(repositorio.mao_de_obra, repositorio.materia_prima, repositorio.imposto, repositorio.produto)
+        materializado = MotorDePrecificacao(repositorio.mao_de_obra, repositorio.materia_prima, repositorio.imposto,
+                                            repositorio.produto, repositorio.custos)
+
+        def precificar_produto(motor_usado, index):
+            custos = motor_usado.custos([index])
+            motor_usado.calcular(['SP'], [15.0], custos=custos)
+
+        sortear_produto = lambda: int(rng.integers(len(repositorio.produto.data)))
+        resultados['preco.produto'] = medir(lambda index: precificar_produto(motor, index), repeticoes, sortear_produto)
+        resultados['preco.produto_materializado'] = medir(
+            lambda index: precificar_produto(materializado, index), repeticoes, sortear_produto)
+        resultados['preco.catalogo'] = medir(lambda _: motor.calcular(margens=[0.0, 10.0, 20.0]), repeticoes)
+        resultados['preco.catalogo_materializado'] = medir(
+            lambda _: materializado.calcular(margens=[0.0, 10.0, 20.0]), repeticoes)
+        materia_prima = repositorio.materia_prima
+        resultados['custos.atualizar_materia_prima'] = medir(
+            lambda index: materia_prima.atualizar(index, materia_prima.data.at[index, 'Nome'], 2.0),
+            repeticoes,
+            preparar=lambda: int(rng.integers(len(materia_prima.data)))
+        )
+        return {
+            'produtos': produtos,
+            'subprodutos': subprodutos,
+            'maos_de_obra': len(repositorio.mao_de_obra.data),
+            'materias_primas': len(repositorio.materia_prima.data),
+            'estados': len(UFS),
+            'operacoes': resultados
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark das entidades e da precificação com catálogo sintético')
+    parser.add_argument('--escalas', type=int, nargs='+', default=ESCALAS, help='Quantidades de produtos')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--subprodutos', type=float, default=0.0, help='Fração dos produtos que usam outros produtos como subconjunto')
+    parser.add_argument('--saida', default='-', help='Arquivo JSON com os resultados (- para stdout)')
+    argumentos = parser.parse_args()
+    relatorio = {
+        'data': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'repeticoes': argumentos.repeticoes,
+        'semente': argumentos.semente,
+        'escalas': []
+    }
+    for escala in argumentos.escalas:
+        print(f'Escala {escala} produtos...', file=sys.stderr)
+        relatorio['escalas'].append(benchmark_escala(escala, argumentos.repeticoes, argumentos.semente,
+                                                            argumentos.subprodutos))
+    texto = json.dumps(relatorio, indent=2)
+    if argumentos.saida == '-':
+        print(texto)
+    else:
+        with open(argumentos.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto)
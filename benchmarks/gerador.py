@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from armazenamento import ESQUEMAS, ArmazenamentoJSON
+
+UFS = ['AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA',
+       'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO']
+ALIQUOTAS = [7.0, 12.0, 17.0, 18.0, 19.0, 20.0, 22.0]
+
+# Catálogo sintético e determinístico: a mesma semente gera sempre os mesmos dados
+def gerar_catalogo(produtos, semente=42, maos_de_obra=None, materias_primas=None, subprodutos=0.0):
+    rng = np.random.default_rng(semente)
+    maos_de_obra = maos_de_obra or max(10, produtos // 100)
+    materias_primas = materias_primas or max(20, produtos // 10)
+
+    nomes_mao_de_obra = [f'Mão de Obra {i:05d}' for i in range(maos_de_obra)]
+    nomes_materia_prima = [f'Matéria-Prima {i:06d}' for i in range(materias_primas)]
+    catalogo = {
+        'maos_de_obra': pd.DataFrame({
+            'Nome': nomes_mao_de_obra,
+            'Custo_Hora': rng.uniform(12, 80, maos_de_obra).round(2)
+        }),
+        'materias_primas': pd.DataFrame({
+            'Nome': nomes_materia_prima,
+            'Custo_Unidade': rng.uniform(0.1, 50, materias_primas).round(2)
+        }),
+        'impostos': pd.DataFrame({
+            'Estado': UFS,
+            'Percentual': rng.choice(ALIQUOTAS, len(UFS))
+        })
+    }
+
+    # BOMs de tamanho realista: 1 a 4 funções de mão de obra e 3 a 14 matérias-primas por produto
+    def bom(nomes, minimo, maximo, quantidade_maxima):
+        tamanho = min(int(rng.integers(minimo, maximo + 1)), len(nomes))
+        escolhidos = rng.choice(len(nomes), tamanho, replace=False)
+        quantidades = rng.uniform(0.05, quantidade_maxima, tamanho).round(2)
+        return {nomes[i]: float(quantidade) for i, quantidade in zip(escolhidos, quantidades)}
+
+    catalogo['produtos'] = pd.DataFrame({
+        'Nome': [f'Produto {i:07d}' for i in range(produtos)],
+        'Maos_de_Obra': [bom(nomes_mao_de_obra, 1, 4, 4) for _ in range(produtos)],
+        'Materias_Primas': [bom(nomes_materia_prima, 3, 14, 10) for _ in range(produtos)]
+    })
+    # Fração subprodutos dos produtos usa 1 a 3 produtos de índice menor como subconjunto, então não há ciclos
+    nomes_produto = catalogo['produtos']['Nome'].tolist()
+    catalogo['produtos']['Produtos'] = [
+        bom(nomes_produto[:i], 1, 3, 2) if i and subprodutos and rng.random() < subprodutos else {}
+        for i in range(produtos)
+    ]
+    return catalogo
+
+def escrever_catalogo(catalogo, diretorio):
+    for nome, data in catalogo.items():
+        esquema = ESQUEMAS[nome]
+        ArmazenamentoJSON(esquema, os.path.join(diretorio, esquema.arquivo), modo='completo').salvar(data)
@@ -0,0 +1,82 @@
+import unicodedata
+import numpy as np
+
+LIMITE = 20
+
+def normalizar(texto):
+    # Sem acentos e sem diferença de maiúsculas: "Açúcar" e "acucar" são a mesma busca
+    decomposto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere)).casefold().strip()
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+# Índice de busca por nome, montado uma vez por versão dos dados. Devolve posições do DataFrame
+# indexado, na ordem de relevância: nome que começa com a busca, palavra que começa com a busca,
+# nome que contém a busca e, por fim, nomes parecidos (com mais trigramas em comum).
+class IndiceDeBusca:
+    def __init__(self, nomes, versao=None):
+        self.versao = versao
+        self.normalizados = [normalizar(nome) for nome in nomes]
+        # Nomes e palavras ordenados, para buscar prefixos com np.searchsorted
+        self.ordem_nomes = np.argsort(np.array(self.normalizados, dtype=str), kind='stable')
+        self.nomes_ordenados = np.array(self.normalizados, dtype=str)[self.ordem_nomes]
+        palavras, posicoes = [], []
+        postagens = {}
+        for posicao, nome in enumerate(self.normalizados):
+            for palavra in set(nome.replace('-', ' ').split()):
+                palavras.append(palavra)
+                posicoes.append(posicao)
+            for trigrama in trigramas(nome):
+                postagens.setdefault(trigrama, []).append(posicao)
+        palavras = np.array(palavras, dtype=str)
+        ordem = np.argsort(palavras, kind='stable')
+        self.palavras = palavras[ordem]
+        self.posicoes_palavras = np.array(posicoes, dtype=np.int64)[ordem]
+        self.postagens = {trigrama: np.array(lista, dtype=np.int64) for trigrama, lista in postagens.items()}
+
+    def __len__(self):
+        return len(self.normalizados)
+
+    @staticmethod
+    def _prefixo(ordenados, consulta):
+        return np.searchsorted(ordenados, consulta, 'left'), np.searchsorted(ordenados, consulta + '\U0010ffff', 'left')
+
+    def _contendo(self, posicoes, consulta, limite):
+        # Para ao atingir o limite, sem varrer todas as candidatas
+        encontradas = []
+        for posicao in posicoes.tolist():
+            if consulta in self.normalizados[posicao]:
+                encontradas.append(posicao)
+                if len(encontradas) == limite:
+                    break
+        return np.array(encontradas, dtype=np.int64)
+
+    def buscar(self, consulta, limite=LIMITE):
+        consulta = normalizar(consulta)
+        if not consulta:
+            return np.arange(min(limite, len(self)))
+        inicio, fim = self._prefixo(self.nomes_ordenados, consulta)
+        encontradas = [self.ordem_nomes[inicio:fim][:limite]]
+        if len(encontradas[0]) < limite:
+            primeira = consulta.replace('-', ' ').split()[0]
+            inicio, fim = self._prefixo(self.palavras, primeira)
+            # Com várias palavras na busca, o nome ainda precisa conter a busca inteira
+            encontradas.append(self._contendo(self.posicoes_palavras[inicio:fim], consulta, limite))
+        consulta_trigramas = trigramas(consulta)
+        # As etapas seguintes só rodam se as anteriores não encheram o limite
+        if consulta_trigramas and len(np.unique(np.concatenate(encontradas))) < limite:
+            listas = sorted((self.postagens.get(trigrama, np.zeros(0, dtype=np.int64)) for trigrama in consulta_trigramas), key=len)
+            comuns = listas[0]
+            for lista in listas[1:]:
+                comuns = np.intersect1d(comuns, lista, assume_unique=True)
+            encontradas.append(self._contendo(comuns, consulta, limite))
+            # Tolerância a erros de digitação: pelo menos metade dos trigramas em comum
+            contagens = np.bincount(np.concatenate(listas), minlength=len(self))
+            parecidas = np.flatnonzero(contagens * 2 >= len(consulta_trigramas))
+            parecidas = parecidas[np.argsort(-contagens[parecidas], kind='stable')]
+            encontradas.append(parecidas[:limite])
+        # Cada posição fica na primeira (mais relevante) lista em que aparece
+        resultado = np.concatenate(encontradas)
+        _, primeiras = np.unique(resultado, return_index=True)
+        return resultado[np.sort(primeiras)][:limite]
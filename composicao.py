@@ -0,0 +1,237 @@
+import sys
+import numpy as np
+import pandas as pd
+
+# BOMs de todos os produtos de uma coluna em formato CSR: os componentes da linha i são
+# codigos[inicios[i]:inicios[i + 1]], com as quantidades nas mesmas posições de quantidades.
+# Os códigos apontam para um vocabulário de nomes internados, então cada nome de componente
+# existe uma única vez na memória, por mais produtos que o usem.
+class Composicoes:
+    def __init__(self, inicios, codigos, quantidades, nomes, codigo_por_nome):
+        # Arrays somente leitura: alterações criam um novo objeto (cópia na escrita), então
+        # as sessões podem ler a versão atual sem trava
+        for array in (inicios, codigos, quantidades):
+            array.flags.writeable = False
+        self.inicios = inicios
+        self.codigos = codigos
+        self.quantidades = quantidades
+        # O vocabulário só cresce e é compartilhado entre as versões; códigos antigos continuam válidos
+        self.nomes = nomes
+        self.codigo_por_nome = codigo_por_nome
+
+    @classmethod
+    def de_dicionarios(cls, boms):
+        vazio = cls(np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0), [], {})
+        return vazio.anexar(boms)
+
+    def __len__(self):
+        return len(self.inicios) - 1
+
+    def tamanhos(self):
+        return np.diff(self.inicios)
+
+    def linhas(self):
+        return np.repeat(np.arange(len(self)), self.tamanhos())
+
+    def _codigo(self, nome):
+        codigo = self.codigo_por_nome.get(nome)
+        if codigo is None:
+            codigo = len(self.nomes)
+            nome = sys.intern(nome)
+            self.nomes.append(nome)
+            self.codigo_por_nome[nome] = codigo
+        return codigo
+
+    def _codificar(self, boms):
+        tamanhos = np.fromiter((len(bom) for bom in boms), dtype=np.int64, count=len(boms))
+        total = int(tamanhos.sum())
+        codigos = np.fromiter((self._codigo(nome) for bom in boms for nome in bom), dtype=np.int32, count=total)
+        quantidades = np.fromiter((quantidade for bom in boms for quantidade in bom.values()), dtype=float, count=total)
+        return tamanhos, codigos, quantidades
+
+    def _nova(self, inicios, codigos, quantidades):
+        return Composicoes(inicios, codigos, quantidades, self.nomes, self.codigo_por_nome)
+
+    def linha(self, posicao):
+        inicio, fim = self.inicios[posicao], self.inicios[posicao + 1]
+        return {self.nomes[codigo]: float(quantidade)
+                for codigo, quantidade in zip(self.codigos[inicio:fim].tolist(), self.quantidades[inicio:fim].tolist())}
+
+    def dicionarios(self):
+        return [self.linha(posicao) for posicao in range(len(self))]
+
+    def selecionar(self, posicoes):
+        posicoes = np.asarray(posicoes, dtype=np.int64)
+        tamanhos = self.tamanhos()[posicoes]
+        inicios = np.concatenate([[0], np.cumsum(tamanhos)])
+        origem = np.repeat(self.inicios[posicoes] - inicios[:-1], tamanhos) + np.arange(inicios[-1])
+        return self._nova(inicios, self.codigos[origem], self.quantidades[origem])
+
+    def anexar(self, boms):
+        boms = list(boms)
+        tamanhos, codigos, quantidades = self._codificar(boms)
+        inicios = np.concatenate([self.inicios, self.inicios[-1] + np.cumsum(tamanhos)])
+        return self._nova(inicios, np.concatenate([self.codigos, codigos]), np.concatenate([self.quantidades, quantidades]))
+
+    def substituir(self, posicao, bom):
+        tamanhos, codigos, quantidades = self._codificar([bom])
+        inicio, fim = self.inicios[posicao], self.inicios[posicao + 1]
+        inicios = self.inicios.copy()
+        inicios[posicao + 1:] += tamanhos[0] - (fim - inicio)
+        return self._nova(
+            inicios,
+            np.concatenate([self.codigos[:inicio], codigos, self.codigos[fim:]]),
+            np.concatenate([self.quantidades[:inicio], quantidades, self.quantidades[fim:]])
+        )
+
+    def remover(self, posicao):
+        inicio, fim = self.inicios[posicao], self.inicios[posicao + 1]
+        inicios = np.delete(self.inicios, posicao + 1)
+        inicios[posicao + 1:] -= fim - inicio
+        return self._nova(
+            inicios,
+            np.concatenate([self.codigos[:inicio], self.codigos[fim:]]),
+            np.concatenate([self.quantidades[:inicio], self.quantidades[fim:]])
+        )
+
+    def renomear(self, nome_antigo, nome_novo):
+        # Troca o nome em todas as linhas de uma vez. Onde os dois nomes já existiam, fica um único
+        # item na posição do primeiro, com as quantidades somadas. Devolve a nova versão e as linhas alteradas.
+        antigo = self.codigo_por_nome.get(nome_antigo)
+        if antigo is None or nome_antigo == nome_novo or not np.any(self.codigos == antigo):
+            return self, np.zeros(0, dtype=np.int64)
+        novo = self._codigo(nome_novo)
+        linhas = self.linhas()
+        alteradas = np.unique(linhas[self.codigos == antigo])
+        codigos = np.where(self.codigos == antigo, novo, self.codigos).astype(np.int32)
+        itens = np.flatnonzero(codigos == novo)
+        # Os itens do novo nome estão em ordem de linha: o primeiro de cada linha recebe a soma dos demais
+        _, primeiros = np.unique(linhas[itens], return_index=True)
+        quantidades = self.quantidades.copy()
+        quantidades[itens[primeiros]] = np.add.reduceat(quantidades[itens], primeiros)
+        manter = np.ones(len(codigos), dtype=bool)
+        manter[np.delete(itens, primeiros)] = False
+        inicios = np.concatenate([[0], np.cumsum(np.bincount(linhas[manter], minlength=len(self)))])
+        return self._nova(inicios, codigos[manter], quantidades[manter]), alteradas
+
+    def custos(self, custos_por_nome):
+        # Produto da matriz esparsa produto x componente pelo vetor de custos. Componentes sem
+        # cadastro ficam com custo NaN, que se propaga ao produto; np.bincount soma na ordem
+        # dos componentes de cada BOM
+        custos_unitarios = custos_por_nome.reindex(self.nomes).to_numpy(dtype=float)
+        return np.bincount(self.linhas(), weights=custos_unitarios[self.codigos] * self.quantidades, minlength=len(self))
+
+def separar_composicoes(data, colunas):
+    # Troca as colunas de dicionários componente -> quantidade pela representação compacta
+    composicoes = {coluna: Composicoes.de_dicionarios(data[coluna].tolist()) for coluna in colunas}
+    return data.drop(columns=list(colunas)), composicoes
+
+class CicloNaComposicao(ValueError):
+    pass
+
+def ligacoes(subprodutos, nomes_produtos):
+    # Arestas produto -> subconjunto. Nomes duplicados resolvem para a primeira ocorrência e
+    # subconjuntos sem cadastro ficam com filho -1
+    nomes = pd.Index(nomes_produtos)
+    primeiros = pd.Index(nomes[~nomes.duplicated()])
+    posicoes = np.flatnonzero(~nomes.duplicated())
+    encontrados = primeiros.get_indexer(subprodutos.nomes) if subprodutos.nomes else np.zeros(0, dtype=np.int64)
+    filhos_por_codigo = np.where(encontrados >= 0, posicoes[np.maximum(encontrados, 0)] if len(posicoes) else -1, -1)
+    return subprodutos.linhas(), filhos_por_codigo[subprodutos.codigos], subprodutos.quantidades
+
+def niveis(quantidade, pais, filhos):
+    # Ordem topológica em níveis: no nível 0 ficam os produtos sem subconjuntos; no nível k, os que
+    # só usam subconjuntos de níveis anteriores. Produtos em ciclo, ou que dependem de um, ficam
+    # com nível -1 (só acontece com dados gravados por fora, a interface recusa ciclos).
+    validas = filhos >= 0
+    pais, filhos = pais[validas], filhos[validas]
+    nivel = np.full(quantidade, -1, dtype=np.int64)
+    restantes = np.bincount(pais, minlength=quantidade)
+    fronteira = np.flatnonzero(restantes == 0)
+    atual = 0
+    while len(fronteira):
+        nivel[fronteira] = atual
+        concluidas = np.isin(filhos, fronteira)
+        restantes = restantes - np.bincount(pais[concluidas], minlength=quantidade)
+        fronteira = np.flatnonzero((restantes == 0) & (nivel < 0))
+        atual += 1
+    return nivel
+
+def acumular(diretos, pais, filhos, quantidades, nivel):
+    # Custo de cada produto = custo direto + soma de quantidade x custo acumulado dos subconjuntos.
+    # Cada nível é calculado uma vez, de forma vetorizada, a partir dos níveis anteriores, então
+    # um subconjunto compartilhado por vários produtos é custeado uma única vez.
+    quantidade = len(nivel)
+    acumulados = {coluna: np.full(quantidade, np.nan) for coluna in diretos}
+    nivel_do_pai = nivel[pais]
+    for atual in range(int(nivel.max(initial=-1)) + 1):
+        nos = nivel == atual
+        arestas = nivel_do_pai == atual
+        for coluna, custos in acumulados.items():
+            filhos_custos = np.where(filhos[arestas] >= 0, custos[np.maximum(filhos[arestas], 0)], np.nan)
+            subtotal = np.bincount(pais[arestas], weights=quantidades[arestas] * filhos_custos, minlength=quantidade)
+            custos[nos] = diretos[coluna][nos] + subtotal[nos]
+    return acumulados
+
+def custos_acumulados(diretos, subprodutos, nomes_produtos):
+    pais, filhos, quantidades = ligacoes(subprodutos, nomes_produtos)
+    return acumular(diretos, pais, filhos, quantidades, niveis(len(nomes_produtos), pais, filhos))
+
+def fechamento(subprodutos, nomes_produtos, origens):
+    # Posições, em ordem, das origens e de todos os subconjuntos alcançados a partir delas
+    pais, filhos, _ = ligacoes(subprodutos, nomes_produtos)
+    validas = filhos >= 0
+    pais, filhos = pais[validas], filhos[validas]
+    alcancados = np.zeros(len(nomes_produtos), dtype=bool)
+    fronteira = np.unique(np.asarray(origens, dtype=np.int64))
+    while len(fronteira):
+        alcancados[fronteira] = True
+        proximos = filhos[np.isin(pais, fronteira)]
+        fronteira = np.unique(proximos[~alcancados[proximos]])
+    return np.flatnonzero(alcancados)
+
+def alcanca(subprodutos, posicao_por_nome, origens, alvos):
+    # Busca em profundidade pelos subconjuntos a partir de origens; True se chegar a um dos nomes alvos.
+    # posicao_por_nome dá a primeira posição de cada nome cadastrado
+    vistos = set()
+    pendentes = list(origens)
+    while pendentes:
+        nome = pendentes.pop()
+        if nome in alvos:
+            return True
+        if nome in vistos or nome not in posicao_por_nome:
+            continue
+        vistos.add(nome)
+        pendentes.extend(subprodutos.linha(posicao_por_nome[nome]))
+    return False
+
+def expandir(composicoes, subprodutos, nomes_produtos):
+    # Quantidade total de cada componente por produto, descendo pelos subconjuntos: um produto que
+    # usa 2 de um subconjunto com 3 kg de sal passa a ter 6 kg de sal. Devolve, por coluna, os
+    # arrays (linhas, codigos, quantidades) ordenados por linha. Produtos em ciclo não são
+    # expandidos; subconjuntos sem cadastro são ignorados (o custo desses produtos é indefinido).
+    pais, filhos, quantidades_filhos = ligacoes(subprodutos, nomes_produtos)
+    quantidade = len(nomes_produtos)
+    nivel = niveis(quantidade, pais, filhos)
+    validas = filhos >= 0
+    pais, filhos, quantidades_filhos = pais[validas], filhos[validas], quantidades_filhos[validas]
+    expandidas = {}
+    for coluna, composicao in composicoes.items():
+        linhas, codigos, quantidades = composicao.linhas(), composicao.codigos.astype(np.int64), composicao.quantidades
+        for atual in range(1, int(nivel.max(initial=0)) + 1):
+            arestas = nivel[pais] == atual
+            tamanhos = np.bincount(linhas, minlength=quantidade)
+            inicios = np.concatenate([[0], np.cumsum(tamanhos)])
+            # Os itens dos subconjuntos, já completos nos níveis anteriores, vão para o pai multiplicados
+            por_aresta = tamanhos[filhos[arestas]]
+            origem = np.repeat(inicios[filhos[arestas]] - np.concatenate([[0], np.cumsum(por_aresta)[:-1]]), por_aresta)
+            origem += np.arange(len(origem))
+            linhas = np.concatenate([linhas, np.repeat(pais[arestas], por_aresta)])
+            codigos = np.concatenate([codigos, codigos[origem]])
+            quantidades = np.concatenate([quantidades, quantidades[origem] * np.repeat(quantidades_filhos[arestas], por_aresta)])
+            # Um componente que chega por mais de um caminho vira um único item
+            chaves, inverso = np.unique(linhas * len(composicao.nomes) + codigos, return_inverse=True)
+            quantidades = np.bincount(inverso, weights=quantidades)
+            linhas, codigos = chaves // max(len(composicao.nomes), 1), chaves % max(len(composicao.nomes), 1)
+        expandidas[coluna] = (linhas, codigos, quantidades)
+    return expandidas
@@ -0,0 +1,120 @@
+import threading
+import time
+from datetime import date, datetime, time as horario
+import numpy as np
+import pandas as pd
+
+def instante(valor):
+    # Segundos desde a época. Uma data sem hora vale até o fim do dia: as alterações feitas
+    # naquele dia já contam
+    if valor is None or isinstance(valor, (int, float, np.number)):
+        return valor
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor) if len(valor) > 10 else date.fromisoformat(valor)
+    if isinstance(valor, datetime):
+        return valor.timestamp()
+    return datetime.combine(valor, horario.max).timestamp()
+
+# Histórico com data de vigência dos valores de uma entidade (custo ou percentual), por id estável.
+# Os registros ficam em arrays ordenados por (id, vigência) e a consulta "valor vigente em" é uma
+# busca binária vetorizada. Alterações criam um novo objeto (cópia na escrita), como as BOMs.
+# Cada registro guarda também o nome da linha naquele momento; a remoção grava um valor NaN, então
+# uma linha removida continua com nome e valor para as datas anteriores à remoção.
+class HistoricoDeCustos:
+    def __init__(self, ids=(), vigencias=(), valores=(), nomes=None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vigencias = np.asarray(vigencias, dtype=float)
+        self.valores = np.asarray(valores, dtype=float)
+        self.nomes = np.full(len(self.ids), None, dtype=object) if nomes is None else np.asarray(nomes, dtype=object)
+        # A ordenação só é feita na primeira consulta, então várias alterações seguidas custam só a cópia
+        self.trava = threading.Lock()
+        self.ordenado = False
+
+    @classmethod
+    def de_tabela(cls, tabela):
+        nomes = tabela['nome'].to_numpy(dtype=object) if 'nome' in tabela else None
+        return cls(tabela['id'].to_numpy(), tabela['vigencia'].to_numpy(), tabela['valor'].to_numpy(), nomes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _ordenar(self):
+        with self.trava:
+            if self.ordenado:
+                return
+            # lexsort é estável: com a mesma vigência, vale o último registro gravado
+            ordem = np.lexsort((self.vigencias, self.ids))
+            ids, vigencias = self.ids[ordem], self.vigencias[ordem]
+            self.valores_ordenados = self.valores[ordem]
+            self.nomes_ordenados = self.nomes[ordem]
+            self.chaves, self.codigo_de = np.unique(ids, return_inverse=True)
+            self.instantes = np.unique(vigencias)
+            # Chave composta crescente: id e, dentro do id, a posição da vigência entre todos os instantes
+            self.compostas = self.codigo_de * (len(self.instantes) + 1) + np.searchsorted(self.instantes, vigencias)
+            self.ordenado = True
+
+    def possui(self, id_registro):
+        return bool(np.any(self.ids == id_registro))
+
+    def alteracoes(self, id_registro, valor, anterior=None, vigencia=None, nome=None):
+        # Registros a gravar para uma alteração. Linhas anteriores ao histórico ganham, na primeira
+        # alteração, o valor antigo com vigência desde sempre (0). Valor NaN marca a remoção.
+        vigencia = time.time() if vigencia is None else vigencia
+        registros = []
+        if anterior is not None and not self.possui(id_registro):
+            registros.append((int(id_registro), 0.0, float(anterior), nome))
+        if anterior is None or float(valor) != float(anterior):
+            registros.append((int(id_registro), float(vigencia), float(valor), nome))
+        return registros
+
+    def remocoes(self, id_registro, anterior, nome, vigencia=None):
+        return self.alteracoes(id_registro, np.nan, anterior, vigencia, nome)
+
+    def inclusoes(self, ids_registros, valores, nomes, vigencia=None):
+        vigencia = time.time() if vigencia is None else float(vigencia)
+        return [(int(id_registro), vigencia, float(valor), nome) for id_registro, valor, nome in zip(ids_registros, valores, nomes)]
+
+    def anexar(self, registros):
+        if not registros:
+            return self
+        ids, vigencias, valores, nomes = zip(*registros)
+        return HistoricoDeCustos(np.concatenate([self.ids, ids]), np.concatenate([self.vigencias, vigencias]),
+                                 np.concatenate([self.valores, valores]),
+                                 np.concatenate([self.nomes, np.asarray(nomes, dtype=object)]))
+
+    def valores_em(self, ids, instantes, atuais):
+        # Matriz instantes x ids com o valor vigente. Ids sem histórico mantêm o valor atual; um id
+        # que só passou a existir depois do instante fica com NaN
+        ids = np.asarray(ids, dtype=np.int64)
+        instantes = np.atleast_1d(np.asarray(instantes, dtype=float))
+        atuais = np.asarray(atuais, dtype=float)
+        if not len(self):
+            return np.broadcast_to(atuais, (len(instantes), len(ids))).copy()
+        self._ordenar()
+        codigos = np.minimum(np.searchsorted(self.chaves, ids), len(self.chaves) - 1)
+        com_historico = self.chaves[codigos] == ids
+        # Posição do último instante <= cada consulta; -1 antes de qualquer registro
+        posicoes_instantes = np.searchsorted(self.instantes, instantes, 'right') - 1
+        consultas = codigos[None, :] * (len(self.instantes) + 1) + posicoes_instantes[:, None]
+        encontrados = np.searchsorted(self.compostas, consultas, 'right') - 1
+        validos = (encontrados >= 0) & (self.codigo_de[np.maximum(encontrados, 0)] == codigos[None, :])
+        valores = np.where(validos, self.valores_ordenados[np.maximum(encontrados, 0)], np.nan)
+        return np.where(com_historico[None, :], valores, atuais[None, :])
+
+    def removidos(self, ids_atuais):
+        # Ids com histórico que não estão mais cadastrados, com o nome do último registro
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+        self._ordenar()
+        ultimos = np.append(np.flatnonzero(np.diff(self.codigo_de)), len(self.codigo_de) - 1)
+        nomes = self.nomes_ordenados[ultimos]
+        selecionados = ~np.isin(self.chaves, np.asarray(ids_atuais, dtype=np.int64)) & ~pd.isna(nomes) & (nomes != '')
+        return self.chaves[selecionados], nomes[selecionados]
+
+    def mudancas(self, ids=None):
+        # Instantes em que algum valor mudou, em ordem; com ids, só as mudanças desses registros
+        if ids is None:
+            self._ordenar()
+            return self.instantes[self.instantes > 0]
+        vigencias = self.vigencias[np.isin(self.ids, np.asarray(ids, dtype=np.int64))]
+        return np.unique(vigencias[vigencias > 0])
@@ -0,0 +1,188 @@
+import json
+import math
+import os
+from itertools import chain
+import pandas as pd
+import metricas
+
+TAMANHO_LOTE = 50_000
+# Valores aceitos na coluna Tipo do formato longo de produtos e a coluna de BOM correspondente
+TIPOS_COMPONENTE = {'mao_de_obra': 'Maos_de_Obra', 'materia_prima': 'Materias_Primas', 'produto': 'Produtos'}
+
+class ResultadoImportacao:
+    def __init__(self, importados, rejeitados):
+        self.importados = importados
+        # Linhas rejeitadas com o número da linha no arquivo e o motivo
+        self.rejeitados = rejeitados
+
+def detectar_formato(nome_arquivo):
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    if extensao == '.csv':
+        return 'csv'
+    if extensao in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f'Formato de arquivo não suportado: {extensao or nome_arquivo}')
+
+def ler_em_lotes(arquivo, formato, tamanho_lote=TAMANHO_LOTE):
+    if formato == 'csv':
+        # Tudo como texto; os tipos são validados depois, de forma vetorizada
+        leitor = pd.read_csv(arquivo, chunksize=tamanho_lote, dtype=str, keep_default_na=False)
+    elif formato == 'jsonl':
+        leitor = pd.read_json(arquivo, lines=True, chunksize=tamanho_lote, dtype=False)
+    else:
+        raise ValueError(f'Formato de arquivo não suportado: {formato}')
+    linha = 1
+    for lote in leitor:
+        lote = lote.reset_index(drop=True)
+        lote.insert(0, 'Linha', range(linha, linha + len(lote)))
+        lote['Motivo'] = None
+        linha += len(lote)
+        yield lote
+
+def _marcar(lote, mascara, motivo):
+    # Só registra o primeiro motivo de cada linha
+    lote.loc[mascara & lote['Motivo'].isna(), 'Motivo'] = motivo
+
+def _exigir_colunas(lote, colunas):
+    ausentes = [coluna for coluna in colunas if coluna not in lote.columns]
+    if ausentes:
+        raise ValueError(f'Colunas obrigatórias ausentes: {", ".join(ausentes)}')
+
+def _texto(serie):
+    return serie.fillna('').astype(str).str.strip()
+
+def _validar_numero(lote, coluna):
+    # A coluna fica com o valor lido, para o relatório de rejeitadas mostrar o que veio no arquivo;
+    # só as linhas aceitas são convertidas
+    numeros = pd.to_numeric(lote[coluna], errors='coerce')
+    _marcar(lote, numeros.isna(), f'{coluna} não numérico')
+    _marcar(lote, numeros < 0, f'{coluna} negativo')
+
+def _validar_simples(lote, esquema, existentes, vistos):
+    nome = esquema.coluna_nome
+    _exigir_colunas(lote, esquema.colunas)
+    lote[nome] = _texto(lote[nome])
+    _marcar(lote, lote[nome] == '', f'{nome} vazio')
+    for coluna in esquema.colunas_float:
+        _validar_numero(lote, coluna)
+    _marcar(lote, lote[nome].isin(existentes), f'{nome} já cadastrado')
+    validos = lote['Motivo'].isna()
+    _marcar(lote, lote[nome].isin(vistos) | (lote[nome].where(validos).duplicated() & validos),
+            f'{nome} duplicado no arquivo')
+    vistos.update(lote.loc[lote['Motivo'].isna(), nome])
+    return lote
+
+def _ler_bom(bom):
+    # Dicionário componente -> quantidade; None se o valor não for uma BOM. Coluna ausente na linha
+    # (NaN), nula ou vazia vale como BOM vazia
+    if isinstance(bom, str):
+        if not bom.strip():
+            return {}
+        try:
+            bom = json.loads(bom)
+        except ValueError:
+            return None
+    if bom is None or (isinstance(bom, float) and math.isnan(bom)):
+        return {}
+    return bom if isinstance(bom, dict) else None
+
+def _formato_longo(lote):
+    # Produtos em JSONL trazem os BOMs como dicionários; convertidos para uma linha por componente
+    if 'Componente' in lote.columns:
+        _exigir_colunas(lote, ['Produto', 'Tipo', 'Componente', 'Quantidade'])
+        for coluna in ('Produto', 'Tipo', 'Componente'):
+            lote[coluna] = _texto(lote[coluna])
+        return lote
+    _exigir_colunas(lote, ['Nome', 'Maos_de_Obra', 'Materias_Primas'])
+    partes = []
+    # Uma BOM que não é um objeto JSON rejeita o produto, pelo motivo gravado na linha só com o produto
+    motivos = [None] * len(lote)
+    for tipo, coluna in TIPOS_COMPONENTE.items():
+        # Subprodutos são opcionais, para aceitar arquivos anteriores a eles
+        if coluna not in lote.columns:
+            continue
+        boms = [_ler_bom(bom) for bom in lote[coluna]]
+        for posicao, bom in enumerate(boms):
+            if bom is None and motivos[posicao] is None:
+                motivos[posicao] = f'{coluna} inválido'
+        boms = [bom or {} for bom in boms]
+        tamanhos = [len(bom) for bom in boms]
+        partes.append(pd.DataFrame({
+            'Linha': lote['Linha'].repeat(tamanhos).to_numpy(),
+            'Produto': lote['Nome'].repeat(tamanhos).to_numpy(),
+            'Tipo': tipo,
+            'Componente': list(chain.from_iterable(bom.keys() for bom in boms)),
+            'Quantidade': list(chain.from_iterable(bom.values() for bom in boms)),
+            'Motivo': None,
+        }))
+    # Linha só com o produto, para que produtos sem componentes também sejam importados
+    partes.append(pd.DataFrame({'Linha': lote['Linha'], 'Produto': lote['Nome'], 'Tipo': '', 'Componente': '', 'Quantidade': 0.0,
+                                'Motivo': motivos}))
+    longo = pd.concat(partes, ignore_index=True)
+    longo['Produto'] = _texto(longo['Produto'])
+    return longo
+
+def _validar_componentes(lote, existentes, referencias):
+    lote = _formato_longo(lote)
+    somente_produto = (lote['Tipo'] == '') & (lote['Componente'] == '')
+    lote['Quantidade'] = lote['Quantidade'].where(~somente_produto, '0')
+    _marcar(lote, lote['Produto'] == '', 'Produto vazio')
+    _marcar(lote, ~somente_produto & ~lote['Tipo'].isin(list(TIPOS_COMPONENTE)), 'Tipo inválido')
+    _marcar(lote, ~somente_produto & (lote['Componente'] == ''), 'Componente vazio')
+    _validar_numero(lote, 'Quantidade')
+    for tipo, nomes in referencias.items():
+        _marcar(lote, (lote['Tipo'] == tipo) & ~lote['Componente'].isin(nomes), 'Componente não cadastrado')
+    _marcar(lote, lote['Produto'].isin(existentes), 'Produto já cadastrado')
+    return lote
+
+def _montar_produtos(linhas):
+    # Um produto com qualquer linha rejeitada é rejeitado inteiro
+    componentes = linhas['Componente'] != ''
+    _marcar(linhas, componentes & linhas.duplicated(['Produto', 'Tipo', 'Componente']), 'Componente duplicado no arquivo')
+    invalidos = linhas.loc[linhas['Motivo'].notna(), 'Produto']
+    _marcar(linhas, linhas['Produto'].isin(invalidos), 'Produto com linhas rejeitadas')
+    # Produtos na ordem do arquivo; no JSONL as linhas longas vêm agrupadas por tipo de componente
+    aceitas = linhas[linhas['Motivo'].isna()].sort_values('Linha', kind='stable')
+    produtos = {}
+    for produto, tipo, componente, quantidade in zip(aceitas['Produto'], aceitas['Tipo'], aceitas['Componente'], aceitas['Quantidade']):
+        boms = produtos.setdefault(produto, {coluna: {} for coluna in TIPOS_COMPONENTE.values()})
+        if componente:
+            boms[TIPOS_COMPONENTE[tipo]][componente] = float(quantidade)
+    novos = pd.DataFrame({
+        'Nome': list(produtos),
+        'Maos_de_Obra': [boms['Maos_de_Obra'] for boms in produtos.values()],
+        'Materias_Primas': [boms['Materias_Primas'] for boms in produtos.values()],
+        'Produtos': [boms['Produtos'] for boms in produtos.values()],
+    })
+    return novos, linhas[linhas['Motivo'].notna()]
+
+@metricas.instrumentar('importacao.importar')
+def importar(entidade, arquivo, formato=None, tamanho_lote=TAMANHO_LOTE, maos_de_obra=(), materias_primas=()):
+    if formato is None:
+        formato = detectar_formato(getattr(arquivo, 'name', str(arquivo)))
+    esquema = entidade.armazenamento.esquema
+    existentes = pd.Index(entidade.data[esquema.coluna_nome])
+    lotes = []
+    if esquema.colunas_bom:
+        # Subprodutos só podem ser produtos já cadastrados
+        referencias = {'mao_de_obra': pd.Index(maos_de_obra), 'materia_prima': pd.Index(materias_primas), 'produto': existentes}
+        for lote in ler_em_lotes(arquivo, formato, tamanho_lote):
+            lotes.append(_validar_componentes(lote, existentes, referencias))
+        linhas = pd.concat(lotes, ignore_index=True) if lotes else pd.DataFrame(
+            columns=['Linha', 'Produto', 'Tipo', 'Componente', 'Quantidade', 'Motivo'])
+        novos, rejeitados = _montar_produtos(linhas)
+    else:
+        vistos = set()
+        rejeitados = []
+        for lote in ler_em_lotes(arquivo, formato, tamanho_lote):
+            lote = _validar_simples(lote, esquema, existentes, vistos)
+            aceitas = lote.loc[lote['Motivo'].isna(), esquema.colunas]
+            lotes.append(aceitas.assign(**{coluna: pd.to_numeric(aceitas[coluna]).astype(float) for coluna in esquema.colunas_float}))
+            rejeitados.append(lote[lote['Motivo'].notna()])
+        novos = pd.concat(lotes, ignore_index=True) if lotes else esquema.vazio()
+        rejeitados = pd.concat(rejeitados, ignore_index=True) if rejeitados else pd.DataFrame(columns=['Linha', 'Motivo'])
+    # Uma única gravação para todas as linhas aceitas
+    if not novos.empty:
+        entidade.importar(novos)
+    colunas = ['Linha', 'Motivo'] + [coluna for coluna in rejeitados.columns if coluna not in ('Linha', 'Motivo')]
+    return ResultadoImportacao(len(novos), rejeitados[colunas].reset_index(drop=True))
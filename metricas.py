@@ -0,0 +1,119 @@
+import functools
+import json
+import os
+import threading
+import time
+from armazenamento import substituir_arquivo
+
+# Instrumentação dos pontos quentes; desligada com PRECIFICACAO_METRICAS=0
+ATIVO = os.environ.get('PRECIFICACAO_METRICAS', '1') != '0'
+CAMINHO_LOG = os.environ.get('PRECIFICACAO_METRICAS_LOG', 'metricas.log')
+CAMINHO_PROMETHEUS = os.environ.get('PRECIFICACAO_METRICAS_PROMETHEUS', 'metricas.prom')
+# Com PRECIFICACAO_METRICAS_LOG definido, cada execução do Streamlit é anexada ao log automaticamente
+CAMINHO_LOG_AUTOMATICO = 'PRECIFICACAO_METRICAS_LOG' in os.environ
+
+# Acumulado do processo: nome -> [chamadas, segundos, máximo]
+_acumulado = {}
+_trava = threading.Lock()
+# Cada sessão do Streamlit roda em uma thread; a execução atual fica por thread
+_execucao = threading.local()
+
+def iniciar_execucao():
+    _execucao.medicoes = {}
+
+def execucao_atual():
+    if not hasattr(_execucao, 'medicoes'):
+        _execucao.medicoes = {}
+    return _execucao.medicoes
+
+def registrar(nome, segundos, chamadas=1):
+    _somar(execucao_atual(), nome, segundos, chamadas)
+    with _trava:
+        _somar(_acumulado, nome, segundos, chamadas)
+
+def _somar(medicoes, nome, segundos, chamadas):
+    medicao = medicoes.setdefault(nome, [0, 0.0, 0.0])
+    medicao[0] += chamadas
+    medicao[1] += segundos
+    medicao[2] = max(medicao[2], segundos)
+
+def contar(nome, quantidade=1):
+    # Contadores sem tempo, como linhas enviadas ao navegador
+    if ATIVO:
+        registrar(nome, 0.0, quantidade)
+
+class Medicao:
+    def __init__(self, nome):
+        self.nome = nome
+        self.inicio = None
+
+    def __enter__(self):
+        if ATIVO:
+            self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        if self.inicio is not None:
+            registrar(self.nome, time.perf_counter() - self.inicio)
+        return False
+
+def medir(nome):
+    return Medicao(nome)
+
+def instrumentar(nome):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            if not ATIVO:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                registrar(nome, time.perf_counter() - inicio)
+        return envolvida
+    return decorador
+
+def instrumentar_metodo(operacao):
+    # Para métodos herdados: a medição leva o nome da classe concreta (MaoDeObra.adicionar, ...)
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(self, *args, **kwargs):
+            with medir(f'{type(self).__name__}.{operacao}'):
+                return funcao(self, *args, **kwargs)
+        return envolvida
+    return decorador
+
+def tabela(medicoes):
+    return [
+        {'Operacao': nome, 'Chamadas': chamadas, 'Total_ms': segundos * 1000, 'Max_ms': maximo * 1000}
+        for nome, (chamadas, segundos, maximo) in sorted(medicoes.items(), key=lambda item: -item[1][1])
+    ]
+
+def acumulado():
+    with _trava:
+        return {nome: list(medicao) for nome, medicao in _acumulado.items()}
+
+def exportar_log(caminho=None, medicoes=None):
+    # Uma linha JSON por execução, com o detalhamento de cada operação
+    registro = {'instante': time.time(), 'operacoes': tabela(execucao_atual() if medicoes is None else medicoes)}
+    with open(caminho or CAMINHO_LOG, 'a', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+
+def exportar_prometheus(caminho=None):
+    # No formato de exposição as amostras de uma família ficam juntas, logo após o HELP e o TYPE
+    familias = [
+        ('chamadas_total', 'counter', 'Chamadas por operação instrumentada.', 0, ''),
+        ('segundos_total', 'counter', 'Tempo acumulado por operação instrumentada.', 1, '.9f'),
+        ('segundos_max', 'gauge', 'Maior duração observada por operação instrumentada.', 2, '.9f'),
+    ]
+    medicoes = sorted(acumulado().items())
+    linhas = []
+    for sufixo, tipo, descricao, posicao, formato in familias:
+        metrica = f'precificacao_operacao_{sufixo}'
+        linhas.append(f'# HELP {metrica} {descricao}')
+        linhas.append(f'# TYPE {metrica} {tipo}')
+        for nome, medicao in medicoes:
+            rotulo = nome.replace('\\', '\\\\').replace('"', '\\"')
+            linhas.append(f'{metrica}{{operacao="{rotulo}"}} {medicao[posicao]:{formato}}')
+    substituir_arquivo(caminho or CAMINHO_PROMETHEUS, '\n'.join(linhas) + '\n')
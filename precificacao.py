@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import metricas
+import armazenamento
+from armazenamento import ESQUEMAS, ArmazenamentoSQLite, consultar_custos, criar_armazenamento
+from composicao import acumular, fechamento, ligacoes, niveis, separar_composicoes
+from historico import HistoricoDeCustos, instante
+
+TAMANHO_LOTE = 10_000
+
+def aplicar_precos(custo_total, percentual_imposto, percentual_lucro):
+    # Única fórmula de preço, usada pela tela do Streamlit e pela precificação em lote
+    preco_com_lucro = custo_total * (1 + percentual_lucro / 100)
+    preco_final = preco_com_lucro * (1 + percentual_imposto / 100)
+    return preco_com_lucro, preco_final
+
+# Motor de precificação em lote
+class MotorDePrecificacao:
+    COLUNAS = ['Produto', 'Estado', 'Percentual_Imposto', 'Percentual_Lucro', 'Custo_Mao_de_Obra',
+               'Custo_Materias_Primas', 'Custo_Total', 'Preco_com_Lucro', 'Preco_Final']
+
+    def __init__(self, mao_de_obra, materia_prima, imposto, produto, custos_materializados=None):
+        self.mao_de_obra = mao_de_obra
+        self.materia_prima = materia_prima
+        self.imposto = imposto
+        self.produto = produto
+        self.custos_materializados = custos_materializados
+
+    @staticmethod
+    def _custos_por_nome(data, coluna_nome, coluna_valor):
+        # Em nomes duplicados vale a primeira ocorrência, como no filtro original com .values[0]
+        data = data.drop_duplicates(subset=coluna_nome, keep='first')
+        return pd.Series(data[coluna_valor].to_numpy(dtype=float), index=data[coluna_nome].to_numpy())
+
+    @staticmethod
+    def _registros(entidade, coluna_nome, coluna_valor):
+        # Linhas atuais seguidas das removidas que estão no histórico, com o nome que tinham na
+        # remoção; as removidas não têm valor atual
+        data = entidade.data
+        ids_removidos, nomes_removidos = entidade.historico.removidos(data['ID'].to_numpy())
+        ids = np.concatenate([data['ID'].to_numpy(dtype=np.int64), ids_removidos])
+        nomes = np.concatenate([data[coluna_nome].to_numpy(dtype=object), nomes_removidos])
+        atuais = np.concatenate([data[coluna_valor].to_numpy(dtype=float), np.full(len(ids_removidos), np.nan)])
+        return ids, nomes, atuais
+
+    def _vigentes_em(self, entidade, coluna_nome, coluna_valor, instantes, usados=None):
+        # Valores por nome em cada instante, com uma única busca binária no histórico. Só entram as
+        # linhas que existiam no instante, então o nome de uma linha que ainda não existia (ou já
+        # tinha sido removida) fica com NaN, como um componente sem cadastro. Com usados, só esses nomes.
+        ids, nomes, atuais = self._registros(entidade, coluna_nome, coluna_valor)
+        if usados is not None:
+            selecionados = np.isin(nomes, list(usados))
+            ids, nomes, atuais = ids[selecionados], nomes[selecionados], atuais[selecionados]
+        valores = entidade.historico.valores_em(ids, instantes, atuais)
+        return [
+            self._custos_por_nome(pd.DataFrame({coluna_nome: nomes[existentes], coluna_valor: linha[existentes]}), coluna_nome, coluna_valor)
+            for linha, existentes in zip(valores, ~np.isnan(valores))
+        ]
+
+    def _vigentes(self, entidade, coluna_nome, coluna_valor, em=None):
+        # Valores vigentes no instante em (None: os atuais)
+        if em is None:
+            return self._custos_por_nome(entidade.data, coluna_nome, coluna_valor)
+        return self._vigentes_em(entidade, coluna_nome, coluna_valor, [em])[0]
+
+    @metricas.instrumentar('MotorDePrecificacao.custos')
+    def custos(self, indices=None, em=None):
+        # Os custos materializados são só os atuais; uma data de referência recalcula a partir do histórico
+        if em is None and self.custos_materializados is not None:
+            return self.custos_materializados.tabela(indices)
+        if em is None:
+            vigentes = [(self._vigentes(self.mao_de_obra, 'Nome', 'Custo_Hora'),
+                         self._vigentes(self.materia_prima, 'Nome', 'Custo_Unidade'))]
+        else:
+            vigentes = self._componentes_em([em])
+        return next(self._custos_com(vigentes, *self._fechamento(indices)))
+
+    def _componentes_em(self, instantes, usados=None):
+        # Custos por nome de mão de obra e de matéria-prima em cada instante, com uma única consulta
+        # ao histórico por entidade
+        usados = usados or {}
+        return zip(self._vigentes_em(self.mao_de_obra, 'Nome', 'Custo_Hora', instantes, usados.get('Maos_de_Obra')),
+                   self._vigentes_em(self.materia_prima, 'Nome', 'Custo_Unidade', instantes, usados.get('Materias_Primas')))
+
+    def _componentes_usados(self, posicoes):
+        # Nomes de mão de obra e de matéria-prima nas BOMs dessas posições (None: todos)
+        if posicoes is None:
+            return {}
+        return {
+            coluna: [composicoes.nomes[codigo] for codigo in np.unique(composicoes.selecionar(posicoes).codigos)]
+            for coluna, composicoes in self.produto.boms.items() if coluna != 'Produtos'
+        }
+
+    def _fechamento(self, indices):
+        # Produtos pedidos e as posições, em ordem, de tudo de que o custo deles depende: eles e os
+        # subconjuntos alcançados (None: o catálogo inteiro)
+        if indices is None:
+            return self.produto.data, None
+        produtos = self.produto.data.loc[indices]
+        return produtos, fechamento(self.produto.boms['Produtos'], self.produto.data['Nome'], produtos.index.to_numpy())
+
+    def _custos_com(self, vigentes, produtos, posicoes):
+        # Gera a tabela de custos dos produtos para cada par (mão de obra, matéria-prima) de custos
+        # por nome. Com posicoes, só o fechamento dos produtos é custeado
+        nomes_produtos = self.produto.data['Nome'].to_numpy()
+        boms, linhas = self.produto.boms, produtos.index.to_numpy()
+        if posicoes is not None:
+            boms = {coluna: composicoes.selecionar(posicoes) for coluna, composicoes in boms.items()}
+            nomes_produtos, linhas = nomes_produtos[posicoes], np.searchsorted(posicoes, linhas)
+        if len(boms['Produtos'].codigos):
+            # Com subconjuntos o custo de um produto depende de outros, acumulados por nível; o grafo
+            # é o mesmo em todos os instantes
+            pais, filhos, quantidades = ligacoes(boms['Produtos'], nomes_produtos)
+            nivel = niveis(len(nomes_produtos), pais, filhos)
+        for mao_de_obra, materia_prima in vigentes:
+            custos = {
+                'Maos_de_Obra': boms['Maos_de_Obra'].custos(mao_de_obra),
+                'Materias_Primas': boms['Materias_Primas'].custos(materia_prima)
+            }
+            if len(boms['Produtos'].codigos):
+                custos = acumular(custos, pais, filhos, quantidades, nivel)
+            custo_mao_de_obra = custos['Maos_de_Obra'][linhas]
+            custo_materias_primas = custos['Materias_Primas'][linhas]
+            yield pd.DataFrame({
+                'Produto': produtos['Nome'].to_numpy(),
+                'Custo_Mao_de_Obra': custo_mao_de_obra,
+                'Custo_Materias_Primas': custo_materias_primas,
+                'Custo_Total': custo_mao_de_obra + custo_materias_primas
+            }, index=produtos.index)
+
+    @metricas.instrumentar('MotorDePrecificacao.calcular')
+    def calcular(self, estados=None, margens=(0.0,), indices=None, custos=None, em=None):
+        if custos is None:
+            custos = self.custos(indices, em)
+        percentuais = self._vigentes(self.imposto, 'Estado', 'Percentual', em)
+        if estados is not None:
+            percentuais = percentuais.reindex(estados)
+        margens = np.asarray(margens, dtype=float)
+
+        # Produto cartesiano produto x estado x margem, na ordem produto > estado > margem
+        n_produtos, n_estados, n_margens = len(custos), len(percentuais), len(margens)
+        por_produto = n_estados * n_margens
+        custo_total = np.repeat(custos['Custo_Total'].to_numpy(), por_produto)
+        percentual_imposto = np.tile(np.repeat(percentuais.to_numpy(), n_margens), n_produtos)
+        percentual_lucro = np.tile(margens, n_produtos * n_estados)
+        preco_com_lucro, preco_final = aplicar_precos(custo_total, percentual_imposto, percentual_lucro)
+
+        resultado = pd.DataFrame({
+            'Produto': np.repeat(custos['Produto'].to_numpy(), por_produto),
+            'Estado': np.tile(np.repeat(percentuais.index.to_numpy(), n_margens), n_produtos),
+            'Percentual_Imposto': percentual_imposto,
+            'Percentual_Lucro': percentual_lucro,
+            'Custo_Mao_de_Obra': np.repeat(custos['Custo_Mao_de_Obra'].to_numpy(), por_produto),
+            'Custo_Materias_Primas': np.repeat(custos['Custo_Materias_Primas'].to_numpy(), por_produto),
+            'Custo_Total': custo_total,
+            'Preco_com_Lucro': preco_com_lucro,
+            'Preco_Final': preco_final
+        }, columns=self.COLUNAS)
+        resultado.index = pd.Index(np.repeat(custos.index.to_numpy(), por_produto), name='Indice_Produto')
+        return resultado
+
+    def _ids(self, entidade, coluna_nome, coluna_valor, usados):
+        if usados is None:
+            return None
+        ids, nomes, _ = self._registros(entidade, coluna_nome, coluna_valor)
+        return ids[np.isin(nomes, list(usados))]
+
+    def mudancas(self, usados=None, estados=None):
+        # Instantes em que algum custo ou imposto mudou. Com usados (nomes por coluna de BOM), só
+        # contam esses componentes; com estados, só os impostos desses estados
+        usados = usados or {}
+        historicos = [
+            self.mao_de_obra.historico.mudancas(self._ids(self.mao_de_obra, 'Nome', 'Custo_Hora', usados.get('Maos_de_Obra'))),
+            self.materia_prima.historico.mudancas(self._ids(self.materia_prima, 'Nome', 'Custo_Unidade', usados.get('Materias_Primas'))),
+            self.imposto.historico.mudancas(self._ids(self.imposto, 'Estado', 'Percentual', estados))
+        ]
+        return np.unique(np.concatenate(historicos))
+
+    def precos_no_periodo(self, datas, estados=None, margens=(0.0,), indices=None):
+        # Reprecificação em várias datas: entre duas mudanças de custo ou imposto os preços são os
+        # mesmos, então só se calcula uma vez por intervalo (encontrado por busca binária) e o
+        # resultado é reaproveitado pelas datas seguintes. Com indices, só as mudanças que afetam
+        # esses produtos abrem um novo intervalo. Gera (data, preços); não altere o DataFrame.
+        instantes = np.array([instante(data) for data in datas], dtype=float)
+        produtos, posicoes = self._fechamento(indices)
+        usados = self._componentes_usados(posicoes)
+        intervalos = np.searchsorted(self.mudancas(usados, estados), instantes, 'right')
+        novos = np.diff(intervalos, prepend=-1) != 0
+        custos = self._custos_com(self._componentes_em(instantes[novos], usados), produtos, posicoes)
+        precos = None
+        for data, em, novo in zip(datas, instantes, novos):
+            if novo:
+                precos = self.calcular(estados, margens, custos=next(custos), em=em)
+            yield data, precos
+
+# Dados lidos direto do armazenamento, sem as classes de entidade da interface
+class Tabela:
+    def __init__(self, data, colunas_bom=(), historico=None):
+        self.data, self.boms = separar_composicoes(data, colunas_bom)
+        self.historico = historico if historico is not None else HistoricoDeCustos()
+
+def _carregar_tabela(esquema, diretorio):
+    origem = criar_armazenamento(esquema, os.path.join(diretorio, esquema.arquivo))
+    historico = HistoricoDeCustos.de_tabela(origem.carregar_historico()) if esquema.coluna_historico else None
+    return Tabela(origem.carregar(), esquema.colunas_bom, historico)
+
+def carregar_motor(diretorio='.'):
+    tabelas = {nome: _carregar_tabela(esquema, diretorio) for nome, esquema in ESQUEMAS.items()}
+    return MotorDePrecificacao(tabelas['maos_de_obra'], tabelas['materias_primas'], tabelas['impostos'], tabelas['produtos'])
+
+def montar_catalogo(motor, em=None):
+    # Custos de todos os produtos calculados uma vez (na data de referência em, se houver); os
+    # pedidos só consultam por nome
+    custos = motor.custos(em=em)
+    custos = custos[~custos['Produto'].duplicated()]
+    return {
+        'produtos': pd.Index(custos['Produto']),
+        'custos': custos[['Custo_Mao_de_Obra', 'Custo_Materias_Primas', 'Custo_Total']].to_numpy(),
+        'impostos': motor._vigentes(motor.imposto, 'Estado', 'Percentual', em)
+    }
+
+def montar_catalogo_sqlite():
+    # No SQLite os custos atuais saem de uma única consulta (CTE recursiva sobre os subconjuntos),
+    # sem carregar as tabelas nem as composições na memória
+    banco = ArmazenamentoSQLite(ESQUEMAS['impostos'])
+    try:
+        custos = consultar_custos(banco.conexao)
+        impostos = MotorDePrecificacao._custos_por_nome(banco.carregar(), 'Estado', 'Percentual')
+    finally:
+        banco.conexao.close()
+    custos = custos[~custos['Produto'].duplicated()]
+    return {
+        'produtos': pd.Index(custos['Produto']),
+        'custos': custos[['Custo_Mao_de_Obra', 'Custo_Materias_Primas', 'Custo_Total']].to_numpy(),
+        'impostos': impostos
+    }
+
+def precificar_pedidos(pedidos, catalogo):
+    produtos = pedidos['Produto'].astype(str).to_numpy()
+    estados = pedidos['Estado'].astype(str).to_numpy()
+    margens = pd.to_numeric(pedidos['Margem'], errors='coerce').to_numpy(dtype=float) if 'Margem' in pedidos else np.zeros(len(pedidos))
+    posicoes = catalogo['produtos'].get_indexer(produtos)
+    encontrados = posicoes >= 0
+    custos = np.where(encontrados[:, None], catalogo['custos'][np.where(encontrados, posicoes, 0)], np.nan)
+    percentual_imposto = catalogo['impostos'].reindex(estados).to_numpy(dtype=float)
+    preco_com_lucro, preco_final = aplicar_precos(custos[:, 2], percentual_imposto, margens)
+    erro = np.select(
+        [~encontrados, np.isnan(percentual_imposto), np.isnan(margens)],
+        ['Produto não cadastrado', 'Estado não cadastrado', 'Margem inválida'],
+        None
+    )
+    return pd.DataFrame({
+        'Produto': produtos,
+        'Estado': estados,
+        'Percentual_Imposto': percentual_imposto,
+        'Percentual_Lucro': margens,
+        'Custo_Mao_de_Obra': custos[:, 0],
+        'Custo_Materias_Primas': custos[:, 1],
+        'Custo_Total': custos[:, 2],
+        'Preco_com_Lucro': preco_com_lucro,
+        'Preco_Final': preco_final,
+        'Erro': erro
+    })
+
+# Catálogo de cada processo do pool, recebido uma única vez no inicializador
+_catalogo = None
+
+def _iniciar_processo(catalogo):
+    global _catalogo
+    _catalogo = catalogo
+
+def _precificar_lote(pedidos):
+    return precificar_pedidos(pedidos, _catalogo)
+
+def formato_do_arquivo(caminho, padrao='jsonl'):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == '.csv':
+        return 'csv'
+    if extensao in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return padrao
+
+def ler_pedidos(entrada, formato, tamanho_lote=TAMANHO_LOTE):
+    if formato == 'csv':
+        return pd.read_csv(entrada, chunksize=tamanho_lote, dtype={'Produto': str, 'Estado': str}, keep_default_na=False)
+    return pd.read_json(entrada, lines=True, chunksize=tamanho_lote, dtype=False)
+
+def escrever_resultados(resultados, saida, formato, primeiro_lote):
+    if formato == 'csv':
+        resultados.to_csv(saida, index=False, header=primeiro_lote)
+        return
+    # json.dumps usa a representação exata dos floats; to_json arredondaria as casas decimais
+    registros = resultados.astype(object).where(resultados.notna(), None).to_dict('records')
+    saida.write(''.join(json.dumps(registro, ensure_ascii=False) + '\n' for registro in registros))
+
+def precificar_arquivo(entrada, saida, formato_entrada='jsonl', formato_saida='jsonl', processos=None,
+                       tamanho_lote=TAMANHO_LOTE, diretorio='.', em=None):
+    if armazenamento.BACKEND == 'sqlite' and em is None:
+        catalogo = montar_catalogo_sqlite()
+    else:
+        catalogo = montar_catalogo(carregar_motor(diretorio), instante(em))
+    lotes = ler_pedidos(entrada, formato_entrada, tamanho_lote)
+    processos = processos or os.cpu_count() or 1
+    total = 0
+    if processos == 1:
+        for lote in lotes:
+            escrever_resultados(precificar_pedidos(lote, catalogo), saida, formato_saida, total == 0)
+            total += len(lote)
+        return total
+    with ProcessPoolExecutor(processos, initializer=_iniciar_processo, initargs=(catalogo,)) as executor:
+        # Poucos lotes em andamento por vez mantêm a memória limitada; a saída segue a ordem da entrada
+        pendentes = deque()
+        for lote in lotes:
+            pendentes.append(executor.submit(_precificar_lote, lote))
+            if len(pendentes) >= 2 * processos:
+                resultados = pendentes.popleft().result()
+                escrever_resultados(resultados, saida, formato_saida, total == 0)
+                total += len(resultados)
+        while pendentes:
+            resultados = pendentes.popleft().result()
+            escrever_resultados(resultados, saida, formato_saida, total == 0)
+            total += len(resultados)
+    return total
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precificação em lote de pedidos (produto, estado, margem)')
+    parser.add_argument('entrada', help='Arquivo CSV ou JSONL com as colunas Produto, Estado e Margem (- para stdin)')
+    parser.add_argument('saida', help='Arquivo CSV ou JSONL de saída (- para stdout)')
+    parser.add_argument('--processos', type=int, default=None, help='Processos de trabalho (padrão: número de CPUs)')
+    parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Pedidos por lote')
+    parser.add_argument('--diretorio', default='.', help='Diretório com os arquivos JSON do catálogo')
+    parser.add_argument('--data', default=None, help='Data de referência dos custos e impostos (AAAA-MM-DD; padrão: atuais)')
+    argumentos = parser.parse_args()
+    entrada = sys.stdin if argumentos.entrada == '-' else argumentos.entrada
+    saida = sys.stdout if argumentos.saida == '-' else open(argumentos.saida, 'w', encoding='utf-8', newline='')
+    try:
+        total = precificar_arquivo(
+            entrada,
+            saida,
+            formato_do_arquivo(argumentos.entrada),
+            formato_do_arquivo(argumentos.saida),
+            argumentos.processos,
+            argumentos.lote,
+            argumentos.diretorio,
+            argumentos.data
+        )
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    print(f'{total} pedidos precificados', file=sys.stderr)
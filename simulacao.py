@@ -0,0 +1,134 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+import metricas
+from composicao import expandir
+from precificacao import MotorDePrecificacao, aplicar_precos, carregar_motor
+
+CENARIOS = 10_000
+# Cenários sorteados de cada vez; com a memória máxima, limita o tamanho das matrizes intermediárias
+LOTE_CENARIOS = 1_000
+MEMORIA_MAXIMA = 256 * 1024 ** 2
+PERCENTIS = (5, 50, 95)
+# Desvio padrão de cada custo, em percentual do custo atual, quando não há faixa definida
+VOLATILIDADE = 10.0
+COLUNAS_CUSTO = {'Maos_de_Obra': 'Custo_Hora', 'Materias_Primas': 'Custo_Unidade'}
+
+class Simulacao:
+    def __init__(self, motor, indices=None, volatilidade=VOLATILIDADE, faixas=None):
+        # volatilidade: percentual único ou {coluna de BOM: percentual}; faixas: {coluna de BOM: {nome: (mínimo, máximo)}}
+        self.motor = motor
+        self.custos = motor.custos(indices)
+        produto = motor.produto
+        componentes = {'Maos_de_Obra': motor.mao_de_obra, 'Materias_Primas': motor.materia_prima}
+        expandidas = expandir({coluna: produto.boms[coluna] for coluna in componentes}, produto.boms['Produtos'], produto.data['Nome'])
+        posicoes = self.custos.index.to_numpy()
+        # Produto selecionado -> posição local; os demais ficam com -1 e seus itens são descartados
+        local = np.full(len(produto.data), -1, dtype=np.int64)
+        local[posicoes] = np.arange(len(posicoes))
+
+        # Todos os componentes num único espaço: as mãos de obra primeiro, depois as matérias-primas
+        linhas, codigos, quantidades, base, desvio, minimo, maximo = [], [], [], [], [], [], []
+        deslocamento = 0
+        for coluna, entidade in componentes.items():
+            linhas_coluna, codigos_coluna, quantidades_coluna = expandidas[coluna]
+            nomes = produto.boms[coluna].nomes
+            custos = MotorDePrecificacao._custos_por_nome(entidade.data, 'Nome', COLUNAS_CUSTO[coluna]).reindex(nomes)
+            percentual = volatilidade.get(coluna, VOLATILIDADE) if isinstance(volatilidade, dict) else volatilidade
+            faixa = (faixas or {}).get(coluna, {})
+            selecionadas = local[linhas_coluna] >= 0
+            linhas.append(local[linhas_coluna[selecionadas]])
+            codigos.append(codigos_coluna[selecionadas] + deslocamento)
+            quantidades.append(quantidades_coluna[selecionadas])
+            base.append(custos.to_numpy(dtype=float))
+            desvio.append(np.abs(base[-1]) * percentual / 100)
+            minimo.append(np.array([faixa.get(nome, (np.nan, np.nan))[0] for nome in nomes], dtype=float))
+            maximo.append(np.array([faixa.get(nome, (np.nan, np.nan))[1] for nome in nomes], dtype=float))
+            deslocamento += len(nomes)
+        # Itens agrupados por produto selecionado, na ordem dos índices pedidos
+        linhas = np.concatenate(linhas)
+        ordem = np.argsort(linhas, kind='stable')
+        self.codigos = np.concatenate(codigos)[ordem]
+        self.quantidades = np.concatenate(quantidades)[ordem]
+        self.tamanhos = np.bincount(linhas, minlength=len(posicoes))
+        # Componentes sem cadastro deixam o produto indefinido; o sorteio deles é descartado
+        self.base = np.nan_to_num(np.concatenate(base))
+        self.desvio = np.nan_to_num(np.concatenate(desvio))
+        self.minimo = np.concatenate(minimo)
+        self.maximo = np.concatenate(maximo)
+
+    def sortear(self, rng, cenarios, componentes):
+        # Normal em torno do custo atual ou uniforme na faixa; custos negativos viram zero
+        sorteio = rng.normal(self.base[componentes], self.desvio[componentes], (cenarios, len(componentes)))
+        com_faixa = ~np.isnan(self.minimo[componentes])
+        if com_faixa.any():
+            faixas = componentes[com_faixa]
+            sorteio[:, com_faixa] = rng.uniform(self.minimo[faixas], self.maximo[faixas], (cenarios, len(faixas)))
+        return np.maximum(sorteio, 0.0)
+
+    def _blocos(self, cenarios, memoria):
+        # Produtos em blocos: por produto, as amostras (e a cópia do np.percentile), a coluna do lote
+        # de cenários e a coluna da matriz componentes x produtos cabem na memória máxima
+        por_produto = 8 * (2 * cenarios + LOTE_CENARIOS + len(self.base))
+        tamanho = max(1, (memoria - 8 * LOTE_CENARIOS * len(self.base)) // por_produto)
+        return [(inicio, min(inicio + tamanho, len(self.tamanhos))) for inicio in range(0, len(self.tamanhos), tamanho)]
+
+    def percentis_de_custo(self, cenarios=CENARIOS, percentis=PERCENTIS, semente=None, memoria=MEMORIA_MAXIMA):
+        # Cada bloco de produtos usa os sorteios seguintes do gerador: com a mesma semente e a mesma
+        # memória máxima, o resultado se repete
+        rng = np.random.default_rng(semente)
+        inicios_itens = np.concatenate([[0], np.cumsum(self.tamanhos)])
+        resultado = np.full((len(percentis), len(self.tamanhos)), np.nan)
+        for inicio, fim in self._blocos(cenarios, memoria):
+            itens = slice(inicios_itens[inicio], inicios_itens[fim])
+            # Só os componentes usados pelos produtos do bloco são sorteados
+            componentes, codigos = np.unique(self.codigos[itens], return_inverse=True)
+            # Quantidade de cada componente em cada produto do bloco; produtos sem itens custam zero
+            matriz = np.zeros((len(componentes), fim - inicio))
+            np.add.at(matriz, (codigos, np.repeat(np.arange(fim - inicio), self.tamanhos[inicio:fim])), self.quantidades[itens])
+            amostras = np.empty((cenarios, fim - inicio))
+            for primeiro in range(0, cenarios, LOTE_CENARIOS):
+                lote = min(LOTE_CENARIOS, cenarios - primeiro)
+                amostras[primeiro:primeiro + lote] = self.sortear(rng, lote, componentes) @ matriz
+            resultado[:, inicio:fim] = np.percentile(amostras, percentis, axis=0)
+        # Componente ou subconjunto sem cadastro: custo indefinido, como no cálculo determinístico
+        resultado[:, np.isnan(self.custos['Custo_Total'].to_numpy())] = np.nan
+        return resultado
+
+@metricas.instrumentar('simulacao.simular')
+def simular(motor, estados=None, margem=0.0, indices=None, cenarios=CENARIOS, volatilidade=VOLATILIDADE, faixas=None,
+            percentis=PERCENTIS, semente=None, memoria=MEMORIA_MAXIMA):
+    simulacao = Simulacao(motor, indices, volatilidade, faixas)
+    custos = simulacao.percentis_de_custo(cenarios, percentis, semente, memoria)
+    precos = motor.calcular(estados, [margem], custos=simulacao.custos)
+    por_produto = len(precos) // max(len(simulacao.custos), 1)
+    # O preço é o custo multiplicado por fatores positivos, então o percentil do preço em cada
+    # estado é o preço do percentil do custo: a simulação não precisa ser repetida por estado
+    for percentil, custo in zip(percentis, custos):
+        _, precos[f'Preco_P{percentil:g}'] = aplicar_precos(
+            np.repeat(custo, por_produto), precos['Percentual_Imposto'].to_numpy(), precos['Percentual_Lucro'].to_numpy()
+        )
+    return precos
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sensibilidade dos preços à variação dos custos (Monte Carlo)')
+    parser.add_argument('saida', help='Arquivo CSV de saída (- para stdout)')
+    parser.add_argument('--produtos', nargs='+', help='Nomes dos produtos (padrão: todos)')
+    parser.add_argument('--estados', nargs='+', help='Estados (padrão: todos)')
+    parser.add_argument('--margem', type=float, default=0.0, help='Percentual de lucro')
+    parser.add_argument('--cenarios', type=int, default=CENARIOS)
+    parser.add_argument('--volatilidade', type=float, default=VOLATILIDADE, help='Desvio padrão em %% do custo atual')
+    parser.add_argument('--percentis', type=float, nargs='+', default=list(PERCENTIS))
+    parser.add_argument('--semente', type=int, default=None)
+    parser.add_argument('--memoria', type=int, default=MEMORIA_MAXIMA // 1024 ** 2, help='Memória máxima em MB')
+    parser.add_argument('--diretorio', default='.', help='Diretório com os arquivos JSON do catálogo')
+    argumentos = parser.parse_args()
+    motor = carregar_motor(argumentos.diretorio)
+    indices = None
+    if argumentos.produtos:
+        nomes = pd.Index(motor.produto.data['Nome'])
+        indices = motor.produto.data.index[nomes.isin(argumentos.produtos)]
+    resultado = simular(motor, argumentos.estados, argumentos.margem, indices, argumentos.cenarios, argumentos.volatilidade,
+                        percentis=argumentos.percentis, semente=argumentos.semente, memoria=argumentos.memoria * 1024 ** 2)
+    resultado.to_csv(sys.stdout if argumentos.saida == '-' else argumentos.saida, index=False)
@@ -1,162 +1,762 @@
+import bisect
 import streamlit as st
 import pandas as pd
-import json
-import os
+import threading
+from datetime import date, timedelta
+import numpy as np
 import plotly.express as px
+from armazenamento import ESQUEMAS, criar_armazenamento, novo_id
+from busca import IndiceDeBusca
+from composicao import CicloNaComposicao, alcanca, custos_acumulados, separar_composicoes
+from historico import HistoricoDeCustos, instante
+import metricas
+from importacao import importar
+from precificacao import MotorDePrecificacao
+from simulacao import CENARIOS, PERCENTIS, VOLATILIDADE, simular
 
-# Classes para as entidades
-class MaoDeObra:
-    def __init__(self):
-        self.file_path = 'maos_de_obra.json'
-        self.data = self.load_data()
+# Limites de renderização: tabelas paginadas e gráficos agregados no servidor
+LINHAS_POR_PAGINA = [25, 50, 100, 250]
+ITENS_GRAFICO = 15
+MAXIMO_ITENS_GRAFICO = 50
+FAIXAS_HISTOGRAMA = 20
+
+def tabela_paginada(data, coluna_nome, chave, detalhar=None):
+    # Só a página visível é serializada para o navegador
+    filtro = st.text_input('Filtrar por nome', key=f'{chave}_filtro')
+    if filtro:
+        data = data[data[coluna_nome].str.contains(filtro, case=False, regex=False, na=False)]
+    col1, col2 = st.columns(2)
+    with col1:
+        tamanho = st.selectbox('Linhas por página', LINHAS_POR_PAGINA, key=f'{chave}_tamanho')
+    paginas = max(1, -(-len(data) // tamanho))
+    if st.session_state.get(f'{chave}_pagina', 1) > paginas:
+        st.session_state[f'{chave}_pagina'] = paginas
+    with col2:
+        pagina = st.number_input('Página', min_value=1, max_value=paginas, step=1, key=f'{chave}_pagina')
+    inicio = (pagina - 1) * tamanho
+    visiveis = data.iloc[inicio:inicio + tamanho]
+    if detalhar is not None:
+        # Colunas caras de montar, como as BOMs, só para as linhas visíveis
+        visiveis = detalhar(visiveis)
+    with metricas.medir('tabela_paginada.renderizar'):
+        st.dataframe(visiveis)
+    metricas.contar('tabela_paginada.linhas', len(visiveis))
+    st.caption(f'Mostrando {min(inicio + 1, len(data))}–{min(inicio + tamanho, len(data))} de {len(data)} registros')
+
+@metricas.instrumentar('grafico.top')
+def grafico_top(data, coluna_nome, coluna_valor, titulo, itens):
+    return px.bar(data.nlargest(itens, coluna_valor), x=coluna_nome, y=coluna_valor, title=titulo)
+
+@metricas.instrumentar('grafico.histograma')
+def grafico_histograma(valores, titulo, rotulo):
+    valores = np.asarray(valores, dtype=float)
+    valores = valores[~np.isnan(valores)]
+    contagens, limites = np.histogram(valores, bins=FAIXAS_HISTOGRAMA)
+    faixas = pd.DataFrame({
+        rotulo: [f'{inicio:.2f} – {fim:.2f}' for inicio, fim in zip(limites[:-1], limites[1:])],
+        'Quantidade': contagens
+    })
+    return px.bar(faixas, x=rotulo, y='Quantidade', title=titulo)
+
+class RegistroNaoEncontrado(KeyError):
+    def __str__(self):
+        return self.args[0]
+
+# Nome -> posições das linhas. Cada linha recebe na inserção uma chave crescente, e as chaves das
+# linhas atuais ficam num array ordenado: a posição de uma linha é a da sua chave nesse array. Assim
+# uma remoção só tira uma chave do array, sem corrigir as posições das linhas seguintes.
+class IndicePorNome:
+    def __init__(self, entidade):
+        self.entidade = entidade
+        self.chaves = np.zeros(0, dtype=np.int64)
+        self.chaves_por_nome = {}
+        self.proxima = 0
+
+    def reconstruir(self, nomes):
+        self.chaves = np.arange(len(nomes), dtype=np.int64)
+        self.chaves_por_nome = {}
+        for chave, nome in enumerate(nomes):
+            self.chaves_por_nome.setdefault(nome, []).append(chave)
+        self.proxima = len(nomes)
+
+    def adicionar(self, nome):
+        # As linhas novas sempre entram no fim: só recebem as próximas chaves
+        self.adicionar_lote([nome])
+
+    def adicionar_lote(self, nomes):
+        chaves = range(self.proxima, self.proxima + len(nomes))
+        for chave, nome in zip(chaves, nomes):
+            self.chaves_por_nome.setdefault(nome, []).append(chave)
+        self.chaves = np.concatenate([self.chaves, np.asarray(chaves, dtype=np.int64)])
+        self.proxima += len(nomes)
+
+    def _descartar(self, nome, chave):
+        chaves = self.chaves_por_nome[nome]
+        chaves.remove(chave)
+        if not chaves:
+            del self.chaves_por_nome[nome]
+
+    def renomear(self, index, nome_antigo, nome_novo):
+        if nome_antigo == nome_novo:
+            return
+        chave = int(self.chaves[index])
+        self._descartar(nome_antigo, chave)
+        bisect.insort(self.chaves_por_nome.setdefault(nome_novo, []), chave)
+
+    def remover(self, index, nome):
+        self._descartar(nome, int(self.chaves[index]))
+        self.chaves = np.delete(self.chaves, index)
+
+    def __iter__(self):
+        return iter(self.chaves_por_nome)
+
+    def __contains__(self, nome):
+        return nome in self.chaves_por_nome
+
+    def __getitem__(self, nome):
+        # Em nomes duplicados vale a primeira ocorrência
+        if nome not in self.chaves_por_nome:
+            raise RegistroNaoEncontrado(f"{self.entidade} '{nome}' não cadastrado(a).")
+        return int(np.searchsorted(self.chaves, self.chaves_por_nome[nome][0]))
+
+# Base das entidades: armazenamento, índices, histórico e escrita concorrente. As colunas de BOM
+# (só em Produto) ficam fora do DataFrame, em arrays CSR; as demais colunas do esquema ficam em self.data.
+# Só os escritores pegam self.trava. Eles publicam (data, boms, versao) numa única atribuição de
+# self.instantaneo, que os leitores usam sem trava, sem esperar por gravação, fsync ou compactação.
+class Entidade:
+    def __init__(self, esquema, rotulo):
+        self.esquema = ESQUEMAS[esquema]
+        self.file_path = self.esquema.arquivo
+        self.armazenamento = criar_armazenamento(self.esquema, self.file_path)
+        self.coluna_nome = self.esquema.coluna_nome
+        self.colunas = [coluna for coluna in self.esquema.colunas if coluna not in self.esquema.colunas_bom]
+        self.indice = IndicePorNome(rotulo)
+        # Ids estáveis -> posição; as posições mudam quando outra linha é removida
+        self.indice_id = IndicePorNome('Registro')
+        self.trava = threading.RLock()
+        self.instantaneo = (self.esquema.vazio(), {}, 0)
+        # Funções chamadas após cada alteração: ouvinte(operacao, index, registro_anterior)
+        self.ouvintes = []
+        self.historico = HistoricoDeCustos()
+        self.recarregar()
+    
+    data = property(lambda self: self.instantaneo[0])
+    boms = property(lambda self: self.instantaneo[1])
+    versao = property(lambda self: self.instantaneo[2])
+    
+    def _publicar(self, data, boms=None):
+        # Os DataFrames e as Composicoes publicados nunca são alterados depois
+        self.instantaneo = (data, self.boms if boms is None else boms, self.versao + 1)
     
+    @metricas.instrumentar_metodo('load_data')
     def load_data(self):
-        if os.path.exists(self.file_path):
-            data = pd.read_json(self.file_path)
-            data['Custo_Hora'] = data['Custo_Hora'].astype(float)
-            return data
-        else:
-            return pd.DataFrame(columns=['Nome', 'Custo_Hora'])
+        return self.armazenamento.carregar()
     
-    def save_data(self):
-        self.data.to_json(self.file_path, orient='records', indent=4)
+    def recarregar(self):
+        with self.trava:
+            # A assinatura é lida antes para que uma gravação concorrente force nova recarga
+            self.assinatura = self.armazenamento.assinatura()
+            data, boms = separar_composicoes(self.load_data(), self.esquema.colunas_bom)
+            self.indice.reconstruir(data[self.coluna_nome])
+            self.indice_id.reconstruir(data['ID'])
+            if self.esquema.coluna_historico:
+                self.historico = HistoricoDeCustos.de_tabela(self.armazenamento.carregar_historico())
+            self._publicar(data, boms)
     
-    def adicionar(self, nome, custo_hora):
-        novo_registro = pd.DataFrame({'Nome': [nome], 'Custo_Hora': [custo_hora]})
-        self.data = pd.concat([self.data, novo_registro], ignore_index=True)
-        self.save_data()
+    def posicao(self, id_registro):
+        return self.indice_id[id_registro]
     
-    def atualizar(self, index, nome, custo_hora):
-        self.data.at[index, 'Nome'] = nome
-        self.data.at[index, 'Custo_Hora'] = custo_hora
-        self.save_data()
+    def valor_de(self, nome):
+        # Custo ou percentual pelo nome, em O(1) pelo índice; RegistroNaoEncontrado se não houver. Os
+        # índices mudam fora do instantâneo: se a posição não for mais desse nome, um escritor está no
+        # meio de uma alteração e a consulta é refeita com a trava
+        data = self.data
+        posicao = self.indice[nome]
+        if posicao >= len(data) or data.at[posicao, self.coluna_nome] != nome:
+            with self.trava:
+                data, posicao = self.data, self.indice[nome]
+        return float(data.at[posicao, self.esquema.coluna_historico])
     
-    def remover(self, index):
-        self.data = self.data.drop(index).reset_index(drop=True)
-        self.save_data()
+    def confirmar_versao(self):
+        # Compare-and-swap com a trava de escrita: se o armazenamento mudou desde a nossa última
+        # leitura ou gravação, outro processo gravou e a alteração é aplicada sobre os dados dele
+        if self.armazenamento.assinatura() != self.assinatura:
+            self.recarregar()
     
-    def visualizar(self):
-        st.dataframe(self.data.style.set_properties(**{'text-align': 'left'}))
-
-class MateriaPrima:
-    def __init__(self):
-        self.file_path = 'materias_primas.json'
-        self.data = self.load_data()
+    def sincronizar(self):
+        # Recarga pedida por um leitor. Com a trava ocupada, um escritor deste processo já confere a
+        # versão antes de gravar e vai publicar o resultado: o leitor segue com o instantâneo atual
+        if self.armazenamento.assinatura() == self.assinatura or not self.trava.acquire(blocking=False):
+            return
+        try:
+            self.confirmar_versao()
+        finally:
+            self.trava.release()
     
-    def load_data(self):
-        if os.path.exists(self.file_path):
-            data = pd.read_json(self.file_path)
-            data['Custo_Unidade'] = data['Custo_Unidade'].astype(float)
+    def registro(self, index):
+        data, boms, _ = self.instantaneo
+        registro = data.loc[index].to_dict()
+        for coluna, composicoes in boms.items():
+            registro[coluna] = composicoes.linha(index)
+        return registro
+    
+    def exportar(self):
+        data, boms, _ = self.instantaneo
+        if not boms:
             return data
-        else:
-            return pd.DataFrame(columns=['Nome', 'Custo_Unidade'])
+        # Os dicionários só são remontados para gravar o snapshot completo
+        colunas = {coluna: boms[coluna].dicionarios() if coluna in boms else data[coluna] for coluna in self.esquema.colunas}
+        colunas['ID'] = data['ID']
+        return pd.DataFrame(colunas)
     
+    @metricas.instrumentar_metodo('save_data')
     def save_data(self):
-        self.data.to_json(self.file_path, orient='records', indent=4)
+        with self.trava:
+            self.armazenamento.salvar(self.exportar())
+            self.assinatura = self.armazenamento.assinatura()
+    
+    def registrar_historico(self, registros):
+        self.armazenamento.registrar_historico(registros)
+        self.historico = self.historico.anexar(registros)
+    
+    def _registrar_valor(self, id_registro, registro, anterior=None):
+        # Nova vigência do valor com histórico (custo ou percentual), se houver
+        coluna = self.esquema.coluna_historico
+        if coluna:
+            self.registrar_historico(self.historico.alteracoes(
+                id_registro, registro[coluna], None if anterior is None else anterior[coluna], nome=registro[self.coluna_nome]
+            ))
+    
+    @metricas.instrumentar_metodo('persistir')
+    def persistir(self, operacao, **argumentos):
+        self.armazenamento.registrar(operacao, argumentos, self.exportar, len(self.data))
+        self.assinatura = self.armazenamento.assinatura()
+    
+    def notificar(self, operacao, index, anterior=None):
+        # Chamado depois do commit, ainda com a trava do processo: um ouvinte pode gravar em outra
+        # entidade (a renomeação de um componente grava os produtos), o que no SQLite esperaria
+        # pela transação ainda aberta desta
+        for ouvinte in self.ouvintes:
+            ouvinte(operacao, index, anterior)
+    
+    def _verificar(self, nomes, registro):
+        # Validação feita com a trava, antes de gravar um registro novo ou alterado
+        pass
+    
+    def _verificar_lote(self, novos):
+        pass
+    
+    def _argumentos(self, registro):
+        # Os argumentos das alterações usam o nome da coluna em minúsculas (nome, custo_hora, ...)
+        return {coluna.lower(): registro[coluna] for coluna in self.esquema.colunas}
     
-    def adicionar(self, nome, custo_unidade):
-        novo_registro = pd.DataFrame({'Nome': [nome], 'Custo_Unidade': [custo_unidade]})
-        self.data = pd.concat([self.data, novo_registro], ignore_index=True)
-        self.save_data()
+    def _adicionar(self, registro, id_registro):
+        boms = {coluna: composicoes.anexar([registro[coluna]]) for coluna, composicoes in self.boms.items()}
+        colunas = {coluna: [registro[coluna]] for coluna in self.colunas}
+        colunas['ID'] = [id_registro]
+        data = pd.concat([self.data, pd.DataFrame(colunas)], ignore_index=True)
+        self.indice.adicionar(registro[self.coluna_nome])
+        self.indice_id.adicionar(id_registro)
+        self._publicar(data, boms)
     
-    def atualizar(self, index, nome, custo_unidade):
-        self.data.at[index, 'Nome'] = nome
-        self.data.at[index, 'Custo_Unidade'] = custo_unidade
-        self.save_data()
+    @metricas.instrumentar_metodo('adicionar')
+    def adicionar(self, *valores):
+        # Valores na ordem das colunas do esquema
+        registro = dict(zip(self.esquema.colunas, valores))
+        with self.trava:
+            with self.armazenamento.bloquear():
+                self.confirmar_versao()
+                self._verificar([registro[self.coluna_nome]], registro)
+                id_registro = novo_id(self.data)
+                self._adicionar(registro, id_registro)
+                self._registrar_valor(id_registro, registro)
+                self.persistir('adicionar', id=id_registro, **self._argumentos(registro))
+            self.notificar('adicionar', len(self.data) - 1)
+    
+    def _atualizar(self, index, registro):
+        # Cópia na escrita: outras sessões podem estar lendo o DataFrame atual
+        data = self.data.copy()
+        self.indice.renomear(index, data.at[index, self.coluna_nome], registro[self.coluna_nome])
+        for coluna in self.colunas:
+            data.at[index, coluna] = registro[coluna]
+        self._publicar(data, {coluna: composicoes.substituir(index, registro[coluna]) for coluna, composicoes in self.boms.items()})
+    
+    def atualizar(self, index, *valores):
+        with self.trava:
+            return self.atualizar_registro(self.data.at[index, 'ID'], *valores)
+    
+    @metricas.instrumentar_metodo('atualizar')
+    def atualizar_registro(self, id_registro, *valores):
+        # Devolve o registro anterior
+        registro = dict(zip(self.esquema.colunas, valores))
+        with self.trava:
+            with self.armazenamento.bloquear():
+                self.confirmar_versao()
+                index = self.posicao(id_registro)
+                anterior = self.registro(index)
+                # Colunas de BOM sem valor mantêm a BOM atual
+                for coluna in self.boms:
+                    if registro.get(coluna) is None:
+                        registro[coluna] = anterior[coluna]
+                # O nome antigo também conta: os registros que o usam passam a usar o novo nome
+                self._verificar([registro[self.coluna_nome], anterior[self.coluna_nome]], registro)
+                self._atualizar(index, registro)
+                self._registrar_valor(id_registro, registro, anterior)
+                self.persistir('atualizar', id=int(id_registro), **self._argumentos(registro))
+            self.notificar('atualizar', index, anterior)
+            return anterior
+    
+    def _remover(self, index):
+        self.indice.remover(index, self.data.at[index, self.coluna_nome])
+        self.indice_id.remover(index, self.data.at[index, 'ID'])
+        self._publicar(self.data.drop(index).reset_index(drop=True),
+                       {coluna: composicoes.remover(index) for coluna, composicoes in self.boms.items()})
     
     def remover(self, index):
-        self.data = self.data.drop(index).reset_index(drop=True)
-        self.save_data()
+        with self.trava:
+            self.remover_registro(self.data.at[index, 'ID'])
     
-    def visualizar(self):
-        st.dataframe(self.data.style.set_properties(**{'text-align': 'left'}))
+    @metricas.instrumentar_metodo('remover')
+    def remover_registro(self, id_registro):
+        with self.trava:
+            with self.armazenamento.bloquear():
+                self.confirmar_versao()
+                index = self.posicao(id_registro)
+                anterior = self.registro(index)
+                self._remover(index)
+                if self.esquema.coluna_historico:
+                    self.registrar_historico(self.historico.remocoes(
+                        id_registro, anterior[self.esquema.coluna_historico], anterior[self.coluna_nome]
+                    ))
+                self.persistir('remover', id=int(id_registro))
+            self.notificar('remover', index, anterior)
+    
+    @metricas.instrumentar_metodo('importar')
+    def importar(self, novos):
+        with self.trava, self.armazenamento.bloquear():
+            self.confirmar_versao()
+            self._verificar_lote(novos)
+            primeiro_id = novo_id(self.data)
+            novos = novos.assign(ID=range(primeiro_id, primeiro_id + len(novos)))
+            self._publicar(pd.concat([self.data, novos[self.colunas + ['ID']]], ignore_index=True),
+                           {coluna: composicoes.anexar(novos[coluna]) for coluna, composicoes in self.boms.items()})
+            self.indice.adicionar_lote(novos[self.coluna_nome])
+            self.indice_id.adicionar_lote(novos['ID'])
+            if self.esquema.coluna_historico:
+                self.registrar_historico(self.historico.inclusoes(
+                    novos['ID'], novos[self.esquema.coluna_historico], novos[self.coluna_nome]
+                ))
+            self.armazenamento.importar(novos, self.exportar)
+            self.assinatura = self.armazenamento.assinatura()
 
-class Imposto:
+class MaoDeObra(Entidade):
+    # adicionar(nome, custo_hora), atualizar_registro(id, nome, custo_hora)
     def __init__(self):
-        self.file_path = 'impostos.json'
-        self.data = self.load_data()
+        super().__init__('maos_de_obra', 'Mão de Obra')
     
-    def load_data(self):
-        if os.path.exists(self.file_path):
-            data = pd.read_json(self.file_path)
-            data['Percentual'] = data['Percentual'].astype(float)
-            return data
-        else:
-            return pd.DataFrame(columns=['Estado', 'Percentual'])
+    def custo_de(self, nome):
+        return self.valor_de(nome)
     
-    def save_data(self):
-        self.data.to_json(self.file_path, orient='records', indent=4)
+    def visualizar(self):
+        tabela_paginada(self.data, 'Nome', 'mao_de_obra')
+
+class MateriaPrima(Entidade):
+    # adicionar(nome, custo_unidade), atualizar_registro(id, nome, custo_unidade)
+    def __init__(self):
+        super().__init__('materias_primas', 'Matéria-Prima')
     
-    def adicionar(self, estado, percentual):
-        novo_registro = pd.DataFrame({'Estado': [estado], 'Percentual': [percentual]})
-        self.data = pd.concat([self.data, novo_registro], ignore_index=True)
-        self.save_data()
+    def custo_de(self, nome):
+        return self.valor_de(nome)
     
-    def atualizar(self, index, estado, percentual):
-        self.data.at[index, 'Estado'] = estado
-        self.data.at[index, 'Percentual'] = percentual
-        self.save_data()
+    def visualizar(self):
+        tabela_paginada(self.data, 'Nome', 'materias_primas')
+
+class Imposto(Entidade):
+    # adicionar(estado, percentual), atualizar_registro(id, estado, percentual)
+    def __init__(self):
+        super().__init__('impostos', 'Estado')
     
-    def remover(self, index):
-        self.data = self.data.drop(index).reset_index(drop=True)
-        self.save_data()
+    def percentual_de(self, estado):
+        return self.valor_de(estado)
     
     def visualizar(self):
-        st.dataframe(self.data.style.set_properties(**{'text-align': 'left'}))
+        tabela_paginada(self.data, 'Estado', 'impostos')
 
-class Produto:
+class Produto(Entidade):
     def __init__(self):
-        self.file_path = 'produtos.json'
-        self.data = self.load_data()
+        super().__init__('produtos', 'Produto')
     
-    def load_data(self):
-        if os.path.exists(self.file_path):
-            # Carregar dados e converter colunas de dicionários
-            data = pd.read_json(self.file_path)
-            if not data.empty:
-                data['Maos_de_Obra'] = data['Maos_de_Obra'].apply(lambda x: json.loads(x))
-                data['Materias_Primas'] = data['Materias_Primas'].apply(lambda x: json.loads(x))
-            else:
-                data = pd.DataFrame(columns=['Nome', 'Maos_de_Obra', 'Materias_Primas'])
-            return data
-        else:
-            return pd.DataFrame(columns=['Nome', 'Maos_de_Obra', 'Materias_Primas'])
+    def verificar_ciclo(self, nomes, produtos):
+        # Há ciclo se, descendo pelos subconjuntos da nova BOM, chegamos ao próprio produto
+        if alcanca(self.boms['Produtos'], self.indice, produtos, nomes):
+            raise CicloNaComposicao(f"O produto '{nomes[0]}' não pode ser subconjunto de si mesmo, direta ou indiretamente.")
     
-    def save_data(self):
-        # Converter colunas de dicionários para strings JSON
-        data_to_save = self.data.copy()
-        data_to_save['Maos_de_Obra'] = data_to_save['Maos_de_Obra'].apply(lambda x: json.dumps(x))
-        data_to_save['Materias_Primas'] = data_to_save['Materias_Primas'].apply(lambda x: json.dumps(x))
-        data_to_save.to_json(self.file_path, orient='records', indent=4)
-    
-    def adicionar(self, nome, maos_de_obra, materias_primas):
-        novo_registro = pd.DataFrame({
-            'Nome': [nome],
-            'Maos_de_Obra': [maos_de_obra],
-            'Materias_Primas': [materias_primas]
-        })
-        self.data = pd.concat([self.data, novo_registro], ignore_index=True)
-        self.save_data()
+    def _verificar(self, nomes, registro):
+        self.verificar_ciclo(nomes, registro['Produtos'])
     
-    def atualizar(self, index, nome, maos_de_obra, materias_primas):
-        self.data.at[index, 'Nome'] = nome
-        self.data.at[index, 'Maos_de_Obra'] = maos_de_obra
-        self.data.at[index, 'Materias_Primas'] = materias_primas
-        self.save_data()
+    def _verificar_lote(self, novos):
+        for nome, produtos in zip(novos['Nome'], novos['Produtos']):
+            self.verificar_ciclo([nome], produtos)
     
-    def remover(self, index):
-        self.data = self.data.drop(index).reset_index(drop=True)
-        self.save_data()
+    def adicionar(self, nome, maos_de_obra, materias_primas, produtos=None):
+        super().adicionar(nome, maos_de_obra, materias_primas, produtos or {})
+    
+    def atualizar_registro(self, id_registro, nome, maos_de_obra, materias_primas, produtos=None):
+        # Sem produtos, os subconjuntos atuais são mantidos
+        with self.trava:
+            anterior = super().atualizar_registro(id_registro, nome, maos_de_obra, materias_primas, produtos)
+            if anterior['Nome'] not in self.indice:
+                # Quem usava o produto como subconjunto passa a usar o novo nome
+                self.renomear_componente('Produtos', anterior['Nome'], nome)
+            return anterior
+    
+    @metricas.instrumentar('Produto.renomear_componente')
+    def renomear_componente(self, coluna, nome_antigo, nome_novo):
+        # Troca o nome em todas as BOMs que o usam com uma única gravação e uma única notificação
+        with self.trava:
+            with self.armazenamento.bloquear():
+                self.confirmar_versao()
+                composicoes, posicoes = self.boms[coluna].renomear(nome_antigo, nome_novo)
+                if not len(posicoes):
+                    return
+                self._publicar(self.data, {**self.boms, coluna: composicoes})
+                self.persistir('renomear_componente', coluna=coluna, nome_antigo=nome_antigo, nome_novo=nome_novo)
+            self.notificar('renomear_componente', posicoes.tolist(), {'coluna': coluna, 'nome_antigo': nome_antigo,
+                                                                      'nome_novo': nome_novo})
+    
+    def detalhar(self, visiveis):
+        colunas = {'Nome': visiveis['Nome']}
+        colunas.update({
+            coluna: [composicoes.linha(posicao) for posicao in visiveis.index] for coluna, composicoes in self.boms.items()
+        })
+        colunas['ID'] = visiveis['ID']
+        return pd.DataFrame(colunas, index=visiveis.index)
     
     def visualizar(self):
-        st.dataframe(self.data.style.set_properties(**{'text-align': 'left'}))
+        tabela_paginada(self.data, 'Nome', 'produtos', self.detalhar)
+
+# Custos por produto materializados, com índice reverso componente -> produtos que o usam
+class CustosMaterializados:
+    def __init__(self, mao_de_obra, materia_prima, produto):
+        self.produto = produto
+        self.componentes = {
+            'Maos_de_Obra': (mao_de_obra, 'Custo_Hora'),
+            'Materias_Primas': (materia_prima, 'Custo_Unidade')
+        }
+        # Nunca pega a trava de uma entidade segurando self.trava: as entidades notificam com a
+        # própria trava e a renomeação de um componente grava produtos (ordem componente -> produto -> custos)
+        self.trava = threading.RLock()
+        for coluna, (entidade, _) in self.componentes.items():
+            # Antes dos demais ouvintes, para que os custos já reflitam o componente quando a
+            # renomeação nas BOMs notificar a alteração dos produtos
+            entidade.ouvintes.insert(
+                0, lambda operacao, index, anterior, coluna=coluna: self._componente_alterado(coluna, operacao, index, anterior)
+            )
+        produto.ouvintes.append(self._produto_alterado)
+        self.reconstruir()
+
+    def _versoes(self):
+        return tuple(entidade.versao for entidade, _ in self.componentes.values()) + (self.produto.versao,)
+
+    def _indexar_dependentes(self):
+        # Nome do componente (ou do subconjunto) -> posições dos produtos que o usam diretamente
+        self.dependentes = {coluna: {} for coluna in self.produto.boms}
+        for coluna, dependentes in self.dependentes.items():
+            composicoes = self.produto.boms[coluna]
+            for posicao, codigo in zip(composicoes.linhas().tolist(), composicoes.codigos.tolist()):
+                dependentes.setdefault(composicoes.nomes[codigo], set()).add(posicao)
+
+    @metricas.instrumentar('CustosMaterializados.reconstruir')
+    def reconstruir(self):
+        with self.trava:
+            # Diretos: só a BOM do próprio produto; custos: já somando os subconjuntos
+            self.diretos = {
+                coluna: self.produto.boms[coluna].custos(
+                    MotorDePrecificacao._custos_por_nome(entidade.data, 'Nome', coluna_custo)
+                )
+                for coluna, (entidade, coluna_custo) in self.componentes.items()
+            }
+            self.custos = custos_acumulados(self.diretos, self.produto.boms['Produtos'], self.produto.data['Nome'])
+            self._indexar_dependentes()
+            self.versoes = self._versoes()
+
+    def _sincronizado(self, entidade_alterada):
+        # Antes do evento as versões devem bater com as nossas; senão perdemos alguma alteração
+        esperadas = tuple(
+            entidade.versao - (entidade is entidade_alterada)
+            for entidade in [entidade for entidade, _ in self.componentes.values()] + [self.produto]
+        )
+        if esperadas != self.versoes:
+            self.reconstruir()
+            return False
+        self.versoes = self._versoes()
+        return True
+
+    def _subprodutos(self, posicao):
+        # Subconjuntos cadastrados; em nomes duplicados vale a primeira ocorrência, como no motor
+        return [
+            (self.produto.indice[nome], quantidade)
+            for nome, quantidade in self.produto.boms['Produtos'].linha(posicao).items() if nome in self.produto.indice
+        ]
+
+    def _custo_acumulado(self, coluna, posicao):
+        custos = self.custos[coluna]
+        total = 0.0
+        for nome, quantidade in self.produto.boms['Produtos'].linha(posicao).items():
+            custo = custos[self.produto.indice[nome]] if nome in self.produto.indice else np.nan
+            total += custo * quantidade
+        return self.diretos[coluna][posicao] + total
+
+    def _ancestrais(self, posicoes):
+        # Os próprios produtos e todos que os usam como subconjunto, direta ou indiretamente
+        nomes = self.produto.data['Nome'].to_numpy()
+        vistos = set(posicoes)
+        pendentes = list(vistos)
+        while pendentes:
+            for pai in self.dependentes['Produtos'].get(nomes[pendentes.pop()], ()):
+                if pai not in vistos:
+                    vistos.add(pai)
+                    pendentes.append(pai)
+        return vistos
+
+    def _ordenar(self, posicoes):
+        # Subconjuntos antes de quem os usa; só os produtos em posicoes são reordenados
+        ordem, estado = [], {}
+        for inicio in posicoes:
+            if inicio in estado:
+                continue
+            estado[inicio] = 'aberto'
+            pilha = [(inicio, iter(self._subprodutos(inicio)))]
+            while pilha:
+                posicao, filhos = pilha[-1]
+                for filho, _ in filhos:
+                    if filho not in posicoes or estado.get(filho) == 'fechado':
+                        continue
+                    if estado.get(filho) == 'aberto':
+                        raise CicloNaComposicao(self.produto.data.at[filho, 'Nome'])
+                    estado[filho] = 'aberto'
+                    pilha.append((filho, iter(self._subprodutos(filho))))
+                    break
+                else:
+                    pilha.pop()
+                    estado[posicao] = 'fechado'
+                    ordem.append(posicao)
+        return ordem
+
+    def _recalcular(self, posicoes, diretos=True):
+        if diretos and len(posicoes):
+            # Só as linhas afetadas, com o mesmo np.bincount do motor: resultados idênticos
+            selecionadas = np.array(sorted(posicoes), dtype=np.int64)
+            for coluna, custos in self.diretos.items():
+                entidade, coluna_custo = self.componentes[coluna]
+                custos[selecionadas] = self.produto.boms[coluna].selecionar(selecionadas).custos(
+                    MotorDePrecificacao._custos_por_nome(entidade.data, 'Nome', coluna_custo)
+                )
+        # A invalidação sobe pela árvore de montagem: cada produto afetado é recalculado uma vez,
+        # depois dos seus subconjuntos
+        afetados = self._ancestrais(posicoes)
+        try:
+            ordem = self._ordenar(afetados)
+        except CicloNaComposicao:
+            # Ciclo gravado por fora da interface: o cálculo completo deixa esses custos indefinidos
+            self.reconstruir()
+            return sorted(afetados)
+        for posicao in ordem:
+            for coluna in self.custos:
+                self.custos[coluna][posicao] = self._custo_acumulado(coluna, posicao)
+        return sorted(afetados)
+
+    def afetados(self, coluna, nome):
+        return sorted(self._ancestrais(self.dependentes[coluna].get(nome, ())))
+
+    def _componente_alterado(self, coluna, operacao, index, anterior):
+        entidade, _ = self.componentes[coluna]
+        nomes = set()
+        if anterior is not None:
+            nomes.add(anterior['Nome'])
+        if operacao != 'remover':
+            nomes.add(entidade.data.at[index, 'Nome'])
+        with self.trava:
+            if not self._sincronizado(entidade):
+                return
+            self._recalcular(set().union(*(self.dependentes[coluna].get(nome, ()) for nome in nomes)))
+            self.versoes = self._versoes()
+
+    def _produto_alterado(self, operacao, index, anterior):
+        with self.trava:
+            self._aplicar_alteracao_produto(operacao, index, anterior)
+
+    def _aplicar_alteracao_produto(self, operacao, index, anterior):
+        if not self._sincronizado(self.produto):
+            return
+        if operacao == 'renomear_componente':
+            dependentes = self.dependentes[anterior['coluna']]
+            dependentes.setdefault(anterior['nome_novo'], set()).update(dependentes.pop(anterior['nome_antigo'], ()))
+            self._recalcular(index)
+            return
+        if operacao == 'remover':
+            # As posições dos produtos seguintes mudam; o índice reverso é refeito
+            for coluna in self.custos:
+                self.diretos[coluna] = np.delete(self.diretos[coluna], index)
+                self.custos[coluna] = np.delete(self.custos[coluna], index)
+            self._indexar_dependentes()
+            # Quem usava o produto removido fica sem o subconjunto
+            self._recalcular(self.dependentes['Produtos'].get(anterior['Nome'], ()), diretos=False)
+            return
+        nome = self.produto.data.at[index, 'Nome']
+        if operacao == 'adicionar':
+            for coluna in self.custos:
+                self.diretos[coluna] = np.append(self.diretos[coluna], np.nan)
+                self.custos[coluna] = np.append(self.custos[coluna], np.nan)
+        else:
+            for coluna, dependentes in self.dependentes.items():
+                for componente in anterior[coluna]:
+                    dependentes.get(componente, set()).discard(index)
+        for coluna, dependentes in self.dependentes.items():
+            for componente in self.produto.boms[coluna].linha(index):
+                dependentes.setdefault(componente, set()).add(index)
+        # Inclui quem já citava o nome do produto, que pode ter acabado de ser cadastrado
+        self._recalcular([index])
+        if anterior is not None and anterior['Nome'] != nome:
+            # Quem usava o nome antigo perdeu o subconjunto (ou passou a usar um homônimo)
+            self._recalcular(self.dependentes['Produtos'].get(anterior['Nome'], ()), diretos=False)
+
+    @metricas.instrumentar('CustosMaterializados.tabela')
+    def tabela(self, indices=None):
+        with self.trava:
+            if self._versoes() != self.versoes:
+                self.reconstruir()
+            produtos = self.produto.data if indices is None else self.produto.data.loc[indices]
+            posicoes = produtos.index.to_numpy()
+            custo_mao_de_obra = self.custos['Maos_de_Obra'][posicoes]
+            custo_materias_primas = self.custos['Materias_Primas'][posicoes]
+        return pd.DataFrame({
+            'Produto': produtos['Nome'].to_numpy(),
+            'Custo_Mao_de_Obra': custo_mao_de_obra,
+            'Custo_Materias_Primas': custo_materias_primas,
+            'Custo_Total': custo_mao_de_obra + custo_materias_primas
+        }, index=produtos.index)
+
+# Repositório único por processo, compartilhado entre reexecuções e sessões do Streamlit
+# Entidade -> (classe, esquema do armazenamento)
+COLUNAS_COMPONENTE = {'mao_de_obra': 'Maos_de_Obra', 'materia_prima': 'Materias_Primas'}
+ENTIDADES = {
+    'mao_de_obra': (MaoDeObra, 'maos_de_obra'),
+    'materia_prima': (MateriaPrima, 'materias_primas'),
+    'imposto': (Imposto, 'impostos'),
+    'produto': (Produto, 'produtos')
+}
+
+class RepositorioCompartilhado:
+    def __init__(self):
+        # Cada entidade só é lida do armazenamento no primeiro acesso
+        self.carregadas = {}
+        self.trava_carga = threading.RLock()
+        # Armazenamentos usados só para contar linhas de entidades ainda não carregadas
+        self.contadores = {}
+        # Índices de busca por entidade: (versão, dados, índice), remontados só quando os dados mudam.
+        # A trava de cada entidade só protege a leitura e a troca do índice; a montagem fica fora dela
+        self.buscas = {}
+        self.travas_buscas = {}
+
+    def _carregar(self, nome):
+        entidade = self.carregadas.get(nome)
+        if entidade is None:
+            with self.trava_carga:
+                if nome not in self.carregadas:
+                    with metricas.medir(f'RepositorioCompartilhado.carregar.{nome}'):
+                        entidade = ENTIDADES[nome][0]()
+                    if nome in COLUNAS_COMPONENTE:
+                        entidade.ouvintes.append(
+                            lambda operacao, index, anterior, entidade=entidade, coluna=COLUNAS_COMPONENTE[nome]:
+                                self._componente_alterado(entidade, coluna, operacao, index, anterior)
+                        )
+                    self.carregadas[nome] = entidade
+                entidade = self.carregadas[nome]
+        return entidade
+
+    def _componente_alterado(self, entidade, coluna, operacao, index, anterior):
+        # Um componente renomeado (sem outro registro com o nome antigo) é renomeado nas BOMs; os
+        # produtos só são carregados quando isso acontece
+        if operacao == 'atualizar':
+            nome = entidade.data.at[index, 'Nome']
+            if nome != anterior['Nome'] and anterior['Nome'] not in entidade.indice:
+                self.produto.renomear_componente(coluna, anterior['Nome'], nome)
+
+    mao_de_obra = property(lambda self: self._carregar('mao_de_obra'))
+    materia_prima = property(lambda self: self._carregar('materia_prima'))
+    imposto = property(lambda self: self._carregar('imposto'))
+    produto = property(lambda self: self._carregar('produto'))
+
+    @property
+    def custos(self):
+        custos = self.carregadas.get('custos')
+        if custos is None:
+            with self.trava_carga:
+                if 'custos' not in self.carregadas:
+                    self.carregadas['custos'] = CustosMaterializados(self.mao_de_obra, self.materia_prima, self.produto)
+                custos = self.carregadas['custos']
+        return custos
+
+    @metricas.instrumentar('RepositorioCompartilhado.sincronizar')
+    def sincronizar(self, nomes=None):
+        # Recarrega só as entidades cujo armazenamento foi alterado fora deste processo. As que
+        # ainda não foram carregadas ficam de fora: o primeiro acesso já lê a versão atual.
+        for nome in nomes if nomes is not None else ENTIDADES:
+            entidade = self.carregadas.get(nome)
+            if entidade is not None:
+                entidade.sincronizar()
+        return self
+
+    def contagem(self, nome):
+        # Total de linhas sem carregar a entidade, quando o armazenamento sabe responder
+        entidade = self.carregadas.get(nome)
+        if entidade is None:
+            with self.trava_carga:
+                if nome not in self.contadores:
+                    esquema = ESQUEMAS[ENTIDADES[nome][1]]
+                    self.contadores[nome] = criar_armazenamento(esquema, esquema.arquivo)
+            total = self.contadores[nome].contar()
+            if total is not None:
+                return total
+            entidade = self._carregar(nome)
+        return len(entidade.data)
+
+    @metricas.instrumentar('RepositorioCompartilhado.busca')
+    def busca(self, entidade, coluna_nome):
+        # Dados e versão do mesmo instantâneo: as posições do índice valem para este DataFrame
+        data, _, versao = entidade.instantaneo
+        trava = self.travas_buscas.setdefault(entidade.file_path, threading.Lock())
+        with trava:
+            atual = self.buscas.get(entidade.file_path)
+        if atual is not None and atual[0] == versao:
+            return atual[1], atual[2]
+        indice = IndiceDeBusca(data[coluna_nome], versao)
+        with trava:
+            # Outra sessão pode ter trocado por um índice mais novo enquanto este era montado
+            atual = self.buscas.get(entidade.file_path)
+            if atual is None or atual[0] < versao:
+                self.buscas[entidade.file_path] = (versao, data, indice)
+        return data, indice
+
+@st.cache_resource
+def repositorio_compartilhado():
+    return RepositorioCompartilhado()
 
 class Aplicativo:
     def __init__(self):
-        self.mao_de_obra = MaoDeObra()
-        self.materia_prima = MateriaPrima()
-        self.imposto = Imposto()
-        self.produto = Produto()
+        # As entidades são carregadas no primeiro acesso; run sincroniza só as que a página usa
+        self.repositorio = repositorio_compartilhado()
+
+    mao_de_obra = property(lambda self: self.repositorio.mao_de_obra)
+    materia_prima = property(lambda self: self.repositorio.materia_prima)
+    imposto = property(lambda self: self.repositorio.imposto)
+    produto = property(lambda self: self.repositorio.produto)
+    custos = property(lambda self: self.repositorio.custos)
+
+    @property
+    def motor(self):
+        return MotorDePrecificacao(self.mao_de_obra, self.materia_prima, self.imposto, self.produto, self.custos)
     
     def run(self):
         st.set_page_config(page_title="Precificação de Venda", page_icon="💰", layout="wide")
@@ -185,56 +785,169 @@ class Aplicativo:
         )
         st.session_state.page = choice
     
-        if st.session_state.page == 'Dashboard':
-            self.dashboard()
-        elif st.session_state.page == 'Mão de Obra':
-            self.gestao_mao_de_obra()
-        elif st.session_state.page == 'Matérias-Primas':
-            self.gestao_materias_primas()
-        elif st.session_state.page == 'Produtos':
-            self.gestao_produtos()
-        elif st.session_state.page == 'Impostos':
-            self.gestao_impostos()
-        elif st.session_state.page == 'Calcular Preço':
-            self.calcular_preco()
+        # Página -> (função, entidades que ela usa). Só essas são sincronizadas; as que ainda não
+        # foram lidas são carregadas quando a página as acessa. Seções opcionais (produtos afetados,
+        # gráficos do Dashboard) sincronizam as próprias entidades quando são abertas
+        paginas = {
+            'Dashboard': (self.dashboard, ()),
+            'Mão de Obra': (self.gestao_mao_de_obra, ('mao_de_obra',)),
+            'Matérias-Primas': (self.gestao_materias_primas, ('materia_prima',)),
+            'Produtos': (self.gestao_produtos, ('mao_de_obra', 'materia_prima', 'produto')),
+            'Impostos': (self.gestao_impostos, ('imposto',)),
+            'Calcular Preço': (self.calcular_preco, ('mao_de_obra', 'materia_prima', 'imposto', 'produto'))
+        }
+        pagina, entidades = paginas[st.session_state.page]
+        with metricas.medir(f'pagina.{st.session_state.page}'):
+            self.repositorio.sincronizar(entidades)
+            pagina()
+        self.painel_performance()
+
+    def painel_performance(self):
+        if metricas.CAMINHO_LOG_AUTOMATICO:
+            metricas.exportar_log()
+        if not st.sidebar.checkbox('Performance', value=False):
+            return
+        with st.sidebar.expander('Performance', expanded=True):
+            # Vale para o processo inteiro, então só é configurável pelo ambiente
+            if not metricas.ATIVO:
+                st.caption('Instrumentação desligada (PRECIFICACAO_METRICAS=0).')
+            st.caption('Tempos inclusivos: a página contém as operações chamadas por ela.')
+            st.markdown('**Esta execução**')
+            st.dataframe(pd.DataFrame(metricas.tabela(metricas.execucao_atual())), hide_index=True)
+            st.markdown('**Acumulado do processo**')
+            st.dataframe(pd.DataFrame(metricas.tabela(metricas.acumulado())), hide_index=True)
+            if st.button('Exportar log'):
+                metricas.exportar_log()
+                st.success(f'Métricas anexadas a {metricas.CAMINHO_LOG}')
+            if st.button('Exportar Prometheus'):
+                metricas.exportar_prometheus()
+                st.success(f'Métricas gravadas em {metricas.CAMINHO_PROMETHEUS}')
     
     def dashboard(self):
         st.header('📊 Dashboard')
         # Exemplo de gráficos e tabelas
         st.subheader('Resumo dos Dados')
         col1, col2, col3 = st.columns(3)
+        # As contagens vêm antes dos gráficos e não exigem carregar as entidades
         with col1:
-            st.metric('Total de Mão de Obra', len(self.mao_de_obra.data))
+            st.metric('Total de Mão de Obra', self.repositorio.contagem('mao_de_obra'))
         with col2:
-            st.metric('Total de Matérias-Primas', len(self.materia_prima.data))
+            st.metric('Total de Matérias-Primas', self.repositorio.contagem('materia_prima'))
         with col3:
-            st.metric('Total de Produtos', len(self.produto.data))
-        
-        # Ajustando para mais colunas
+            st.metric('Total de Produtos', self.repositorio.contagem('produto'))
+
+        # Os gráficos precisam das tabelas completas: só são carregados quando o usuário pede
+        if not st.toggle('Mostrar gráficos e produtos', key='dashboard_graficos'):
+            return
+        self.repositorio.sincronizar(('mao_de_obra', 'materia_prima', 'produto'))
+        itens = st.slider('Itens nos gráficos', min_value=5, max_value=MAXIMO_ITENS_GRAFICO, value=ITENS_GRAFICO)
+
         st.subheader('Custos de Mão de Obra e Matérias-Primas')
         col1, col2 = st.columns(2)
         with col1:
             if not self.mao_de_obra.data.empty:
-                fig_mao = px.bar(self.mao_de_obra.data, x='Nome', y='Custo_Hora', title='Custo por Hora de Mão de Obra')
+                fig_mao = grafico_top(self.mao_de_obra.data, 'Nome', 'Custo_Hora', f'Top {itens} Custos por Hora de Mão de Obra', itens)
+                st.plotly_chart(fig_mao, use_container_width=True)
+                fig_mao = grafico_histograma(self.mao_de_obra.data['Custo_Hora'], 'Distribuição do Custo por Hora', 'Custo_Hora')
                 st.plotly_chart(fig_mao, use_container_width=True)
             else:
                 st.info('Nenhuma Mão de Obra cadastrada.')
         with col2:
             if not self.materia_prima.data.empty:
-                fig_materia = px.bar(self.materia_prima.data, x='Nome', y='Custo_Unidade', title='Custo por Unidade de Matérias-Primas')
+                fig_materia = grafico_top(self.materia_prima.data, 'Nome', 'Custo_Unidade', f'Top {itens} Custos por Unidade de Matérias-Primas', itens)
+                st.plotly_chart(fig_materia, use_container_width=True)
+                fig_materia = grafico_histograma(self.materia_prima.data['Custo_Unidade'], 'Distribuição do Custo por Unidade', 'Custo_Unidade')
                 st.plotly_chart(fig_materia, use_container_width=True)
             else:
                 st.info('Nenhuma Matéria-Prima cadastrada.')
-        
+
+        st.subheader('Custos de Produção')
+        if not self.produto.data.empty:
+            custos = self.custos.tabela()
+            col1, col2 = st.columns(2)
+            with col1:
+                fig_produto = grafico_top(custos, 'Produto', 'Custo_Total', f'Top {itens} Produtos por Custo Total', itens)
+                st.plotly_chart(fig_produto, use_container_width=True)
+            with col2:
+                composicao = pd.DataFrame({
+                    'Categoria': ['Mão de Obra', 'Matérias-Primas'],
+                    'Custo': [custos['Custo_Mao_de_Obra'].sum(), custos['Custo_Materias_Primas'].sum()]
+                })
+                st.plotly_chart(px.pie(composicao, names='Categoria', values='Custo', title='Composição do Custo dos Produtos'),
+                                use_container_width=True)
+            st.plotly_chart(grafico_histograma(custos['Custo_Total'], 'Distribuição do Custo Total dos Produtos', 'Custo_Total'),
+                            use_container_width=True)
+
         st.subheader('Produtos Cadastrados')
         if not self.produto.data.empty:
-            st.dataframe(self.produto.data[['Nome']])
+            tabela_paginada(self.produto.data[['Nome']], 'Nome', 'dashboard_produtos')
         else:
             st.info('Nenhum Produto cadastrado.')
     
+    def importar_arquivo(self, entidade, ajuda):
+        st.markdown(ajuda)
+        arquivo = st.file_uploader('Arquivo CSV ou JSONL', type=['csv', 'jsonl', 'ndjson'], key=f'importar_{entidade.file_path}')
+        if arquivo is not None and st.button('Importar', key=f'botao_importar_{entidade.file_path}'):
+            try:
+                resultado = importar(
+                    entidade,
+                    arquivo,
+                    maos_de_obra=list(self.mao_de_obra.indice),
+                    materias_primas=list(self.materia_prima.indice)
+                )
+            except ValueError as erro:
+                st.error(str(erro))
+                return
+            st.success(f'{resultado.importados} registros importados.')
+            if not resultado.rejeitados.empty:
+                st.warning(f'{len(resultado.rejeitados)} linhas rejeitadas.')
+                st.dataframe(resultado.rejeitados.head(1000))
+                st.download_button('Baixar linhas rejeitadas', resultado.rejeitados.to_csv(index=False),
+                                   file_name='rejeitados.csv', mime='text/csv')
+
+    def mostrar_afetados(self, coluna, nome, chave):
+        # Os custos materializados leem produtos, mãos de obra e matérias-primas: só são carregados
+        # (e sincronizados) quando o usuário pede
+        if not st.toggle('Mostrar produtos afetados', key=f'afetados_{chave}'):
+            return
+        self.repositorio.sincronizar(('mao_de_obra', 'materia_prima', 'produto'))
+        afetados = self.custos.afetados(coluna, nome)
+        st.caption(f'{len(afetados)} produto(s) afetado(s) por esta alteração.')
+        if afetados:
+            with st.expander('Produtos afetados'):
+                st.dataframe(self.custos.tabela(afetados[:500]))
+
+    def buscar(self, entidade, coluna_nome, chave):
+        # Só os melhores resultados vão para o navegador, não a coluna inteira
+        data, indice = self.repositorio.busca(entidade, coluna_nome)
+        consulta = st.text_input('Buscar', key=f'{chave}_busca', placeholder='Digite parte do nome')
+        posicoes = indice.buscar(consulta)
+        if consulta and not len(posicoes):
+            st.caption(f"Nenhum resultado para '{consulta}'.")
+            posicoes = indice.buscar('')
+        return data, posicoes
+
+    def selecionar_registro(self, rotulo, entidade, coluna_nome):
+        # Seleção pelo id estável, para que a remoção de outra linha por outra sessão não desloque
+        # a escolha. Tudo sai do mesmo DataFrame, que as alterações substituem em vez de modificar.
+        data, posicoes = self.buscar(entidade, coluna_nome, f'selecionar_{rotulo}')
+        ids = data['ID'].to_numpy()[posicoes].tolist()
+        nomes = dict(zip(ids, data[coluna_nome].to_numpy()[posicoes]))
+        id_registro = st.selectbox(rotulo, ids, format_func=nomes.get, key=f'selecionar_{rotulo}')
+        return id_registro, data.iloc[posicoes[ids.index(id_registro)]]
+
+    def selecionar_componentes(self, rotulo, entidade, selecionados, chave, excluir=()):
+        # As opções são a seleção atual mais os resultados da busca, então buscar outro nome não
+        # desfaz o que já foi escolhido
+        data, posicoes = self.buscar(entidade, 'Nome', chave)
+        if chave not in st.session_state:
+            st.session_state[chave] = list(selecionados)
+        encontrados = [nome for nome in data['Nome'].to_numpy()[posicoes].tolist() if nome not in excluir]
+        return st.multiselect(rotulo, list(dict.fromkeys(st.session_state[chave] + encontrados)), key=chave)
+
     def gestao_mao_de_obra(self):
         st.header('👷 Gestão de Mão de Obra')
-        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar'])
+        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar', 'Importar'])
 
         with tabs[0]:
             st.subheader('Adicionar Mão de Obra')
@@ -249,29 +962,35 @@ class Aplicativo:
         with tabs[1]:
             st.subheader('Atualizar Mão de Obra')
             if not self.mao_de_obra.data.empty:
-                indices = self.mao_de_obra.data.index.tolist()
-                index = st.selectbox('Selecione a Mão de Obra', indices, format_func=lambda x: self.mao_de_obra.data.iloc[x]['Nome'])
-                nome = st.text_input('Novo Nome', value=self.mao_de_obra.data.iloc[index]['Nome'])
+                id_registro, registro = self.selecionar_registro('Selecione a Mão de Obra', self.mao_de_obra, 'Nome')
+                self.mostrar_afetados('Maos_de_Obra', registro['Nome'], 'atualizar_mao_de_obra')
+                nome = st.text_input('Novo Nome', value=registro['Nome'])
                 custo = st.number_input(
                     'Novo Custo por Hora',
                     min_value=0.0,
                     step=0.01,
-                    value=float(self.mao_de_obra.data.iloc[index]['Custo_Hora'])
+                    value=float(registro['Custo_Hora'])
                 )
                 if st.button('Atualizar'):
-                    self.mao_de_obra.atualizar(index, nome, custo)
-                    st.success('Mão de Obra atualizada com sucesso!')
+                    try:
+                        self.mao_de_obra.atualizar_registro(id_registro, nome, custo)
+                        st.success('Mão de Obra atualizada com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Mão de Obra removida por outra sessão.')
             else:
                 st.info('Nenhuma Mão de Obra cadastrada.')
 
         with tabs[2]:
             st.subheader('Remover Mão de Obra')
             if not self.mao_de_obra.data.empty:
-                indices = self.mao_de_obra.data.index.tolist()
-                index = st.selectbox('Selecione a Mão de Obra para remover', indices, format_func=lambda x: self.mao_de_obra.data.iloc[x]['Nome'])
+                id_registro, registro = self.selecionar_registro('Selecione a Mão de Obra para remover', self.mao_de_obra, 'Nome')
+                self.mostrar_afetados('Maos_de_Obra', registro['Nome'], 'remover_mao_de_obra')
                 if st.button('Remover'):
-                    self.mao_de_obra.remover(index)
-                    st.success('Mão de Obra removida com sucesso!')
+                    try:
+                        self.mao_de_obra.remover_registro(id_registro)
+                        st.success('Mão de Obra removida com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Mão de Obra já removida por outra sessão.')
             else:
                 st.info('Nenhuma Mão de Obra cadastrada.')
 
@@ -279,9 +998,13 @@ class Aplicativo:
             st.subheader('Lista de Mão de Obra')
             self.mao_de_obra.visualizar()
 
+        with tabs[4]:
+            st.subheader('Importar Mão de Obra')
+            self.importar_arquivo(self.mao_de_obra, 'Colunas: `Nome`, `Custo_Hora`.')
+
     def gestao_materias_primas(self):
         st.header('🧱 Gestão de Matérias-Primas')
-        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar'])
+        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar', 'Importar'])
 
         with tabs[0]:
             st.subheader('Adicionar Matéria-Prima')
@@ -296,29 +1019,35 @@ class Aplicativo:
         with tabs[1]:
             st.subheader('Atualizar Matéria-Prima')
             if not self.materia_prima.data.empty:
-                indices = self.materia_prima.data.index.tolist()
-                index = st.selectbox('Selecione a Matéria-Prima', indices, format_func=lambda x: self.materia_prima.data.iloc[x]['Nome'])
-                nome = st.text_input('Novo Nome', value=self.materia_prima.data.iloc[index]['Nome'])
+                id_registro, registro = self.selecionar_registro('Selecione a Matéria-Prima', self.materia_prima, 'Nome')
+                self.mostrar_afetados('Materias_Primas', registro['Nome'], 'atualizar_materia_prima')
+                nome = st.text_input('Novo Nome', value=registro['Nome'])
                 custo = st.number_input(
                     'Novo Custo por Unidade',
                     min_value=0.0,
                     step=0.01,
-                    value=float(self.materia_prima.data.iloc[index]['Custo_Unidade'])
+                    value=float(registro['Custo_Unidade'])
                 )
                 if st.button('Atualizar'):
-                    self.materia_prima.atualizar(index, nome, custo)
-                    st.success('Matéria-Prima atualizada com sucesso!')
+                    try:
+                        self.materia_prima.atualizar_registro(id_registro, nome, custo)
+                        st.success('Matéria-Prima atualizada com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Matéria-Prima removida por outra sessão.')
             else:
                 st.info('Nenhuma Matéria-Prima cadastrada.')
 
         with tabs[2]:
             st.subheader('Remover Matéria-Prima')
             if not self.materia_prima.data.empty:
-                indices = self.materia_prima.data.index.tolist()
-                index = st.selectbox('Selecione a Matéria-Prima para remover', indices, format_func=lambda x: self.materia_prima.data.iloc[x]['Nome'])
+                id_registro, registro = self.selecionar_registro('Selecione a Matéria-Prima para remover', self.materia_prima, 'Nome')
+                self.mostrar_afetados('Materias_Primas', registro['Nome'], 'remover_materia_prima')
                 if st.button('Remover'):
-                    self.materia_prima.remover(index)
-                    st.success('Matéria-Prima removida com sucesso!')
+                    try:
+                        self.materia_prima.remover_registro(id_registro)
+                        st.success('Matéria-Prima removida com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Matéria-Prima já removida por outra sessão.')
             else:
                 st.info('Nenhuma Matéria-Prima cadastrada.')
 
@@ -326,9 +1055,13 @@ class Aplicativo:
             st.subheader('Lista de Matérias-Primas')
             self.materia_prima.visualizar()
 
+        with tabs[4]:
+            st.subheader('Importar Matérias-Primas')
+            self.importar_arquivo(self.materia_prima, 'Colunas: `Nome`, `Custo_Unidade`.')
+
     def gestao_impostos(self):
         st.header('💲 Gestão de Impostos por Estado')
-        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar'])
+        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar', 'Importar'])
 
         with tabs[0]:
             st.subheader('Adicionar Imposto')
@@ -343,29 +1076,33 @@ class Aplicativo:
         with tabs[1]:
             st.subheader('Atualizar Imposto')
             if not self.imposto.data.empty:
-                indices = self.imposto.data.index.tolist()
-                index = st.selectbox('Selecione o Imposto', indices, format_func=lambda x: self.imposto.data.iloc[x]['Estado'])
-                estado = st.text_input('Novo Estado', value=self.imposto.data.iloc[index]['Estado'])
+                id_registro, registro = self.selecionar_registro('Selecione o Imposto', self.imposto, 'Estado')
+                estado = st.text_input('Novo Estado', value=registro['Estado'])
                 percentual = st.number_input(
                     'Novo Percentual de Imposto (%)',
                     min_value=0.0,
                     step=0.01,
-                    value=float(self.imposto.data.iloc[index]['Percentual'])
+                    value=float(registro['Percentual'])
                 )
                 if st.button('Atualizar'):
-                    self.imposto.atualizar(index, estado, percentual)
-                    st.success('Imposto atualizado com sucesso!')
+                    try:
+                        self.imposto.atualizar_registro(id_registro, estado, percentual)
+                        st.success('Imposto atualizado com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Imposto removido por outra sessão.')
             else:
                 st.info('Nenhum Imposto cadastrado.')
 
         with tabs[2]:
             st.subheader('Remover Imposto')
             if not self.imposto.data.empty:
-                indices = self.imposto.data.index.tolist()
-                index = st.selectbox('Selecione o Imposto para remover', indices, format_func=lambda x: self.imposto.data.iloc[x]['Estado'])
+                id_registro, _ = self.selecionar_registro('Selecione o Imposto para remover', self.imposto, 'Estado')
                 if st.button('Remover'):
-                    self.imposto.remover(index)
-                    st.success('Imposto removido com sucesso!')
+                    try:
+                        self.imposto.remover_registro(id_registro)
+                        st.success('Imposto removido com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Imposto já removido por outra sessão.')
             else:
                 st.info('Nenhum Imposto cadastrado.')
 
@@ -373,74 +1110,112 @@ class Aplicativo:
             st.subheader('Lista de Impostos')
             self.imposto.visualizar()
 
+        with tabs[4]:
+            st.subheader('Importar Impostos')
+            self.importar_arquivo(self.imposto, 'Colunas: `Estado`, `Percentual`.')
+
     def gestao_produtos(self):
         st.header('📦 Gestão de Produtos')
-        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar'])
+        tabs = st.tabs(['Adicionar', 'Atualizar', 'Remover', 'Visualizar', 'Importar'])
 
         with tabs[0]:
             st.subheader('Adicionar Produto')
-            with st.form('Adicionar Produto'):
-                nome = st.text_input('Nome do Produto')
-                st.markdown('**Selecionar Mão de Obra Necessária**')
-                maos_de_obra_selecionadas = st.multiselect('Mãos de Obra', self.mao_de_obra.data['Nome'])
-                horas = {}
-                for mao in maos_de_obra_selecionadas:
-                    hora = st.number_input(f'Horas para {mao}', min_value=0.0, step=0.01)
-                    horas[mao] = hora
-                st.markdown('**Selecionar Matérias-Primas Necessárias**')
-                materias_primas_selecionadas = st.multiselect('Matérias-Primas', self.materia_prima.data['Nome'])
-                quantidades = {}
-                for materia in materias_primas_selecionadas:
-                    quantidade = st.number_input(f'Quantidade de {materia}', min_value=0.0, step=0.01)
-                    quantidades[materia] = quantidade
-                submit = st.form_submit_button('Adicionar')
-                if submit:
-                    self.produto.adicionar(nome, horas, quantidades)
+            # Fora de um st.form: a busca e as quantidades dos componentes escolhidos atualizam a cada digitação
+            nome = st.text_input('Nome do Produto', key='adicionar_produto_nome')
+            st.markdown('**Selecionar Mão de Obra Necessária**')
+            maos_de_obra_selecionadas = self.selecionar_componentes('Mãos de Obra', self.mao_de_obra, [], 'adicionar_produto_maos')
+            horas = {}
+            for mao in maos_de_obra_selecionadas:
+                hora = st.number_input(f'Horas para {mao}', min_value=0.0, step=0.01, key=f'adicionar_produto_horas_{mao}')
+                horas[mao] = hora
+            st.markdown('**Selecionar Matérias-Primas Necessárias**')
+            materias_primas_selecionadas = self.selecionar_componentes('Matérias-Primas', self.materia_prima, [],
+                                                                       'adicionar_produto_materias')
+            quantidades = {}
+            for materia in materias_primas_selecionadas:
+                quantidade = st.number_input(f'Quantidade de {materia}', min_value=0.0, step=0.01,
+                                             key=f'adicionar_produto_quantidade_{materia}')
+                quantidades[materia] = quantidade
+            st.markdown('**Selecionar Subprodutos Necessários**')
+            subprodutos_selecionados = self.selecionar_componentes('Subprodutos', self.produto, [], 'adicionar_produto_subprodutos')
+            subprodutos = {}
+            for subproduto in subprodutos_selecionados:
+                subprodutos[subproduto] = st.number_input(f'Unidades de {subproduto}', min_value=0.0, step=0.01,
+                                                          key=f'adicionar_produto_unidades_{subproduto}')
+            if st.button('Adicionar', key='adicionar_produto'):
+                try:
+                    self.produto.adicionar(nome, horas, quantidades, subprodutos)
                     st.success('Produto adicionado com sucesso!')
+                except CicloNaComposicao as erro:
+                    st.error(str(erro))
 
         with tabs[1]:
             st.subheader('Atualizar Produto')
             if not self.produto.data.empty:
-                indices = self.produto.data.index.tolist()
-                index = st.selectbox('Selecione o Produto', indices, format_func=lambda x: self.produto.data.iloc[x]['Nome'])
-                produto = self.produto.data.iloc[index]
-                nome = st.text_input('Novo Nome', value=produto['Nome'])
+                id_registro, produto = self.selecionar_registro('Selecione o Produto', self.produto, 'Nome')
+                produto = self.produto.registro(produto.name)
+                # Chaves por id: ao trocar de produto, as seleções partem da BOM do novo produto
+                chave = f'atualizar_produto_{id_registro}'
+                nome = st.text_input('Novo Nome', value=produto['Nome'], key=f'{chave}_nome')
                 st.markdown('**Atualizar Mão de Obra Necessária**')
-                maos_de_obra_selecionadas = st.multiselect('Mãos de Obra', self.mao_de_obra.data['Nome'], default=list(produto['Maos_de_Obra'].keys()))
+                maos_de_obra_selecionadas = self.selecionar_componentes('Mãos de Obra', self.mao_de_obra, list(produto['Maos_de_Obra']),
+                                                                        f'{chave}_maos')
                 horas = {}
                 for mao in maos_de_obra_selecionadas:
                     hora = st.number_input(
                         f'Horas para {mao}',
                         min_value=0.0,
                         step=0.01,
-                        value=float(produto['Maos_de_Obra'].get(mao, 0))
+                        value=float(produto['Maos_de_Obra'].get(mao, 0)),
+                        key=f'{chave}_horas_{mao}'
                     )
                     horas[mao] = hora
                 st.markdown('**Atualizar Matérias-Primas Necessárias**')
-                materias_primas_selecionadas = st.multiselect('Matérias-Primas', self.materia_prima.data['Nome'], default=list(produto['Materias_Primas'].keys()))
+                materias_primas_selecionadas = self.selecionar_componentes('Matérias-Primas', self.materia_prima,
+                                                                           list(produto['Materias_Primas']), f'{chave}_materias')
                 quantidades = {}
                 for materia in materias_primas_selecionadas:
                     quantidade = st.number_input(
                         f'Quantidade de {materia}',
                         min_value=0.0,
                         step=0.01,
-                        value=float(produto['Materias_Primas'].get(materia, 0))
+                        value=float(produto['Materias_Primas'].get(materia, 0)),
+                        key=f'{chave}_quantidade_{materia}'
                     )
                     quantidades[materia] = quantidade
+                st.markdown('**Atualizar Subprodutos Necessários**')
+                subprodutos_selecionados = self.selecionar_componentes('Subprodutos', self.produto, list(produto['Produtos']),
+                                                                       f'{chave}_subprodutos', excluir={produto['Nome']})
+                subprodutos = {}
+                for subproduto in subprodutos_selecionados:
+                    subprodutos[subproduto] = st.number_input(
+                        f'Unidades de {subproduto}',
+                        min_value=0.0,
+                        step=0.01,
+                        value=float(produto['Produtos'].get(subproduto, 0)),
+                        key=f'{chave}_unidades_{subproduto}'
+                    )
                 if st.button('Atualizar'):
-                    self.produto.atualizar(index, nome, horas, quantidades)
-                    st.success('Produto atualizado com sucesso!')
+                    try:
+                        self.produto.atualizar_registro(id_registro, nome, horas, quantidades, subprodutos)
+                        st.success('Produto atualizado com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Produto removido por outra sessão.')
+                    except CicloNaComposicao as erro:
+                        st.error(str(erro))
             else:
                 st.info('Nenhum Produto cadastrado.')
 
         with tabs[2]:
             st.subheader('Remover Produto')
             if not self.produto.data.empty:
-                indices = self.produto.data.index.tolist()
-                index = st.selectbox('Selecione o Produto para remover', indices, format_func=lambda x: self.produto.data.iloc[x]['Nome'])
+                id_registro, _ = self.selecionar_registro('Selecione o Produto para remover', self.produto, 'Nome')
                 if st.button('Remover'):
-                    self.produto.remover(index)
-                    st.success('Produto removido com sucesso!')
+                    try:
+                        self.produto.remover_registro(id_registro)
+                        st.success('Produto removido com sucesso!')
+                    except RegistroNaoEncontrado:
+                        st.error('Produto já removido por outra sessão.')
             else:
                 st.info('Nenhum Produto cadastrado.')
 
@@ -448,26 +1223,56 @@ class Aplicativo:
             st.subheader('Lista de Produtos')
             self.produto.visualizar()
 
+        with tabs[4]:
+            st.subheader('Importar Produtos')
+            self.importar_arquivo(self.produto, 'CSV com uma linha por componente: `Produto`, `Tipo` (`mao_de_obra`, `materia_prima` ou `produto`), '
+                '`Componente`, `Quantidade`. JSONL com um produto por linha: `Nome`, `Maos_de_Obra`, `Materias_Primas` e, opcionalmente, `Produtos`.')
+
+    def componentes_ausentes(self, index):
+        # Desce pelos subconjuntos consultando cada componente pelo nome: um componente ausente em
+        # qualquer nível deixa o custo indefinido. Devolve as mensagens de RegistroNaoEncontrado
+        consultas = {'Maos_de_Obra': self.mao_de_obra.custo_de, 'Materias_Primas': self.materia_prima.custo_de,
+                     'Produtos': lambda nome: self.produto.indice[nome]}
+        ausentes, vistos, pendentes = [], set(), [index]
+        while pendentes:
+            posicao = pendentes.pop()
+            if posicao in vistos:
+                continue
+            vistos.add(posicao)
+            registro = self.produto.registro(posicao)
+            for coluna, consultar in consultas.items():
+                for nome in registro[coluna]:
+                    try:
+                        resultado = consultar(nome)
+                    except RegistroNaoEncontrado as erro:
+                        ausentes.append(str(erro))
+                        continue
+                    if coluna == 'Produtos':
+                        pendentes.append(resultado)
+        return list(dict.fromkeys(ausentes))
+
     def calcular_preco(self):
         st.header('🧮 Calcular Preço Final do Produto')
         if not self.produto.data.empty:
-            indices = self.produto.data.index.tolist()
-            index_produto = st.selectbox('Selecione o Produto', indices, format_func=lambda x: self.produto.data.iloc[x]['Nome'])
-            produto = self.produto.data.iloc[index_produto]
-
-            # Calcular custo de mão de obra
-            custo_mao_de_obra = 0
-            for mao, horas in produto['Maos_de_Obra'].items():
-                custo_hora = self.mao_de_obra.data[self.mao_de_obra.data['Nome'] == mao]['Custo_Hora'].values[0]
-                custo_mao_de_obra += custo_hora * horas
-
-            # Calcular custo de matérias-primas
-            custo_materias_primas = 0
-            for materia, quantidade in produto['Materias_Primas'].items():
-                custo_unidade = self.materia_prima.data[self.materia_prima.data['Nome'] == materia]['Custo_Unidade'].values[0]
-                custo_materias_primas += custo_unidade * quantidade
-
-            custo_total = custo_mao_de_obra + custo_materias_primas
+            _, produto = self.selecionar_registro('Selecione o Produto', self.produto, 'Nome')
+            index_produto = produto.name
+            # Hoje usa os custos atuais (materializados); outra data consulta o histórico de custos e impostos
+            data_referencia = st.date_input('Data de referência', value=date.today(), max_value=date.today())
+            em = None if data_referencia >= date.today() else instante(data_referencia)
+            custos = self.motor.custos([index_produto], em)
+            custo = custos.iloc[0]
+            custo_mao_de_obra = custo['Custo_Mao_de_Obra']
+            custo_materias_primas = custo['Custo_Materias_Primas']
+            custo_total = custo['Custo_Total']
+            if np.isnan(custo_total):
+                ausentes = self.componentes_ausentes(index_produto)
+                if em is not None:
+                    st.error('O produto tem componentes que não estavam cadastrados nessa data.')
+                elif ausentes:
+                    st.error('Componentes do produto sem cadastro:\n' + '\n'.join(f'- {ausente}' for ausente in ausentes))
+                else:
+                    st.error('O produto faz parte de um ciclo de subprodutos.')
+                return
 
             col1, col2 = st.columns(2)
             with col1:
@@ -480,18 +1285,86 @@ class Aplicativo:
             # Aplicar imposto
             if not self.imposto.data.empty:
                 estado = st.selectbox('Selecione o Estado', self.imposto.data['Estado'])
-                percentual_imposto = self.imposto.data[self.imposto.data['Estado'] == estado]['Percentual'].values[0]
                 # Adicionar porcentagem de lucro
                 percentual_lucro = st.number_input('Porcentagem de Lucro Desejado (%)', min_value=0.0, step=0.01)
-                preco_com_lucro = custo_total * (1 + percentual_lucro / 100)
-                preco_final = preco_com_lucro * (1 + percentual_imposto / 100)
+                preco = self.motor.calcular([estado], [percentual_lucro], custos=custos, em=em).iloc[0]
+                if np.isnan(preco['Percentual_Imposto']):
+                    st.error('O imposto do estado ainda não estava cadastrado nessa data.')
+                    return
+                percentual_imposto = preco['Percentual_Imposto']
+                preco_com_lucro = preco['Preco_com_Lucro']
+                preco_final = preco['Preco_Final']
                 st.subheader(f"Preço Final com Imposto ({percentual_imposto}%): R$ {preco_final:.2f}")
                 st.markdown(f"**Detalhamento:**\n- Preço com Lucro ({percentual_lucro}%): R$ {preco_com_lucro:.2f}\n- Imposto Aplicado: R$ {preco_final - preco_com_lucro:.2f}")
+                self.historico_de_precos(index_produto, estado, percentual_lucro)
+                if em is None:
+                    self.simular_precos(index_produto, percentual_lucro)
             else:
                 st.info('Nenhum Imposto cadastrado. Adicione um imposto para calcular o preço final.')
         else:
             st.info('Nenhum Produto cadastrado.')
 
+    def historico_de_precos(self, index_produto, estado, percentual_lucro):
+        with st.expander('📈 Histórico de Preço'):
+            # O gráfico só é calculado a pedido, não a cada interação com a página
+            with st.form(f'historico_{index_produto}'):
+                periodo = st.date_input('Período', value=(date.today() - timedelta(days=90), date.today()),
+                                        max_value=date.today(), key=f'periodo_{index_produto}')
+                submit = st.form_submit_button('Gerar gráfico')
+            if not submit or len(periodo) != 2:
+                return
+            datas = pd.date_range(periodo[0], periodo[1], freq='D').date
+            historico = pd.DataFrame([
+                {'Data': data, 'Custo_Total': precos['Custo_Total'].iloc[0], 'Preco_Final': precos['Preco_Final'].iloc[0]}
+                for data, precos in self.motor.precos_no_periodo(datas, [estado], [percentual_lucro], [index_produto])
+            ])
+            fig = px.line(historico, x='Data', y=['Custo_Total', 'Preco_Final'], title='Custo e preço final por dia')
+            st.plotly_chart(fig, use_container_width=True)
+
+    def simular_precos(self, index_produto, percentual_lucro):
+        st.subheader('🎲 Simulação de Sensibilidade')
+        produto = self.produto.registro(index_produto)
+        with st.form('Simulação de Sensibilidade'):
+            abrangencia = st.radio('Produtos', ['Produto selecionado', 'Todos os produtos'], horizontal=True)
+            col1, col2 = st.columns(2)
+            with col1:
+                volatilidade_mao_de_obra = st.number_input('Volatilidade da Mão de Obra (%)', min_value=0.0, step=0.5, value=VOLATILIDADE)
+                cenarios = st.number_input('Cenários', min_value=100, max_value=1_000_000, step=1_000, value=CENARIOS)
+            with col2:
+                volatilidade_materias_primas = st.number_input('Volatilidade das Matérias-Primas (%)', min_value=0.0, step=0.5,
+                                                               value=VOLATILIDADE)
+                semente = st.number_input('Semente', min_value=0, step=1, value=0)
+            st.markdown('**Faixas de custo** (opcional; substituem a volatilidade do componente)')
+            faixas = st.data_editor(pd.DataFrame({
+                'Tipo': ['Maos_de_Obra'] * len(produto['Maos_de_Obra']) + ['Materias_Primas'] * len(produto['Materias_Primas']),
+                'Componente': list(produto['Maos_de_Obra']) + list(produto['Materias_Primas']),
+                'Minimo': np.nan,
+                'Maximo': np.nan
+            }), disabled=['Tipo', 'Componente'], hide_index=True, key=f'faixas_{index_produto}')
+            submit = st.form_submit_button('Simular')
+        if submit:
+            faixas = faixas.dropna(subset=['Minimo', 'Maximo'])
+            if (faixas['Minimo'] > faixas['Maximo']).any():
+                st.error('O mínimo de uma faixa não pode ser maior que o máximo.')
+                return
+            st.session_state.simulacao = simular(
+                self.motor,
+                margem=percentual_lucro,
+                indices=[index_produto] if abrangencia == 'Produto selecionado' else None,
+                cenarios=int(cenarios),
+                volatilidade={'Maos_de_Obra': volatilidade_mao_de_obra, 'Materias_Primas': volatilidade_materias_primas},
+                faixas={
+                    tipo: dict(zip(linhas['Componente'], zip(linhas['Minimo'], linhas['Maximo'])))
+                    for tipo, linhas in faixas.groupby('Tipo')
+                },
+                semente=int(semente)
+            )
+        if 'simulacao' in st.session_state:
+            # O resultado fica na sessão para sobreviver à troca de página da tabela
+            colunas = ['Produto', 'Estado', 'Preco_Final'] + [f'Preco_P{percentil:g}' for percentil in PERCENTIS]
+            tabela_paginada(st.session_state.simulacao[colunas].reset_index(drop=True), 'Produto', 'simulacao')
+
 if __name__ == '__main__':
+    metricas.iniciar_execucao()
     app = Aplicativo()
     app.run()
\ No newline at end of file
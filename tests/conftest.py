@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+# Os módulos ficam na raiz do repositório, sem pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def diretorio(tmp_path, monkeypatch):
+    # As entidades usam caminhos relativos ao diretório atual
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, diretorio, monkeypatch):
+    import armazenamento
+    monkeypatch.setattr(armazenamento, 'BACKEND', request.param)
+    monkeypatch.setattr(armazenamento, 'CAMINHO_BANCO', str(diretorio / 'precificacao.db'))
+    return request.param
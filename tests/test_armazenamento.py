@@ -0,0 +1,92 @@
+import json
+import pytest
+from armazenamento import ESQUEMAS, ArmazenamentoJSON, aplicar_alteracao
+
+ESQUEMA = ESQUEMAS['maos_de_obra']
+
+def registros(data):
+    return [(linha['Nome'], float(linha['Custo_Hora']), int(linha['ID'])) for linha in data.to_dict('records')]
+
+def inicial():
+    data = ESQUEMA.vazio()
+    for id_registro, nome, custo_hora in [(1, 'Corte', 10.0), (2, 'Solda', 20.0)]:
+        data = aplicar_alteracao(data, ESQUEMA, 'adicionar', {'id': id_registro, 'nome': nome, 'custo_hora': custo_hora})
+    return data
+
+@pytest.fixture
+def caminho(diretorio):
+    return str(diretorio / 'maos_de_obra.json')
+
+def test_diario_reproduz_as_alteracoes_sobre_o_snapshot(caminho):
+    escritor = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    escritor.salvar(inicial())
+    with open(caminho, 'rb') as arquivo:
+        snapshot = arquivo.read()
+    escritor.registrar('adicionar', {'id': 3, 'nome': 'Pintura', 'custo_hora': 15.5}, None)
+    escritor.registrar('atualizar', {'id': 1, 'nome': 'Corte fino', 'custo_hora': 12.25}, None)
+    escritor.registrar('remover', {'id': 2}, None)
+    with open(caminho, 'rb') as arquivo:
+        assert arquivo.read() == snapshot
+    leitor = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    assert registros(leitor.carregar()) == [('Corte fino', 12.25, 1), ('Pintura', 15.5, 3)]
+
+def test_linha_incompleta_do_diario_e_ignorada(caminho):
+    escritor = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    escritor.salvar(inicial())
+    escritor.registrar('remover', {'id': 1}, None)
+    with open(f'{caminho}.diario', 'a', encoding='utf-8') as arquivo:
+        arquivo.write('{"op":"remover","args":{"id":')
+    assert registros(ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').carregar()) == [('Solda', 20.0, 2)]
+    # O próximo escritor descarta a linha incompleta antes de anexar
+    outro = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    outro.registrar('atualizar', {'id': 2, 'nome': 'Solda', 'custo_hora': 21.0}, None)
+    assert registros(ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').carregar()) == [('Solda', 21.0, 2)]
+
+def test_compactacao_regrava_o_snapshot_e_reinicia_o_diario(caminho):
+    armazenamento_json = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    armazenamento_json.diario.limite_registros = 3
+    data = inicial()
+    armazenamento_json.salvar(data)
+    for id_registro in range(3, 8):
+        argumentos = {'id': id_registro, 'nome': f'Etapa {id_registro}', 'custo_hora': float(id_registro)}
+        data = aplicar_alteracao(data, ESQUEMA, 'adicionar', argumentos)
+        armazenamento_json.registrar('adicionar', argumentos, lambda: data, len(data))
+    # O terceiro registro compactou: o snapshot tem as 5 primeiras linhas e o diário só as seguintes
+    with open(caminho, encoding='utf-8') as arquivo:
+        assert len(json.load(arquivo)) == 5
+    _, alteracoes = armazenamento_json.diario.ler()
+    assert [alteracao['args']['id'] for alteracao in alteracoes] == [6, 7]
+    assert registros(ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').carregar()) == registros(data)
+    assert armazenamento_json.contar() == len(data)
+
+def test_compactacao_interrompida_nao_reaplica_o_diario(caminho):
+    armazenamento_json = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    data = inicial()
+    armazenamento_json.salvar(data)
+    argumentos = {'id': 3, 'nome': 'Pintura', 'custo_hora': 15.5}
+    armazenamento_json.registrar('adicionar', argumentos, None)
+    # Snapshot novo gravado, mas o processo parou antes de reiniciar o diário
+    armazenamento_json.salvar(aplicar_alteracao(data, ESQUEMA, 'adicionar', argumentos))
+    assert registros(ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').carregar()) == [
+        ('Corte', 10.0, 1), ('Solda', 20.0, 2), ('Pintura', 15.5, 3)
+    ]
+
+def test_diario_aceita_separadores_de_linha_unicode_nos_nomes(caminho):
+    escritor = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    escritor.salvar(inicial())
+    escritor.registrar('adicionar', {'id': 3, 'nome': 'Corte\u2028fino\u2029\x85', 'custo_hora': 15.5}, None)
+    escritor.registrar('remover', {'id': 2}, None)
+    outro = ArmazenamentoJSON(ESQUEMA, caminho, modo='diario')
+    assert registros(outro.carregar()) == [('Corte', 10.0, 1), ('Corte\u2028fino\u2029\x85', 15.5, 3)]
+    # O próximo escritor conta os registros do diário sem quebrar a linha do nome
+    outro.registrar('remover', {'id': 1}, None)
+    assert outro.diario.registros == 3
+
+def test_carga_grava_a_contagem_de_uma_loja_sem_gravacoes(caminho):
+    # Arquivo implantado sem passar pelo armazenamento: nenhuma gravação deixou o cache de contar()
+    inicial().to_json(caminho, orient='records')
+    assert ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').contar() is None
+    ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').carregar()
+    assert ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').contar() == 2
+    ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').registrar('remover', {'id': 1}, None)
+    assert ArmazenamentoJSON(ESQUEMA, caminho, modo='diario').contar() is None
@@ -0,0 +1,34 @@
+from busca import IndiceDeBusca
+
+NOMES = ['Molho de Tomate', 'Tomate Seco', 'Açúcar Mascavo', 'Pão de Açúcar', 'Extrato-de-tomate', 'Abacaxi', 'Tomates']
+
+def buscar(consulta, limite=20):
+    return [NOMES[posicao] for posicao in IndiceDeBusca(NOMES).buscar(consulta, limite)]
+
+def test_busca_ordena_por_relevancia():
+    # Nome que começa com a busca, depois palavra que começa com ela, depois nome que a contém
+    assert buscar('tomate') == ['Tomate Seco', 'Tomates', 'Molho de Tomate', 'Extrato-de-tomate']
+    assert buscar('tomate', 2) == ['Tomate Seco', 'Tomates']
+    assert buscar('de tom') == ['Molho de Tomate']
+
+def test_busca_ignora_acentos_e_maiusculas():
+    assert buscar('ACUCAR ') == ['Açúcar Mascavo', 'Pão de Açúcar']
+
+def test_busca_tolera_erro_de_digitacao():
+    assert set(buscar('tomatw')) == {'Molho de Tomate', 'Tomate Seco', 'Extrato-de-tomate', 'Tomates'}
+    assert buscar('xyz') == []
+
+def test_busca_vazia_lista_os_primeiros():
+    assert buscar('', 3) == NOMES[:3]
+
+def test_repositorio_reaproveita_o_indice_ate_a_proxima_gravacao(diretorio):
+    from streamlit_app import RepositorioCompartilhado
+    repositorio = RepositorioCompartilhado()
+    materia_prima = repositorio.materia_prima
+    materia_prima.adicionar('Farinha', 2.0)
+    data, indice = repositorio.busca(materia_prima, 'Nome')
+    assert repositorio.busca(materia_prima, 'Nome')[1] is indice
+    materia_prima.adicionar('Fermento', 5.0)
+    data, novo = repositorio.busca(materia_prima, 'Nome')
+    assert novo is not indice
+    assert data['Nome'].iloc[novo.buscar('ferm')].tolist() == ['Fermento']
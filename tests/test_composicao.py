@@ -0,0 +1,123 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from armazenamento import ESQUEMAS, ArmazenamentoSQLite, consultar_custos
+from composicao import CicloNaComposicao, Composicoes, custos_acumulados, expandir, ligacoes, niveis
+from precificacao import MotorDePrecificacao, Tabela
+
+COLUNAS_BOM = ('Maos_de_Obra', 'Materias_Primas', 'Produtos')
+
+def catalogo_aleatorio(semente, produtos=200):
+    # Subconjuntos só de produtos anteriores (sem ciclos), com alguns componentes e subconjuntos sem cadastro
+    rng = np.random.default_rng(semente)
+    maos_de_obra = pd.DataFrame({'Nome': [f'MO {i}' for i in range(30)], 'Custo_Hora': rng.uniform(5, 50, 30), 'ID': range(1, 31)})
+    materias_primas = pd.DataFrame({'Nome': [f'MP {i}' for i in range(60)], 'Custo_Unidade': rng.uniform(0.1, 20, 60), 'ID': range(1, 61)})
+    linhas = []
+    for i in range(produtos):
+        def bom(prefixo, quantidade, fantasma):
+            nomes = {f'{prefixo} {j}' for j in rng.integers(0, quantidade, rng.integers(0, 5))}
+            if rng.random() < 0.02:
+                nomes.add(fantasma)
+            return {nome: float(rng.uniform(0.1, 4)) for nome in sorted(nomes)}
+        subprodutos = {f'P {j}': float(rng.integers(1, 4)) for j in rng.integers(0, i, rng.integers(0, 3))} if i else {}
+        if rng.random() < 0.01:
+            subprodutos['P inexistente'] = 1.0
+        linhas.append({'Nome': f'P {i}', 'Maos_de_Obra': bom('MO', 30, 'MO inexistente'),
+                       'Materias_Primas': bom('MP', 60, 'MP inexistente'), 'Produtos': subprodutos, 'ID': i + 1})
+    return maos_de_obra, materias_primas, pd.DataFrame(linhas)
+
+def custo_de_referencia(produtos, custos_mao_de_obra, custos_materia_prima):
+    # A fórmula original: soma de quantidade x custo item a item, descendo pelos subconjuntos
+    por_nome = {}
+    for linha in produtos.to_dict('records'):
+        por_nome.setdefault(linha['Nome'], linha)
+    def custo(nome):
+        if nome not in por_nome:
+            return math.nan, math.nan
+        linha = por_nome[nome]
+        mao_de_obra = sum(quantidade * custos_mao_de_obra.get(componente, math.nan) for componente, quantidade in linha['Maos_de_Obra'].items())
+        materias_primas = sum(quantidade * custos_materia_prima.get(componente, math.nan) for componente, quantidade in linha['Materias_Primas'].items())
+        for subproduto, quantidade in linha['Produtos'].items():
+            sub_mao_de_obra, sub_materias_primas = custo(subproduto)
+            mao_de_obra += quantidade * sub_mao_de_obra
+            materias_primas += quantidade * sub_materias_primas
+        return mao_de_obra, materias_primas
+    return np.array([custo(nome) for nome in produtos['Nome']])
+
+def motor(maos_de_obra, materias_primas, produtos):
+    impostos = pd.DataFrame({'Estado': ['SP'], 'Percentual': [18.0], 'ID': [1]})
+    return MotorDePrecificacao(Tabela(maos_de_obra), Tabela(materias_primas), Tabela(impostos), Tabela(produtos, COLUNAS_BOM))
+
+@pytest.mark.parametrize('semente', [1, 2, 3])
+def test_custos_acumulados_iguais_a_formula_original(semente):
+    maos_de_obra, materias_primas, produtos = catalogo_aleatorio(semente)
+    esperado = custo_de_referencia(
+        produtos, dict(zip(maos_de_obra['Nome'], maos_de_obra['Custo_Hora'])),
+        dict(zip(materias_primas['Nome'], materias_primas['Custo_Unidade']))
+    )
+    custos = motor(maos_de_obra, materias_primas, produtos).custos()
+    np.testing.assert_allclose(custos['Custo_Mao_de_Obra'], esperado[:, 0], rtol=1e-12)
+    np.testing.assert_allclose(custos['Custo_Materias_Primas'], esperado[:, 1], rtol=1e-12)
+    assert np.isnan(custos['Custo_Total']).any() and not np.isnan(custos['Custo_Total']).all()
+
+def test_custos_de_poucos_produtos_iguais_aos_do_catalogo():
+    maos_de_obra, materias_primas, produtos = catalogo_aleatorio(4)
+    precificacao = motor(maos_de_obra, materias_primas, produtos)
+    todos = precificacao.custos()
+    indices = [199, 3, 150, 150]
+    # Com data de referência só o fechamento dos produtos pedidos é custeado
+    pd.testing.assert_frame_equal(precificacao.custos(indices, em=1e12), todos.loc[indices])
+
+def test_expandir_da_o_mesmo_custo_que_o_acumulado():
+    maos_de_obra, materias_primas, produtos = catalogo_aleatorio(5)
+    precificacao = motor(maos_de_obra, materias_primas, produtos)
+    boms = precificacao.produto.boms
+    custos = precificacao.custos()
+    expandidas = expandir({'Maos_de_Obra': boms['Maos_de_Obra']}, boms['Produtos'], produtos['Nome'])
+    linhas, codigos, quantidades = expandidas['Maos_de_Obra']
+    unitarios = precificacao._vigentes(precificacao.mao_de_obra, 'Nome', 'Custo_Hora').reindex(boms['Maos_de_Obra'].nomes).to_numpy()
+    esperado = np.bincount(linhas, weights=quantidades * unitarios[codigos], minlength=len(produtos))
+    # Produtos com subconjunto sem cadastro não são expandidos por completo
+    definidos = ~np.isnan(custos['Custo_Total'].to_numpy())
+    np.testing.assert_allclose(esperado[definidos], custos['Custo_Mao_de_Obra'].to_numpy()[definidos], rtol=1e-12)
+
+def test_ciclo_fica_sem_nivel_e_sem_custo():
+    nomes = ['A', 'B', 'C', 'D']
+    subprodutos = Composicoes.de_dicionarios([{'B': 1.0}, {'A': 2.0}, {'A': 1.0}, {}])
+    pais, filhos, _ = ligacoes(subprodutos, nomes)
+    assert niveis(len(nomes), pais, filhos).tolist() == [-1, -1, -1, 0]
+    custos = custos_acumulados({'Maos_de_Obra': np.ones(4)}, subprodutos, nomes)
+    assert np.isnan(custos['Maos_de_Obra'][:3]).all() and custos['Maos_de_Obra'][3] == 1.0
+
+def test_consulta_sql_da_o_mesmo_custo_que_o_motor(diretorio):
+    maos_de_obra, materias_primas, produtos = catalogo_aleatorio(6)
+    # Ciclo, produto que depende dele, nome duplicado (vale o primeiro) e custo de componente duplicado
+    extras = [('X', {'Y': 1.0}), ('Y', {'X': 2.0}), ('Z', {'Y': 1.0, 'P 3': 2.0}), ('P 3', {}), ('W', {'P 3': 2.0, 'P 10': 0.5})]
+    produtos = pd.concat([produtos, pd.DataFrame([
+        {'Nome': nome, 'Maos_de_Obra': {'MO 1': 1.0}, 'Materias_Primas': {}, 'Produtos': subprodutos, 'ID': len(produtos) + i + 1}
+        for i, (nome, subprodutos) in enumerate(extras)
+    ])], ignore_index=True)
+    maos_de_obra = pd.concat([maos_de_obra, pd.DataFrame({'Nome': ['MO 1'], 'Custo_Hora': [999.0], 'ID': [31]})], ignore_index=True)
+    banco = str(diretorio / 'precificacao.db')
+    for esquema, data in [('maos_de_obra', maos_de_obra), ('materias_primas', materias_primas), ('produtos', produtos)]:
+        ArmazenamentoSQLite(ESQUEMAS[esquema], banco).salvar(data)
+    esperado = motor(maos_de_obra, materias_primas, produtos).custos()
+    custos = consultar_custos(ArmazenamentoSQLite(ESQUEMAS['produtos'], banco).conexao)
+    assert custos['Produto'].tolist() == esperado['Produto'].tolist()
+    for coluna in ['Custo_Mao_de_Obra', 'Custo_Materias_Primas', 'Custo_Total']:
+        np.testing.assert_allclose(custos[coluna], esperado[coluna], rtol=1e-12)
+    assert np.isnan(custos['Custo_Total'].iloc[-5:-2]).all() and not np.isnan(custos['Custo_Total'].iloc[-1])
+
+def test_produto_recusa_ciclo(diretorio):
+    from streamlit_app import Produto
+    produto = Produto()
+    produto.adicionar('A', {}, {})
+    produto.adicionar('B', {}, {}, {'A': 1.0})
+    produto.adicionar('C', {}, {}, {'B': 1.0})
+    with pytest.raises(CicloNaComposicao):
+        produto.atualizar(0, 'A', {}, {}, {'C': 1.0})
+    with pytest.raises(CicloNaComposicao):
+        produto.adicionar('D', {}, {}, {'D': 1.0})
+    assert produto.registro(0)['Produtos'] == {}
+    assert Produto().data['Nome'].tolist() == ['A', 'B', 'C']
@@ -0,0 +1,101 @@
+import pytest
+import armazenamento
+
+def test_dois_escritores_nao_perdem_alteracoes(backend):
+    from streamlit_app import MaoDeObra
+    # Duas instâncias fazem o papel de dois processos: cada uma só vê a outra pela assinatura
+    primeiro, segundo = MaoDeObra(), MaoDeObra()
+    primeiro.adicionar('Corte', 10.0)
+    segundo.adicionar('Solda', 20.0)
+    id_solda = int(segundo.data.loc[segundo.data['Nome'] == 'Solda', 'ID'].iloc[0])
+    primeiro.atualizar_registro(id_solda, 'Solda', 25.0)
+    segundo.adicionar('Pintura', 15.0)
+    esperado = [('Corte', 10.0), ('Solda', 25.0), ('Pintura', 15.0)]
+    for entidade in (primeiro, segundo, MaoDeObra()):
+        entidade.confirmar_versao()
+        assert list(zip(entidade.data['Nome'], entidade.data['Custo_Hora'])) == esperado
+
+def test_escritor_desatualizado_nao_altera_linha_removida(backend):
+    from streamlit_app import MaoDeObra, RegistroNaoEncontrado
+    primeiro, segundo = MaoDeObra(), MaoDeObra()
+    primeiro.adicionar('Corte', 10.0)
+    segundo.confirmar_versao()
+    id_corte = int(segundo.data['ID'].iloc[0])
+    primeiro.remover_registro(id_corte)
+    with pytest.raises(RegistroNaoEncontrado):
+        segundo.atualizar_registro(id_corte, 'Corte', 12.0)
+    assert MaoDeObra().data.empty
+
+@pytest.fixture
+def sqlite(diretorio, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'BACKEND', 'sqlite')
+    monkeypatch.setattr(armazenamento, 'CAMINHO_BANCO', str(diretorio / 'precificacao.db'))
+
+def test_sqlite_grava_linha_e_historico_numa_unica_transacao(sqlite, monkeypatch):
+    import threading
+    from streamlit_app import MaoDeObra
+    primeiro, segundo = MaoDeObra(), MaoDeObra()
+    outro_escritor = threading.Thread(target=segundo.adicionar, args=('Solda', 20.0))
+    registrar_historico = primeiro.registrar_historico
+
+    def registrar_e_disputar(registros):
+        # Entre o histórico e a linha, outro escritor tenta gravar: tem de esperar pelo commit
+        registrar_historico(registros)
+        outro_escritor.start()
+        outro_escritor.join(0.5)
+        assert outro_escritor.is_alive()
+
+    monkeypatch.setattr(primeiro, 'registrar_historico', registrar_e_disputar)
+    primeiro.adicionar('Corte', 10.0)
+    outro_escritor.join()
+    # A gravação do outro escritor muda a assinatura: o primeiro recarrega e não a apaga ao regravar
+    primeiro.confirmar_versao()
+    primeiro.save_data()
+    assert list(MaoDeObra().data['Nome']) == ['Corte', 'Solda']
+
+def test_sqlite_renomeia_componente_nas_boms(sqlite):
+    from streamlit_app import Produto, RepositorioCompartilhado
+    repositorio = RepositorioCompartilhado()
+    repositorio.mao_de_obra.adicionar('Corte', 10.0)
+    repositorio.produto.adicionar('Mesa', {'Corte': 2.0}, {})
+    id_corte = int(repositorio.mao_de_obra.data['ID'].iloc[0])
+    # O ouvinte grava os produtos depois do commit da mão de obra, sem esperar pela trava do banco
+    repositorio.mao_de_obra.atualizar_registro(id_corte, 'Corte fino', 12.0)
+    assert Produto().registro(0)['Maos_de_Obra'] == {'Corte fino': 2.0}
+
+def test_leitores_nao_esperam_pelo_escritor(diretorio, monkeypatch):
+    import threading
+    from streamlit_app import RepositorioCompartilhado
+    repositorio = RepositorioCompartilhado()
+    produto = repositorio.produto
+    produto.adicionar('Mesa', {}, {})
+    gravado, liberar = threading.Event(), threading.Event()
+    registrar = produto.armazenamento.registrar
+
+    def registrar_e_parar(*argumentos):
+        # O escritor para com a trava, depois de gravar e antes de atualizar a assinatura
+        registrar(*argumentos)
+        gravado.set()
+        liberar.wait(10)
+
+    monkeypatch.setattr(produto.armazenamento, 'registrar', registrar_e_parar)
+    escritor = threading.Thread(target=produto.adicionar, args=('Cadeira', {}, {}))
+    lidos = []
+
+    def ler():
+        repositorio.sincronizar(['produto'])
+        data, indice = repositorio.busca(produto, 'Nome')
+        lidos.append((list(data['Nome']), produto.registro(0)['Nome']))
+
+    escritor.start()
+    try:
+        assert gravado.wait(10)
+        leitor = threading.Thread(target=ler)
+        leitor.start()
+        leitor.join(2)
+        assert not leitor.is_alive()
+    finally:
+        liberar.set()
+        escritor.join()
+    assert lidos[0][1] == 'Mesa'
+    assert list(produto.data['Nome']) == ['Mesa', 'Cadeira']
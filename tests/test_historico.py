@@ -0,0 +1,39 @@
+import time
+import numpy as np
+from historico import instante
+
+def marcar():
+    # Instante entre duas alterações; as vigências vêm de time.time()
+    time.sleep(0.01)
+    momento = time.time()
+    time.sleep(0.01)
+    return momento
+
+def test_preco_na_data_usa_custos_e_impostos_vigentes(backend):
+    from streamlit_app import Imposto, MaoDeObra, MateriaPrima, Produto
+    from precificacao import MotorDePrecificacao, carregar_motor
+    mao_de_obra, materia_prima, imposto, produto = MaoDeObra(), MateriaPrima(), Imposto(), Produto()
+    mao_de_obra.adicionar('Forno', 10.0)
+    materia_prima.adicionar('Farinha', 2.0)
+    imposto.adicionar('SP', 10.0)
+    produto.adicionar('Pão', {'Forno': 1.0}, {'Farinha': 3.0})
+    inicio = marcar()
+    materia_prima.atualizar(0, 'Farinha', 4.0)
+    imposto.atualizar(0, 'SP', 20.0)
+    depois = marcar()
+    # Linhas removidas continuam valendo para as datas anteriores à remoção
+    mao_de_obra.remover(0)
+    imposto.remover(0)
+    for motor in (MotorDePrecificacao(mao_de_obra, materia_prima, imposto, produto), carregar_motor('.')):
+        assert motor.calcular(['SP'], em=inicio)[['Custo_Total', 'Percentual_Imposto']].values.tolist() == [[16.0, 10.0]]
+        assert motor.calcular(['SP'], em=depois)[['Custo_Total', 'Percentual_Imposto']].values.tolist() == [[22.0, 20.0]]
+        assert np.isnan(motor.calcular(['SP'])[['Custo_Total', 'Percentual_Imposto']].values).all()
+    # Um novo registro com o nome removido não altera o passado
+    mao_de_obra.adicionar('Forno', 99.0)
+    motor = MotorDePrecificacao(mao_de_obra, materia_prima, imposto, produto)
+    assert motor.custos(em=inicio)['Custo_Total'].tolist() == [16.0]
+    assert motor.custos()['Custo_Mao_de_Obra'].tolist() == [99.0]
+
+def test_data_sem_hora_vale_ate_o_fim_do_dia():
+    assert instante('2024-06-30') > instante('2024-06-30T23:59:59')
+    assert instante('2024-06-30') < instante('2024-07-01T00:00:00')
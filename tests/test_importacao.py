@@ -0,0 +1,78 @@
+import io
+import json
+import pytest
+from importacao import importar
+
+@pytest.fixture
+def entidades(diretorio):
+    from streamlit_app import MaoDeObra, MateriaPrima, Produto
+    return MaoDeObra(), MateriaPrima(), Produto()
+
+def jsonl(*linhas):
+    return io.BytesIO('\n'.join(json.dumps(linha) for linha in linhas).encode('utf-8'))
+
+def test_importa_csv_e_rejeita_linhas_invalidas(entidades):
+    mao_de_obra, _, _ = entidades
+    mao_de_obra.adicionar('Corte', 10.0)
+    arquivo = io.BytesIO('Nome,Custo_Hora\nSolda,20\nPintura,abc\nLixa,-1\nCorte,5\n,3\nSolda,21\nMontagem,12.5\n'.encode('utf-8'))
+    resultado = importar(mao_de_obra, arquivo, 'csv')
+    assert resultado.importados == 2
+    assert list(zip(mao_de_obra.data['Nome'], mao_de_obra.data['Custo_Hora'])) == [('Corte', 10.0), ('Solda', 20.0), ('Montagem', 12.5)]
+    # O relatório mostra o valor como veio no arquivo
+    assert resultado.rejeitados[['Linha', 'Motivo', 'Custo_Hora']].values.tolist() == [
+        [2, 'Custo_Hora não numérico', 'abc'],
+        [3, 'Custo_Hora negativo', '-1'],
+        [4, 'Nome já cadastrado', '5'],
+        [5, 'Nome vazio', '3'],
+        [6, 'Nome duplicado no arquivo', '21'],
+    ]
+
+def test_importa_produtos_jsonl_com_boms_ausentes_ou_nulas(entidades):
+    mao_de_obra, materia_prima, produto = entidades
+    mao_de_obra.adicionar('Corte', 10.0)
+    materia_prima.adicionar('Madeira', 3.0)
+    arquivo = jsonl(
+        {'Nome': 'Tampo', 'Maos_de_Obra': {'Corte': 1.0}, 'Materias_Primas': {'Madeira': 2.0}},
+        {'Nome': 'Mesa', 'Maos_de_Obra': {}, 'Materias_Primas': None, 'Produtos': {}},
+        {'Nome': 'Banco', 'Maos_de_Obra': '{"Corte": 0.5}', 'Materias_Primas': '', 'Produtos': None},
+    )
+    resultado = importar(produto, arquivo, 'jsonl', maos_de_obra=['Corte'], materias_primas=['Madeira'])
+    assert resultado.importados == 3 and resultado.rejeitados.empty
+    assert [produto.registro(posicao) | {'ID': None} for posicao in range(3)] == [
+        {'Nome': 'Tampo', 'Maos_de_Obra': {'Corte': 1.0}, 'Materias_Primas': {'Madeira': 2.0}, 'Produtos': {}, 'ID': None},
+        {'Nome': 'Mesa', 'Maos_de_Obra': {}, 'Materias_Primas': {}, 'Produtos': {}, 'ID': None},
+        {'Nome': 'Banco', 'Maos_de_Obra': {'Corte': 0.5}, 'Materias_Primas': {}, 'Produtos': {}, 'ID': None},
+    ]
+
+def test_bom_invalida_rejeita_so_o_produto(entidades):
+    _, _, produto = entidades
+    arquivo = jsonl(
+        {'Nome': 'Quebrado', 'Maos_de_Obra': '{"Corte": ', 'Materias_Primas': {}},
+        {'Nome': 'Lista', 'Maos_de_Obra': {}, 'Materias_Primas': [1, 2]},
+        {'Nome': 'Quantidade', 'Maos_de_Obra': {}, 'Materias_Primas': {}, 'Produtos': {'Tampo': 'muito'}},
+        {'Nome': 'Tampo', 'Maos_de_Obra': {}, 'Materias_Primas': {}},
+    )
+    resultado = importar(produto, arquivo, 'jsonl')
+    assert list(produto.data['Nome']) == ['Tampo']
+    motivos = resultado.rejeitados.groupby('Produto')['Motivo'].agg(set).to_dict()
+    assert motivos == {
+        'Quebrado': {'Maos_de_Obra inválido'},
+        'Lista': {'Materias_Primas inválido'},
+        'Quantidade': {'Quantidade não numérico', 'Produto com linhas rejeitadas'},
+    }
+
+def test_importa_produtos_no_formato_longo(entidades):
+    mao_de_obra, _, produto = entidades
+    mao_de_obra.adicionar('Corte', 10.0)
+    produto.adicionar('Tampo', {'Corte': 1.0}, {})
+    arquivo = io.BytesIO((
+        'Produto,Tipo,Componente,Quantidade\n'
+        'Mesa,mao_de_obra,Corte,2\n'
+        'Mesa,produto,Tampo,1\n'
+        'Cadeira,mao_de_obra,Corte,x\n'
+        'Cadeira,produto,Tampo,1\n'
+    ).encode('utf-8'))
+    resultado = importar(produto, arquivo, 'csv', maos_de_obra=['Corte'])
+    assert resultado.importados == 1
+    assert produto.registro(1)['Maos_de_Obra'] == {'Corte': 2.0} and produto.registro(1)['Produtos'] == {'Tampo': 1.0}
+    assert set(resultado.rejeitados['Produto']) == {'Cadeira'}
@@ -0,0 +1,38 @@
+import random
+import pandas as pd
+import pytest
+from streamlit_app import IndicePorNome, Imposto, MaoDeObra, RegistroNaoEncontrado
+
+def test_indice_acompanha_as_posicoes_do_dataframe():
+    rng = random.Random(7)
+    nomes = [rng.choice('abcdefgh') for _ in range(50)]
+    indice = IndicePorNome('Teste')
+    indice.reconstruir(pd.Series(nomes))
+    for _ in range(500):
+        operacao = rng.random()
+        if operacao < 0.3 or not nomes:
+            novos = [rng.choice('abcdefghij') for _ in range(rng.randint(1, 3))]
+            indice.adicionar_lote(pd.Series(novos))
+            nomes += novos
+        elif operacao < 0.6:
+            posicao = rng.randrange(len(nomes))
+            indice.remover(posicao, nomes.pop(posicao))
+        else:
+            posicao, nome = rng.randrange(len(nomes)), rng.choice('abcdefghij')
+            indice.renomear(posicao, nomes[posicao], nome)
+            nomes[posicao] = nome
+        # Em nomes duplicados vale a primeira ocorrência
+        assert {nome: indice[nome] for nome in indice} == {nome: nomes.index(nome) for nome in set(nomes)}
+
+def test_consultas_pelo_nome(diretorio):
+    mao_de_obra, imposto = MaoDeObra(), Imposto()
+    mao_de_obra.adicionar('Corte', 10.0)
+    mao_de_obra.adicionar('Solda', 20.0)
+    imposto.adicionar('SP', 18.0)
+    mao_de_obra.remover(0)
+    assert mao_de_obra.custo_de('Solda') == 20.0
+    assert imposto.percentual_de('SP') == 18.0
+    with pytest.raises(RegistroNaoEncontrado, match="Mão de Obra 'Corte' não cadastrado"):
+        mao_de_obra.custo_de('Corte')
+    with pytest.raises(RegistroNaoEncontrado, match="Estado 'RJ' não cadastrado"):
+        imposto.percentual_de('RJ')
@@ -0,0 +1,21 @@
+import metricas
+
+def test_prometheus_agrupa_as_amostras_por_familia(diretorio, monkeypatch):
+    monkeypatch.setattr(metricas, '_acumulado', {})
+    metricas.registrar('Produto.adicionar', 0.5)
+    metricas.registrar('Produto.adicionar', 0.25)
+    metricas.registrar('MateriaPrima.remover', 0.125)
+    metricas.exportar_prometheus('metricas.prom')
+    with open('metricas.prom', encoding='utf-8') as arquivo:
+        linhas = arquivo.read().splitlines()
+    familias = []
+    for linha in linhas:
+        familia = linha.split()[2] if linha.startswith('#') else linha.split('{')[0]
+        if not familias or familias[-1] != familia:
+            familias.append(familia)
+    # Cada família aparece uma única vez, com HELP, TYPE e todas as suas amostras em sequência
+    assert familias == [
+        'precificacao_operacao_chamadas_total', 'precificacao_operacao_segundos_total', 'precificacao_operacao_segundos_max'
+    ]
+    assert 'precificacao_operacao_chamadas_total{operacao="Produto.adicionar"} 2' in linhas
+    assert 'precificacao_operacao_segundos_max{operacao="Produto.adicionar"} 0.500000000' in linhas
@@ -0,0 +1,36 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.mark.parametrize('processos', [1, 2])
+def test_lote_da_o_mesmo_preco_que_a_pagina(backend, processos):
+    from streamlit_app import Imposto, MaoDeObra, MateriaPrima, Produto
+    from precificacao import MotorDePrecificacao, precificar_arquivo
+    mao_de_obra, materia_prima, imposto, produto = MaoDeObra(), MateriaPrima(), Imposto(), Produto()
+    mao_de_obra.adicionar('Forno', 12.5)
+    materia_prima.adicionar('Farinha', 2.25)
+    materia_prima.adicionar('Fermento', 7.0)
+    imposto.adicionar('SP', 18.0)
+    imposto.adicionar('RJ', 20.0)
+    produto.adicionar('Massa', {'Forno': 0.5}, {'Farinha': 1.0, 'Fermento': 0.1})
+    produto.adicionar('Pão', {'Forno': 1.0}, {'Farinha': 0.5}, {'Massa': 2.0})
+    produto.adicionar('Bolo', {}, {'Açúcar': 1.0})
+    pedidos = [
+        {'Produto': nome, 'Estado': estado, 'Margem': margem}
+        for nome in ['Massa', 'Pão', 'Bolo'] for estado in ['SP', 'RJ'] for margem in [0.0, 35.0]
+    ] + [{'Produto': 'Torta', 'Estado': 'SP', 'Margem': 10.0}, {'Produto': 'Pão', 'Estado': 'MG', 'Margem': 10.0}]
+    entrada = io.StringIO(''.join(json.dumps(pedido) + '\n' for pedido in pedidos))
+    saida = io.StringIO()
+    assert precificar_arquivo(entrada, saida, processos=processos, tamanho_lote=5) == len(pedidos)
+    resultados = pd.DataFrame([json.loads(linha) for linha in saida.getvalue().splitlines()])
+    esperado = MotorDePrecificacao(mao_de_obra, materia_prima, imposto, produto).calcular(['SP', 'RJ'], [0.0, 35.0])
+    colunas = ['Produto', 'Estado', 'Percentual_Lucro', 'Custo_Total', 'Preco_Final']
+    pd.testing.assert_frame_equal(
+        resultados[colunas].iloc[:12].astype({'Custo_Total': float, 'Preco_Final': float}),
+        esperado[colunas].reset_index(drop=True)
+    )
+    assert resultados['Erro'].iloc[:12].isna().all()
+    assert resultados['Erro'].iloc[12:].tolist() == ['Produto não cadastrado', 'Estado não cadastrado']
+    assert np.isnan(resultados['Custo_Total'].iloc[8:12].astype(float)).all()